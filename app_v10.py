@@ -11,11 +11,60 @@ AI Course Finder – v10 (tightened)
   Engineering, Computer Science, Business, Healthcare, Arts
 """
 
+import array
+import atexit
+import bisect
+import cProfile
+import gc
+import gzip
+import hashlib
+import heapq
 import json
+import math
+import mimetypes
+import mmap
+import multiprocessing
 import os
-from typing import Any, Dict, List, Optional
+import queue
+import random
+import re
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import chain
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
 
-from flask import Flask, render_template, request, session
+from flask import (
+    Flask,
+    Response,
+    g,
+    get_template_attribute,
+    has_request_context,
+    jsonify,
+    request,
+    session,
+    stream_with_context,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional at runtime
+    np = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the json module
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - assets are then served gzip-only
+    zstandard = None
 
 # ---------------------------------------------------------------------------
 # Basic config
@@ -25,19 +74,39 @@ APP_NAME = "AI Course Finder"
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = os.path.join(BASE_DIR, "programs_v7.json")
+# Optional compiled (binary columnar) copy of DATA_PATH; see compile_dataset()
+COMPILED_DATA_SUFFIX = ".cfbin"
 
 SECRET_KEY_ENV = "COURSE_FINDER_V10_SECRET_KEY"
 
+# Ranking engine: "python" (reference loop) or "numpy" (columnar, same output)
+RANKING_ENGINE_ENV = "COURSE_FINDER_V10_RANKING_ENGINE"
+RANKING_ENGINE = os.environ.get(RANKING_ENGINE_ENV, "python").lower()
+
+# Files served under /static/ (see the Static assets section); nothing else
+# in BASE_DIR is reachable over HTTP
+STATIC_ASSETS = ("style_v10.css", "main_v10.js")
+STATIC_URL_PATH = "/static"
+# Fingerprinted URLs never change content, so browsers may keep them for a year
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
 app = Flask(
     __name__,
     template_folder=BASE_DIR,
-    static_folder=BASE_DIR,
-    static_url_path="",
+    static_folder=None,
 )
 app.secret_key = os.environ.get(SECRET_KEY_ENV, "dev-course-finder-v10-change-me")
 
-# Cache for loaded programs
-_program_cache: Optional[List[Dict[str, Any]]] = None
+# Seconds between dataset file checks by the background watcher (0 disables)
+DATA_RELOAD_INTERVAL_ENV = "COURSE_FINDER_V10_RELOAD_INTERVAL"
+try:
+    DATA_RELOAD_INTERVAL = float(os.environ.get(DATA_RELOAD_INTERVAL_ENV, "5"))
+except ValueError:
+    DATA_RELOAD_INTERVAL = 5.0
+
+# Per-stage timing hooks, Server-Timing headers and /metrics ("1" enables)
+METRICS_ENV = "COURSE_FINDER_V10_METRICS"
+METRICS_ENABLED = os.environ.get(METRICS_ENV, "") == "1"
 
 # Domain options
 US_STATES = [
@@ -60,38 +129,209 @@ INTEREST_OPTIONS = [
     "Arts",
 ]
 
+# Cards rendered per page on the Recommendations tab ("Load more" fetches the next)
+RECOMMENDATIONS_PAGE_SIZE = 20
+
+# Template events per chunk when streaming HTML (small: header flushes quickly)
+STREAM_BUFFER_EVENTS = 40
+
+# "Similar programs": neighbors kept per program, snippet vocabulary size, and
+# the largest catalog the feature matrix is built for (float32, n × features)
+SIMILAR_MAX_K = 50
+SIMILAR_DEFAULT_K = 10
+SIMILARITY_TFIDF_TERMS = 256
+SIMILARITY_MAX_PROGRAMS = 200000
+
+# Upper edges of the tuition facet buckets; a bucket holds (previous edge, edge]
+TUITION_FACET_EDGES = (10000, 20000, 30000, 40000, 50000)
+
+# Recommendation cache (per process): max entries and seconds before an entry expires
+RECOMMENDATION_CACHE_SIZE = 512
+RECOMMENDATION_CACHE_TTL = 300.0
+
+# Program details (/api/programs/<id>/details): serialized program records kept
+# per process, and seconds browsers may reuse a details response
+PROGRAM_DETAILS_CACHE_SIZE = 4096
+PROGRAM_DETAILS_CACHE_TTL = 3600.0
+PROGRAM_DETAILS_MAX_AGE = 300
+
+# Result handles for /api/recommendations/<handle>/refine (per process): total
+# bytes of stored score arrays, and seconds before a handle expires
+RESULT_HANDLE_BUDGET_BYTES = 64 * 1024 * 1024
+RESULT_HANDLE_TTL = 900.0
+
 # Weights for ranking (fit score)
 INTEREST_WEIGHT = 70.0
 DEGREE_WEIGHT = 20.0
 LOCATION_WEIGHT = 10.0
 
+# Optional JSON file of ranking experiment arms (weights per arm); re-read when it changes
+EXPERIMENT_PATH_ENV = "COURSE_FINDER_V10_EXPERIMENT"
+EXPERIMENT_PATH = os.environ.get(EXPERIMENT_PATH_ENV) or None
+
+# Opt-in traffic capture: JSONL file that anonymized incoming profiles are
+# appended to (off when unset), for replay_v10.py and evaluate-weights
+CAPTURE_PATH_ENV = "COURSE_FINDER_V10_CAPTURE"
+CAPTURE_PATH = os.environ.get(CAPTURE_PATH_ENV) or None
+# Profiles waiting for the writer thread; beyond this they are dropped, never waited for
+CAPTURE_QUEUE_SIZE = 10000
+# Seconds between appends of queued profiles to the file
+CAPTURE_FLUSH_INTERVAL = 1.0
+
+# Opt-in request profiling: directory that profiles are written to (off when unset)
+PROFILE_DIR_ENV = "COURSE_FINDER_V10_PROFILE_DIR"
+PROFILE_DIR = os.environ.get(PROFILE_DIR_ENV) or None
+# "cprofile" (pstats files) or "sample" (collapsed stacks for flame graph tools)
+PROFILE_MODE_ENV = "COURSE_FINDER_V10_PROFILE_MODE"
+PROFILE_MODE = os.environ.get(PROFILE_MODE_ENV, "cprofile").lower()
+# Share of requests profiled without being asked to (0: only requests sending the token)
+PROFILE_SAMPLE_RATE_ENV = "COURSE_FINDER_V10_PROFILE_SAMPLE_RATE"
+try:
+    PROFILE_SAMPLE_RATE = float(os.environ.get(PROFILE_SAMPLE_RATE_ENV, "0"))
+except ValueError:
+    PROFILE_SAMPLE_RATE = 0.0
+# Header carrying the profiling token: it asks for a profile of its request
+# and opens /debug/profiles. Without a token set, neither is available and
+# only the sample rate selects requests.
+PROFILE_HEADER = "X-Course-Finder-Profile"
+PROFILE_TOKEN_ENV = "COURSE_FINDER_V10_PROFILE_TOKEN"
+PROFILE_TOKEN = os.environ.get(PROFILE_TOKEN_ENV) or None
+# Profiles kept in PROFILE_DIR; older ones are deleted
+PROFILE_RETENTION = 50
+# Seconds between stack samples in "sample" mode
+PROFILE_SAMPLE_INTERVAL = 0.001
+
+# Keyword search ("q"): points added to fit_score for the best BM25 match
+SEARCH_WEIGHT = 50.0
+SEARCH_FIELDS = (
+    "program_name",
+    "institution_name",
+    "program_snippet",
+    "cip_cluster",
+    "city",
+    "state",
+    "delivery_modes",
+)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
 
 # ---------------------------------------------------------------------------
-# Data loading
+# Metrics – in-process histograms, exported as Prometheus text on /metrics
 # ---------------------------------------------------------------------------
+#
+# Every hook is behind `if METRICS_ENABLED`, so a disabled build pays one
+# global lookup per request and allocates nothing.
 
-def load_programs() -> List[Dict[str, Any]]:
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 500, 1000, 5000, 10000, 100000)
+
+# name -> (help text, buckets)
+METRIC_DEFINITIONS: Dict[str, Tuple[str, Tuple[float, ...]]] = {
+    "course_finder_stage_seconds": ("Time spent per pipeline stage.", LATENCY_BUCKETS),
+    "course_finder_eligible_programs": ("Programs passing the hard filters per request.", COUNT_BUCKETS),
+    "course_finder_returned_programs": ("Recommendations returned per request.", COUNT_BUCKETS),
+    "course_finder_dataset_load_seconds": ("Time to read and index the dataset.", LATENCY_BUCKETS),
+}
+
+
+class Histogram:
     """
-    Load demo programs from programs_v7.json.
-    Normalizes some fields for safe downstream use.
+    Fixed-bucket histogram; `counts` has one extra slot for +Inf.
     """
-    global _program_cache
-    if _program_cache is not None:
-        return _program_cache
 
-    programs: List[Dict[str, Any]] = []
+    __slots__ = ("buckets", "counts", "total", "count")
 
-    try:
-        with open(DATA_PATH, "r", encoding="utf-8") as f:
-            raw = json.load(f)
-    except FileNotFoundError:
-        print(f"[WARN] Data file not found: {DATA_PATH}")
-        _program_cache = []
-        return _program_cache
-    except json.JSONDecodeError:
-        print(f"[WARN] Could not decode JSON from: {DATA_PATH}")
-        _program_cache = []
-        return _program_cache
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Thread-safe registry of labelled histograms.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(METRIC_DEFINITIONS[name][1])
+            histogram.observe(value)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition of every histogram.
+        """
+        with self._lock:
+            snapshot = [
+                (name, labels, h.buckets, list(h.counts), h.total, h.count)
+                for (name, labels), h in sorted(self._histograms.items())
+            ]
+
+        lines: List[str] = []
+        seen: Set[str] = set()
+        for name, labels, buckets, counts, total, count in snapshot:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {METRIC_DEFINITIONS[name][0]}")
+                lines.append(f"# TYPE {name} histogram")
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            prefix = label_text + "," if label_text else ""
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else repr(float(bound))
+                lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            suffix = "{" + label_text + "}" if label_text else ""
+            lines.append(f"{name}_sum{suffix} {total!r}")
+            lines.append(f"{name}_count{suffix} {count}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+metrics = Metrics()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    """
+    Feed a stage duration to the histogram and, inside a request, to the
+    Server-Timing header. Callers check METRICS_ENABLED first.
+    """
+    metrics.observe("course_finder_stage_seconds", seconds, stage=stage)
+    if has_request_context():
+        timings = g.setdefault("server_timing", [])
+        timings.append(f"{stage};dur={seconds * 1000.0:.3f}")
+
+
+# ---------------------------------------------------------------------------
+# Data loading
+# ---------------------------------------------------------------------------
+
+class DatasetError(Exception):
+    """Raised when the dataset file cannot be read or decoded."""
+
+
+def normalize_programs(raw: Any) -> List["Program"]:
+    """
+    Normalize decoded JSON into compact, read-only Program records.
+    """
+    programs: List[Program] = []
 
     if not isinstance(raw, list):
         raw = []
@@ -119,502 +359,4979 @@ def load_programs() -> List[Dict[str, Any]]:
             else:
                 p[key] = []
 
-        programs.append(p)
+        programs.append(Program(p))
 
-    _program_cache = programs
-    return _program_cache
+    return programs
 
 
 # ---------------------------------------------------------------------------
-# Scoring helpers (no safety buckets in v10)
+# Program records – shared, immutable rows plus thin per-request views
 # ---------------------------------------------------------------------------
 
-def _selectivity_target_gpa(selectivity_band: Optional[str]) -> float:
+# Dataset fields stored in slots; any other keys are kept in Program.extra
+PROGRAM_FIELDS = (
+    "program_id",
+    "program_name",
+    "institution_name",
+    "degree_level",
+    "state",
+    "city",
+    "annual_tuition",
+    "institution_type",
+    "campus_type",
+    "delivery_modes",
+    "interest_areas",
+    "median_salary_band",
+    "grad_rate",
+    "selectivity_band",
+    "size_category",
+    "urbanicity",
+    "cip_cluster",
+    "program_snippet",
+)
+
+# Shared (never mutated) extras mapping for records without unknown keys
+_NO_EXTRA: Dict[str, Any] = {}
+
+# Shared frozensets of absent field names (most records share one)
+_missing_sets: Dict[frozenset, frozenset] = {}
+
+# Interest area → bit position, shared by every loaded dataset
+_interest_bits: Dict[str, int] = {}
+
+
+def interest_mask(areas: Any) -> int:
     """
-    Map selectivity band to an approximate target GPA.
-    Used only for descriptive academic explanations, not for buckets.
+    Bitmask of interest areas (unknown areas are assigned the next free bit).
     """
-    band = (selectivity_band or "").lower()
-    if band == "highly_selective":
-        return 3.7
-    if band == "selective":
-        return 3.3
-    if band == "moderate":
-        return 2.8
-    # "open" / broad access or unknown
-    return 2.3
+    mask = 0
+    for area in areas:
+        if not isinstance(area, str):
+            continue
+        bit = _interest_bits.get(area)
+        if bit is None:
+            bit = _interest_bits.setdefault(area, len(_interest_bits))
+        mask |= 1 << bit
+    return mask
 
 
-def _build_interests_reason(
-    pref_interests: "set[str]",
-    program_interests: "set[str]",
-) -> str:
-    overlap = pref_interests & program_interests
-    if overlap:
-        return "Matches your interest areas: " + ", ".join(sorted(overlap)) + "."
-    if not pref_interests:
-        return "Offers a broad curriculum suitable for exploring different interests."
-    return "Offers related fields where you may discover new interests."
+def known_interest_mask(areas: Any) -> int:
+    """
+    Bitmask of the already-known areas in `areas`; unknown ones are ignored
+    (they cannot overlap any loaded program).
+    """
+    mask = 0
+    for area in areas:
+        bit = _interest_bits.get(area)
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
 
 
-def _build_academic_reason(
-    gpa: float,
-    selectivity_band: Optional[str],
-) -> str:
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class Program:
     """
-    Provide a descriptive academic fit explanation, without safety/target/reach buckets.
+    One normalized program, shared read-only by every request.
+
+    Fields from PROGRAM_FIELDS are slots (absent ones read as None and are
+    left out of to_dict()); strings are
+    interned and list fields become tuples. `degree_key` (stripped degree
+    level) and `interest_mask` are precomputed for filtering and scoring.
+    Supports p.get(key) / p[key] so it reads like the original dicts.
     """
-    if gpa <= 0 or not selectivity_band:
-        return (
-            "Academic context is based on general patterns; your GPA or the school's "
-            "selectivity band is not fully specified."
-        )
 
-    target_gpa = _selectivity_target_gpa(selectivity_band)
-    delta = gpa - target_gpa
+    __slots__ = PROGRAM_FIELDS + ("extra", "missing", "degree_key", "interest_mask")
 
-    if delta >= 0.3:
-        return (
-            "Your GPA is somewhat above the typical range for this school, which suggests "
-            "a comfortable academic match."
-        )
-    if delta >= -0.2:
-        return (
-            "Your GPA is roughly in line with the typical range for this school, which "
-            "suggests a reasonable academic match."
-        )
-    return (
-        "This school is more academically competitive than your current GPA range. "
-        "It may be more challenging, but could still be worth considering."
-    )
+    def __init__(self, data: Dict[str, Any]):
+        setter = object.__setattr__
+        missing = frozenset(f for f in PROGRAM_FIELDS if f not in data)
+        setter(self, "missing", _missing_sets.setdefault(missing, missing))
+        for field in PROGRAM_FIELDS:
+            value = data.get(field)
+            if isinstance(value, list):
+                value = tuple(_intern(v) for v in value)
+            setter(self, field, _intern(value))
+        extra = {k: v for k, v in data.items() if k not in _PROGRAM_FIELD_SET}
+        setter(self, "extra", extra or _NO_EXTRA)
+        setter(self, "degree_key", _intern((self.degree_level or "").strip()))
+        setter(self, "interest_mask", interest_mask(self.interest_areas or ()))
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("Program records are read-only")
 
-def _build_practical_reason(
-    home_state: Optional[str],
-    program_state: Optional[str],
-    max_tuition: Optional[float],
-    program_tuition: Optional[float],
-) -> str:
-    parts: List[str] = []
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for names that are not slots: dataset-specific extras
+        try:
+            return object.__getattribute__(self, "extra")[name]
+        except KeyError:
+            raise AttributeError(name)
 
-    if home_state and program_state:
-        if program_state == home_state:
-            parts.append(
-                "Located in your home state, which may make it more convenient and potentially more affordable."
-            )
-        else:
-            parts.append(
-                f"Located in {program_state}, outside your home state of {home_state}."
-            )
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _PROGRAM_FIELD_SET:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.extra.get(key, default)
 
-    if isinstance(max_tuition, (int, float)) and max_tuition > 0:
-        if isinstance(program_tuition, (int, float)):
-            if program_tuition <= max_tuition:
-                parts.append(
-                    f"Estimated tuition (~${program_tuition:,.0f} per year) fits within your comfortable range."
-                )
-            else:
-                parts.append(
-                    f"Estimated tuition (~${program_tuition:,.0f} per year) is above your stated comfort level."
-                )
-        else:
-            parts.append(
-                "Tuition information is not available for this program, so we cannot compare it to your budget."
-            )
+    def __getitem__(self, key: str) -> Any:
+        if key in _PROGRAM_FIELD_SET:
+            return getattr(self, key)
+        return self.extra[key]
 
-    if not parts:
-        return "A practical option to explore based on your broad preferences."
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Plain dict copy (tuples back to lists) for serialization.
+        """
+        out: Dict[str, Any] = {}
+        for field in PROGRAM_FIELDS:
+            if field in self.missing:
+                continue
+            value = getattr(self, field)
+            out[field] = list(value) if isinstance(value, tuple) else value
+        out.update(self.extra)
+        return out
 
-    return " ".join(parts)
+    def __repr__(self) -> str:
+        return f"Program({self.program_id!r})"
 
 
-# ---------------------------------------------------------------------------
-# v10 Filtering logic – strict adherence to user preferences
-# ---------------------------------------------------------------------------
+_PROGRAM_FIELD_SET = frozenset(PROGRAM_FIELDS)
 
-def filter_programs_for_profile(
-    profile: Dict[str, Any],
-    programs: List[Dict[str, Any]],
-) -> List[Dict[str, Any]]:
+# Per-request values computed for each recommended program
+RECOMMENDATION_FIELDS = (
+    "interest_score_component",
+    "degree_score_component",
+    "location_score_component",
+    "raw_total",
+    "fit_score",
+    "search_score_component",
+    "why_interests",
+    "why_academic",
+    "why_practical",
+)
+
+
+class Recommendation:
     """
-    Apply hard filters based directly on Tab 1 preferences.
+    Thin per-request view: the shared Program plus computed scores and
+    explanations. Program fields read through, so templates keep using
+    p.program_name, p.fit_score, p.why_interests, ...
 
-    Hard constraints:
-      - At least one interest area selected: program must intersect with those.
-      - At least one degree level selected: program.degree_level must be one of them.
-      - If max_tuition > 0:
-          - program must have numeric tuition
-          - tuition must be <= max_tuition.
-      - If location_pref == "instate" and home_state provided:
-          program.state must equal home_state.
+    why_* texts are produced lazily by the attached Explainer the first time
+    they are read, so cards that are never rendered cost nothing.
     """
-    degree_pref = set(profile.get("degree_levels") or [])
-    interests_pref = set(profile.get("interest_areas") or [])
-    home_state = profile.get("home_state") or None
 
-    max_tuition = profile.get("max_tuition")
-    if isinstance(max_tuition, (int, float)) and max_tuition <= 0:
-        max_tuition = None
+    __slots__ = (
+        "program",
+        "interest_score_component",
+        "degree_score_component",
+        "location_score_component",
+        "raw_total",
+        "fit_score",
+        "search_score_component",
+        "explainer",
+        "_why_interests",
+        "_why_academic",
+        "_why_practical",
+    )
 
-    location_pref = (profile.get("location_pref") or "").lower()
+    def __init__(
+        self,
+        program: Program,
+        interest_score_component: float = 0.0,
+        degree_score_component: float = 0.0,
+        location_score_component: float = 0.0,
+        raw_total: float = 0.0,
+        fit_score: int = 0,
+        search_score_component: Optional[float] = None,
+    ):
+        self.program = program
+        self.interest_score_component = interest_score_component
+        self.degree_score_component = degree_score_component
+        self.location_score_component = location_score_component
+        self.raw_total = raw_total
+        self.fit_score = fit_score
+        self.search_score_component = search_score_component
+        self.explainer: Optional["Explainer"] = None
+        self._why_interests: Optional[str] = None
+        self._why_academic: Optional[str] = None
+        self._why_practical: Optional[str] = None
 
-    eligible: List[Dict[str, Any]] = []
+    @property
+    def why_interests(self) -> Optional[str]:
+        if self._why_interests is None and self.explainer is not None:
+            self._why_interests = self.explainer.interests(self.program)
+        return self._why_interests
 
-    for p in programs:
-        # Degree level match
-        p_degree = (p.get("degree_level") or "").strip()
-        if degree_pref and p_degree not in degree_pref:
-            continue
+    @property
+    def why_academic(self) -> Optional[str]:
+        if self._why_academic is None and self.explainer is not None:
+            self._why_academic = self.explainer.academic(self.program)
+        return self._why_academic
 
-        # Interest areas match (intersection must be non-empty)
-        p_interests = set(p.get("interest_areas") or [])
-        if interests_pref and not (p_interests & interests_pref):
-            continue
+    @property
+    def why_practical(self) -> Optional[str]:
+        if self._why_practical is None and self.explainer is not None:
+            self._why_practical = self.explainer.practical(self.program)
+        return self._why_practical
 
-        # Max tuition constraint (if user specified)
-        tuition = p.get("annual_tuition")
-        if isinstance(max_tuition, (int, float)) and max_tuition > 0:
-            # For exact adherence: if tuition is unknown, we cannot assert it is <= max → exclude
-            if not isinstance(tuition, (int, float)):
-                continue
-            if tuition > max_tuition:
-                continue
+    def __getattr__(self, name: str) -> Any:
+        # Only reached for names that are not slots: read through to the program
+        return getattr(self.program, name)
 
-        # Location preference
-        p_state = p.get("state") or None
-        if location_pref == "instate" and home_state:
-            if not p_state or p_state != home_state:
-                continue
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in _RECOMMENDATION_FIELD_SET:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.program.get(key, default)
 
-        eligible.append(p)
+    def __getitem__(self, key: str) -> Any:
+        if key in _RECOMMENDATION_FIELD_SET:
+            return getattr(self, key)
+        return self.program[key]
 
-    return eligible
+    def to_dict(self) -> Dict[str, Any]:
+        out = self.program.to_dict()
+        for field in RECOMMENDATION_FIELDS:
+            value = getattr(self, field)
+            if value is not None:
+                out[field] = value
+        return out
 
+    def __repr__(self) -> str:
+        return f"Recommendation({self.program.program_id!r}, fit_score={self.fit_score})"
 
-# ---------------------------------------------------------------------------
-# v10 Ranking logic – simple fit score for ordering (no safety buckets)
-# ---------------------------------------------------------------------------
 
-def rank_programs(
-    profile: Dict[str, Any],
-    programs: List[Dict[str, Any]],
-) -> List[Dict[str, Any]]:
+_RECOMMENDATION_FIELD_SET = frozenset(RECOMMENDATION_FIELDS)
+
+
+@dataclass(frozen=True, eq=False)
+class ProgramSnapshot:
     """
-    Compute a fit_score used only for ordering, not for eligibility.
+    One immutable load of the dataset plus everything derived from it.
 
-    Components:
-      - Interest overlap (up to INTEREST_WEIGHT)
-      - Degree match (up to DEGREE_WEIGHT)
-      - Location preference alignment (up to LOCATION_WEIGHT)
+    Requests take a snapshot once and use it throughout, so a reload that
+    swaps in a newer version never changes data under an in-flight request.
+    Its Program records are read-only and shared by every request.
     """
-    interests_pref = set(profile.get("interest_areas") or [])
-    degree_pref = set(profile.get("degree_levels") or [])
-    home_state = profile.get("home_state") or None
-    location_pref = (profile.get("location_pref") or "").lower()
 
-    ranked: List[Dict[str, Any]] = []
+    version: int
+    programs: List[Program]
+    index: "ProgramIndex"
+    columns: Optional["ProgramColumns"]
+    source_mtime: Optional[float] = None
+    source_hash: Optional[str] = None
+    similarity: Optional["SimilarityIndex"] = None
 
-    for p in programs:
-        p_interests = set(p.get("interest_areas") or [])
-        p_degree = (p.get("degree_level") or "").strip()
-        p_state = p.get("state") or None
+    @classmethod
+    def build(
+        cls,
+        programs: List[Program],
+        version: int,
+        source_mtime: Optional[float] = None,
+        source_hash: Optional[str] = None,
+    ) -> "ProgramSnapshot":
+        return cls(
+            version=version,
+            programs=programs,
+            index=ProgramIndex(programs),
+            columns=ProgramColumns(programs) if np is not None else None,
+            source_mtime=source_mtime,
+            source_hash=source_hash,
+            similarity=(
+                SimilarityIndex(programs)
+                if np is not None and 0 < len(programs) <= SIMILARITY_MAX_PROGRAMS
+                else None
+            ),
+        )
 
-        # Interest component
-        overlap = interests_pref & p_interests
-        if interests_pref:
-            ratio = len(overlap) / len(interests_pref)
-            interest_score = INTEREST_WEIGHT * ratio
-        else:
-            interest_score = 0.0
 
-        # Degree component
-        degree_score = DEGREE_WEIGHT if p_degree in degree_pref else 0.0
+_snapshot: Optional[ProgramSnapshot] = None
+_snapshot_lock = threading.Lock()
+_watcher_pid: Optional[int] = None
+# Last dataset mtime reload_programs() examined (avoids re-parsing a bad file)
+_checked_mtime: Optional[float] = None
 
-        # Location component
-        location_score = 0.0
-        if not location_pref:
-            # Slight default preference score
-            location_score = LOCATION_WEIGHT / 2
-        elif location_pref == "instate":
-            # Already filtered to in-state; give full score
-            location_score = LOCATION_WEIGHT
-        else:
-            if home_state and p_state:
-                location_score = (
-                    LOCATION_WEIGHT
-                    if p_state == home_state
-                    else LOCATION_WEIGHT * 0.6
-                )
-            else:
-                location_score = LOCATION_WEIGHT * 0.6
 
-        raw_total = interest_score + degree_score + location_score
+def _read_dataset(path: str) -> Tuple[List[Program], float, str]:
+    """
+    Read, decode and normalize the dataset file.
+    Returns (programs, mtime, sha256 of the JSON bytes); raises DatasetError.
 
-        enriched = dict(p)
-        enriched.update(
-            {
-                "interest_score_component": round(interest_score, 1),
-                "degree_score_component": round(degree_score, 1),
-                "location_score_component": round(location_score, 1),
-                "raw_total": raw_total,
-            }
-        )
-        ranked.append(enriched)
+    A compiled copy (see compile_dataset) built from the same JSON content
+    is memory-mapped instead of parsing the JSON; a stale or unreadable
+    compiled file is ignored.
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        raise DatasetError(f"Data file not found: {path}")
+    except OSError as exc:
+        raise DatasetError(f"Could not read {path}: {exc}")
 
-    if not ranked:
-        return []
+    digest = hashlib.sha256(data).hexdigest()
 
-    max_raw = max(p["raw_total"] for p in ranked) or 1.0
+    compiled = compiled_path_for(path)
+    if os.path.exists(compiled):
+        try:
+            return read_compiled_dataset(compiled, expected_hash=digest), mtime, digest
+        except DatasetError as exc:
+            print(f"[WARN] {exc}; loading {path} instead")
 
-    for p in ranked:
-        p["fit_score"] = int(round((p["raw_total"] / max_raw) * 100))
+    try:
+        raw = json.loads(data.decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise DatasetError(f"Could not decode JSON from: {path}")
 
-    # Sort by fit descending, then tuition ascending, then program name
-    def _sort_key(x: Dict[str, Any]):
-        tuition_val = x.get("annual_tuition")
-        try:
-            tuition_sort = (
-                float(tuition_val)
-                if tuition_val not in (None, "")
-                else float("inf")
-            )
-        except (TypeError, ValueError):
-            tuition_sort = float("inf")
-        return (-x["fit_score"], tuition_sort, x.get("program_name") or "")
+    return normalize_programs(raw), mtime, digest
 
-    ranked.sort(key=_sort_key)
-    return ranked
 
+def _install_snapshot(snapshot: ProgramSnapshot) -> None:
+    global _snapshot
+    _snapshot = snapshot
+    recommendation_cache.clear()
+    program_json_cache.clear()
+    result_handles.clear()
 
-def build_explanations(
-    profile: Dict[str, Any],
-    programs: List[Dict[str, Any]],
-) -> List[Dict[str, Any]]:
+
+def get_snapshot() -> ProgramSnapshot:
     """
-    Attach human-readable 'why' explanations to each ranked program.
+    Return the current dataset snapshot, loading it on first use.
+
+    The first load is single-flight: concurrent callers wait for one parse.
+    If it fails, an empty snapshot is served until a reload succeeds.
     """
-    interests_pref = set(profile.get("interest_areas") or [])
-    home_state = profile.get("home_state") or None
-    max_tuition = profile.get("max_tuition")
+    snapshot = _load_snapshot()
 
-    try:
-        gpa = float(profile.get("gpa") or 0.0)
-    except (TypeError, ValueError):
-        gpa = 0.0
+    if DATA_RELOAD_INTERVAL > 0 and _watcher_pid != os.getpid():
+        start_dataset_watcher()
 
-    enriched: List[Dict[str, Any]] = []
+    return snapshot
 
-    for p in programs:
-        p_interests = set(p.get("interest_areas") or [])
-        p_state = p.get("state") or None
-        p_tuition = p.get("annual_tuition")
-        p_selectivity = p.get("selectivity_band")
 
-        p_copy = dict(p)
-        p_copy["why_interests"] = _build_interests_reason(
-            interests_pref, p_interests
-        )
-        p_copy["why_academic"] = _build_academic_reason(
-            gpa, p_selectivity
-        )
-        p_copy["why_practical"] = _build_practical_reason(
-            home_state, p_state, max_tuition, p_tuition
-        )
-        enriched.append(p_copy)
+def _load_snapshot() -> ProgramSnapshot:
+    # get_snapshot() without starting the watcher thread
+    snapshot = _snapshot
+    if snapshot is None:
+        with _snapshot_lock:
+            snapshot = _snapshot
+            if snapshot is None:
+                started = time.perf_counter()
+                try:
+                    programs, mtime, digest = _read_dataset(DATA_PATH)
+                except DatasetError as exc:
+                    print(f"[WARN] {exc}")
+                    programs, mtime, digest = [], None, None
+                snapshot = ProgramSnapshot.build(programs, 1, mtime, digest)
+                _install_snapshot(snapshot)
+                if METRICS_ENABLED:
+                    metrics.observe("course_finder_dataset_load_seconds", time.perf_counter() - started)
+    return snapshot
 
-    return enriched
+
+def reload_programs(force: bool = False) -> bool:
+    """
+    Rebuild and swap in a new snapshot if the dataset file changed.
+
+    A change is detected by mtime, then confirmed by content hash. If the new
+    file is missing or malformed, the last good snapshot keeps serving.
+    Returns True when a new snapshot was installed.
+    """
+    global _checked_mtime
+    current = _load_snapshot()
+
+    try:
+        mtime = os.stat(DATA_PATH).st_mtime
+    except OSError:
+        return False
+    if not force and mtime in (current.source_mtime, _checked_mtime):
+        return False
+    _checked_mtime = mtime
+
+    started = time.perf_counter()
+    try:
+        programs, mtime, digest = _read_dataset(DATA_PATH)
+    except DatasetError as exc:
+        print(f"[WARN] {exc}; keeping dataset version {current.version}")
+        return False
+
+    with _snapshot_lock:
+        current = _snapshot or current
+        if not force and digest == current.source_hash:
+            # Touched but unchanged
+            return False
+        _install_snapshot(
+            ProgramSnapshot.build(programs, current.version + 1, mtime, digest)
+        )
+
+    if METRICS_ENABLED:
+        metrics.observe("course_finder_dataset_load_seconds", time.perf_counter() - started)
+    print(f"[INFO] Loaded dataset version {_snapshot.version} ({len(programs)} programs)")
+    return True
+
+
+def _watch_dataset(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            reload_programs()
+        except Exception as exc:  # keep watching; never take the worker down
+            print(f"[WARN] Dataset reload failed: {exc}")
+
+
+def start_dataset_watcher(interval: Optional[float] = None) -> None:
+    """
+    Start the background thread that polls the dataset file for changes.
+    Safe to call repeatedly; restarts itself in forked worker processes.
+    """
+    global _watcher_pid
+    interval = DATA_RELOAD_INTERVAL if interval is None else interval
+    if interval <= 0:
+        return
+
+    with _snapshot_lock:
+        if _watcher_pid == os.getpid():
+            return
+        _watcher_pid = os.getpid()
+
+    thread = threading.Thread(
+        target=_watch_dataset,
+        args=(interval,),
+        name="dataset-watcher",
+        daemon=True,
+    )
+    thread.start()
+
+
+def preload_dataset() -> ProgramSnapshot:
+    """
+    Load the dataset in a pre-fork server's master process, so forked
+    workers inherit the snapshot instead of each parsing their own copy.
+
+    Call it once per master generation (gunicorn's when_ready, and
+    on_reload after a SIGHUP, when it first picks up a changed dataset
+    file), not per fork. Everything alive is then moved out of the garbage
+    collector's reach (gc.freeze), so collections in the workers never
+    write to the shared pages and copy them. No watcher thread is started here: threads
+    do not survive fork, and each worker starts its own on first use.
+    See gunicorn_v10.conf.py.
+    """
+    if _snapshot is not None:
+        reload_programs()
+    snapshot = _load_snapshot()
+    gc.collect()
+    gc.freeze()
+    return snapshot
+
+
+def load_programs() -> List[Program]:
+    """
+    Return the normalized programs of the current dataset snapshot.
+    """
+    return get_snapshot().programs
+
+
+def get_program_index() -> "ProgramIndex":
+    """
+    Return the filter index for the current dataset snapshot.
+    """
+    return get_snapshot().index
+
+
+def get_program_columns() -> Optional["ProgramColumns"]:
+    """
+    Return the numpy columns for the current dataset snapshot, or None
+    without numpy.
+    """
+    return get_snapshot().columns
 
 
 # ---------------------------------------------------------------------------
-# Profile builder (form → profile dict) and summaries
+# Compiled dataset – versioned binary columnar file, memory-mapped on load
 # ---------------------------------------------------------------------------
+#
+# Layout: MAGIC, u32 format version, u32 header length, JSON header, then
+# 8-byte aligned sections referenced from the header as [offset, length]:
+#
+#   strings   u64 offsets (count + 1) into a UTF-8 blob; every string value
+#             and JSON-encoded odd value is stored once
+#   fields    per PROGRAM_FIELDS entry: u8 flags (0 absent, 1 null, 2 value)
+#             and a fixed-width value column: i32 string codes ("str"),
+#             i64 ("int"), f64 ("float") or i32 codes of JSON text ("json")
+#   lists     interest_areas / delivery_modes: u64 bitmask over a per-file
+#             vocabulary, plus explicit i32 codes for lists a mask cannot
+#             reproduce (duplicates or non-vocabulary order)
+#   extras    i32 code of the JSON object of non-PROGRAM_FIELDS keys (-1 none)
 
-def build_profile_from_form(form) -> Dict[str, Any]:
+COMPILED_MAGIC = b"CFPROGS\x00"
+COMPILED_FORMAT_VERSION = 1
+_LIST_FIELDS = ("interest_areas", "delivery_modes")
+
+
+def compiled_path_for(json_path: str) -> str:
+    return os.path.splitext(json_path)[0] + COMPILED_DATA_SUFFIX
+
+
+class _StringTable:
+    def __init__(self) -> None:
+        self.codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.codes)
+        return code
+
+
+def _field_kind(values: List[Any]) -> str:
+    present = [v for v in values if v is not None]
+    if all(isinstance(v, str) for v in present):
+        return "str"
+    if all(type(v) is int for v in present):
+        return "int"
+    if all(type(v) is float for v in present):
+        return "float"
+    return "json"
+
+
+def compile_dataset(json_path: str, out_path: Optional[str] = None) -> str:
     """
-    Convert incoming form fields into a normalized profile dict (v10).
+    Compile a JSON dataset into the binary columnar format.
+    The output round-trips to exactly the records normalize_programs builds.
     """
-    get = form.get
-    getlist = form.getlist
+    out_path = out_path or compiled_path_for(json_path)
 
-    role = get("role") or ""
-    current_status = get("current_status") or ""
-    home_state = get("home_state") or ""
-    gpa_raw = get("gpa") or ""
+    with open(json_path, "rb") as f:
+        data = f.read()
+    records = [p.to_dict() for p in normalize_programs(json.loads(data.decode("utf-8")))]
+    n = len(records)
 
-    try:
-        gpa = float(gpa_raw) if gpa_raw != "" else 0.0
-    except (TypeError, ValueError):
-        gpa = 0.0
+    strings = _StringTable()
+    sections: List[Tuple[str, bytes]] = []
+    header: Dict[str, Any] = {
+        "count": n,
+        "source_hash": hashlib.sha256(data).hexdigest(),
+        "byteorder": sys.byteorder,
+        "fields": {},
+        "lists": {},
+    }
 
-    degree_levels = [v for v in getlist("degree_levels") if v]
-    interest_areas = [v for v in getlist("interest_areas") if v]
+    def add(name: str, arr: "array.array") -> str:
+        sections.append((name, arr.tobytes()))
+        return name
 
-    max_tuition_raw = get("max_tuition") or ""
-    sat_raw = get("sat_score") or ""
-    act_raw = get("act_score") or ""
-    location_pref = get("location_pref") or ""
+    for field in PROGRAM_FIELDS:
+        if field in _LIST_FIELDS:
+            continue
+        values = [r.get(field) for r in records]
+        flags = array.array("B", (0 if field not in r else 1 if r[field] is None else 2 for r in records))
+        kind = _field_kind(values)
+        if kind == "str":
+            column = array.array("i", (-1 if v is None else strings.code(v) for v in values))
+        elif kind == "int":
+            column = array.array("q", (0 if v is None else v for v in values))
+        elif kind == "float":
+            column = array.array("d", (0.0 if v is None else v for v in values))
+        else:
+            column = array.array(
+                "i", (-1 if v is None else strings.code(json.dumps(v)) for v in values)
+            )
+        header["fields"][field] = {
+            "kind": kind,
+            "flags": add(f"{field}.flags", flags),
+            "values": add(f"{field}.values", column),
+        }
 
-    try:
-        max_tuition = float(max_tuition_raw) if max_tuition_raw != "" else None
-    except (TypeError, ValueError):
-        max_tuition = None
+    for field in _LIST_FIELDS:
+        vocab: Dict[str, int] = {}
+        masks = array.array("Q")
+        offsets = array.array("Q", [0])
+        codes = array.array("i")
+        flags = array.array("B")
+        for r in records:
+            flags.append(0 if field not in r else 1 if r[field] is None else 2)
+            items = r.get(field) or []
+            if not all(isinstance(v, str) for v in items):
+                raise DatasetError(f"{field} holds non-string values; cannot compile")
+            for v in items:
+                if v not in vocab and len(vocab) < 64:
+                    vocab[v] = len(vocab)
+            bits = [vocab.get(v) for v in items]
+            mask = 0
+            if None not in bits and bits == sorted(set(bits)):
+                for bit in bits:
+                    mask |= 1 << bit
+                masks.append(mask)
+            else:
+                # Not expressible as a mask: keep the exact list
+                masks.append(0)
+                codes.extend(strings.code(v) for v in items)
+            offsets.append(len(codes))
+        header["lists"][field] = {
+            "vocab": [strings.code(v) for v in vocab],
+            "flags": add(f"{field}.flags", flags),
+            "masks": add(f"{field}.masks", masks),
+            "offsets": add(f"{field}.offsets", offsets),
+            "codes": add(f"{field}.codes", codes),
+        }
+
+    extras = array.array("i")
+    for r in records:
+        extra = {k: v for k, v in r.items() if k not in _PROGRAM_FIELD_SET}
+        extras.append(strings.code(json.dumps(extra)) if extra else -1)
+    header["extras"] = add("extras", extras)
+
+    blob = bytearray()
+    string_offsets = array.array("Q", [0])
+    for value in strings.codes:
+        blob.extend(value.encode("utf-8"))
+        string_offsets.append(len(blob))
+    header["strings"] = {
+        "count": len(strings.codes),
+        "offsets": add("strings.offsets", string_offsets),
+        "blob": "strings.blob",
+    }
+    sections.append(("strings.blob", bytes(blob)))
+
+    # Resolve section names to [offset, length] once the header size is known
+    def _layout(header_len: int) -> Dict[str, List[int]]:
+        pos = len(COMPILED_MAGIC) + 8 + header_len
+        spans = {}
+        for name, payload in sections:
+            pos += -pos % 8
+            spans[name] = [pos, len(payload)]
+            pos += len(payload)
+        return spans
+
+    header_len = 0
+    while True:
+        header["sections"] = _layout(header_len)
+        encoded = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        if len(encoded) == header_len:
+            break
+        header_len = len(encoded)
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(COMPILED_MAGIC)
+        f.write(array.array("I", [COMPILED_FORMAT_VERSION, header_len]).tobytes())
+        f.write(encoded)
+        for name, payload in sections:
+            f.write(b"\x00" * (header["sections"][name][0] - f.tell()))
+            f.write(payload)
+    os.replace(tmp_path, out_path)
+    return out_path
 
+
+def read_compiled_dataset(path: str, expected_hash: Optional[str] = None) -> List[Program]:
+    """
+    Memory-map a compiled dataset and build its Program records.
+    Raises DatasetError if the file is invalid, from another format version
+    or byte order, or (with expected_hash) built from different JSON.
+    """
     try:
-        sat_score = int(sat_raw) if sat_raw != "" else None
-    except (TypeError, ValueError):
-        sat_score = None
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as exc:
+        raise DatasetError(f"Could not map {path}: {exc}")
 
+    # Every view into the map is released before closing it
+    views: List[memoryview] = []
     try:
-        act_score = int(act_raw) if act_raw != "" else None
-    except (TypeError, ValueError):
-        act_score = None
+        return _decode_compiled(mm, views, expected_hash, path)
+    except (KeyError, ValueError, TypeError, IndexError, UnicodeDecodeError) as exc:
+        raise DatasetError(f"Corrupt compiled dataset {path}: {exc}") from None
+    finally:
+        for view in reversed(views):
+            view.release()
+        mm.close()
 
-    profile: Dict[str, Any] = {
-        "role": role,
-        "current_status": current_status,
-        "home_state": home_state,
-        "gpa": gpa,
-        "degree_levels": degree_levels,
-        "interest_areas": interest_areas,
-        "max_tuition": max_tuition,
-        "sat_score": sat_score,
-        "act_score": act_score,
-        "location_pref": location_pref,
-    }
-    return profile
 
+def _decode_compiled(
+    mm: mmap.mmap,
+    views: List[memoryview],
+    expected_hash: Optional[str],
+    path: str,
+) -> List[Program]:
+    buf = memoryview(mm)
+    views.append(buf)
+    start = len(COMPILED_MAGIC)
+    if bytes(buf[:start]) != COMPILED_MAGIC:
+        raise DatasetError(f"{path} is not a compiled dataset")
+    version, header_len = array.array("I", bytes(buf[start:start + 8]))
+    if version != COMPILED_FORMAT_VERSION:
+        raise DatasetError(f"{path} has format version {version}, expected {COMPILED_FORMAT_VERSION}")
+    header = json.loads(bytes(buf[start + 8:start + 8 + header_len]).decode("utf-8"))
+    if header["byteorder"] != sys.byteorder:
+        raise DatasetError(f"{path} was compiled on a {header['byteorder']}-endian machine")
+    if expected_hash is not None and header["source_hash"] != expected_hash:
+        raise DatasetError(f"{path} is stale (built from different JSON)")
 
-def summarize_profile(profile: Optional[Dict[str, Any]]) -> str:
+    spans = header["sections"]
+
+    def column(name: str, fmt: str) -> memoryview:
+        offset, length = spans[name]
+        raw = buf[offset:offset + length]
+        views.append(raw)
+        views.append(raw.cast(fmt))
+        return views[-1]
+
+    offsets = column(header["strings"]["offsets"], "Q")
+    blob_offset = spans[header["strings"]["blob"]][0]
+    blob = bytes(buf[blob_offset:blob_offset + offsets[-1]])
+    strings = [
+        sys.intern(blob[offsets[i]:offsets[i + 1]].decode("utf-8"))
+        for i in range(header["strings"]["count"])
+    ]
+
+    n = header["count"]
+    fields: List[Tuple[str, List[Any], memoryview]] = []
+    for field, spec in header["fields"].items():
+        flags = column(spec["flags"], "B")
+        kind = spec["kind"]
+        if kind == "str":
+            values = [strings[c] if c >= 0 else None for c in column(spec["values"], "i")]
+        elif kind == "int":
+            values = column(spec["values"], "q").tolist()
+        elif kind == "float":
+            values = column(spec["values"], "d").tolist()
+        else:
+            values = [json.loads(strings[c]) if c >= 0 else None for c in column(spec["values"], "i")]
+        fields.append((field, values, flags))
+
+    lists: List[Tuple[str, List[Any], memoryview]] = []
+    for field, spec in header["lists"].items():
+        vocab = [strings[c] for c in spec["vocab"]]
+        masks = column(spec["masks"], "Q")
+        list_offsets = column(spec["offsets"], "Q")
+        codes = column(spec["codes"], "i")
+        # Tuples are kept as-is by Program, so equal lists share one object
+        by_mask: Dict[int, Tuple[str, ...]] = {}
+        values = []
+        for i in range(n):
+            lo, hi = list_offsets[i], list_offsets[i + 1]
+            if lo != hi:
+                values.append(tuple(strings[c] for c in codes[lo:hi]))
+                continue
+            mask = masks[i]
+            items = by_mask.get(mask)
+            if items is None:
+                items = by_mask[mask] = tuple(v for bit, v in enumerate(vocab) if mask >> bit & 1)
+            values.append(items)
+        lists.append((field, values, column(spec["flags"], "B")))
+
+    extras = column(header["extras"], "i")
+
+    programs: List[Program] = []
+    for i in range(n):
+        record: Dict[str, Any] = {}
+        for field, values, flags in fields + lists:
+            flag = flags[i]
+            if flag:
+                record[field] = values[i] if flag == 2 else None
+        if extras[i] >= 0:
+            record.update(json.loads(strings[extras[i]]))
+        programs.append(Program(record))
+    return programs
+
+
+# ---------------------------------------------------------------------------
+# Program index – posting lists for the hard filters
+# ---------------------------------------------------------------------------
+
+class ProgramIndex:
     """
-    Build a short human-readable summary for the Recommendations tab header.
+    Inverted index over a loaded program list, built once per dataset load.
+
+    Degree level, interest area and state each map to a posting set of
+    program positions; numeric tuition is kept in a sorted array so the
+    max_tuition cut is a bisect, and keyword search uses a TextIndex.
+    filter() returns exactly what the linear scan in
+    filter_programs_for_profile would, in dataset order.
     """
-    if not profile:
-        return ""
 
-    parts: List[str] = []
+    def __init__(self, programs: List[Program]):
+        self.programs = programs
+        self.by_degree: Dict[str, Set[int]] = {}
+        self.by_interest: Dict[str, Set[int]] = {}
+        self.by_state: Dict[str, Set[int]] = {}
 
-    role = (profile.get("role") or "").lower()
-    if role == "student":
-        parts.append("Student")
-    elif role == "parent":
-        parts.append("Parent")
+        tuition_pairs = []
+        # NaN tuition never compares greater than a budget, so it always passes the cut
+        self.tuition_nan_ids: Set[int] = set()
+        self.tuition_by_id: Dict[int, float] = {}
+        # Positions without a numeric tuition (excluded by any budget)
+        self.tuition_unknown_ids: Set[int] = set()
 
-    home_state = profile.get("home_state")
-    if home_state:
-        if parts:
-            parts[-1] = f"{parts[-1]} from {home_state}"
+        for i, p in enumerate(programs):
+            self.by_degree.setdefault(p.degree_key, set()).add(i)
+
+            for area in set(p.get("interest_areas") or []):
+                self.by_interest.setdefault(area, set()).add(i)
+
+            p_state = p.get("state") or None
+            if p_state:
+                self.by_state.setdefault(p_state, set()).add(i)
+
+            tuition = p.get("annual_tuition")
+            if isinstance(tuition, (int, float)):
+                if isinstance(tuition, float) and math.isnan(tuition):
+                    self.tuition_nan_ids.add(i)
+                else:
+                    tuition_pairs.append((tuition, i))
+                self.tuition_by_id[i] = tuition
+            else:
+                self.tuition_unknown_ids.add(i)
+
+        tuition_pairs.sort()
+        self.tuition_values: List[float] = [t for t, _ in tuition_pairs]
+        self.tuition_ids: List[int] = [i for _, i in tuition_pairs]
+
+        self.text = TextIndex(programs)
+
+        # Facet values per dimension and position (equal tuples shared), and
+        # the counts for an unconstrained profile
+        shared: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        self.facet_values: Dict[str, List[Tuple[str, ...]]] = {}
+        for dimension in FACET_DIMENSIONS:
+            column = []
+            for p in programs:
+                values = tuple(_facet_values(p, dimension))
+                column.append(shared.setdefault(values, values))
+            self.facet_values[dimension] = column
+        self.facet_totals = self._tally(range(len(programs)), FACET_DIMENSIONS)
+        # program_id -> position, built on first use (details lookups only)
+        self._position_by_program_id: Optional[Dict[Any, int]] = None
+        self._lock = threading.Lock()
+
+    def _union(self, postings: Dict[str, Set[int]], keys: "set[str]") -> Set[int]:
+        found = [postings[k] for k in keys if k in postings]
+        if not found:
+            return set()
+        if len(found) == 1:
+            return found[0]
+        return set().union(*found)
+
+    def filter(self, profile: Dict[str, Any]) -> List[Program]:
+        """
+        Same contract as filter_programs_for_profile, answered from postings.
+        """
+        candidates = self._candidates(profile)
+        if candidates is None:
+            return list(self.programs)
+        return [self.programs[i] for i in sorted(candidates)]
+
+    def filter_positions(self, profile: Dict[str, Any]) -> List[int]:
+        """
+        Positions of the programs filter() returns, in the same order.
+        """
+        candidates = self._candidates(profile)
+        if candidates is None:
+            return list(range(len(self.programs)))
+        return sorted(candidates)
+
+    def _candidates(self, profile: Dict[str, Any]) -> Optional[Set[int]]:
+        # Eligible positions, or None when nothing is filtered out
+        max_tuition = profile.get("max_tuition")
+        if isinstance(max_tuition, (int, float)) and max_tuition <= 0:
+            max_tuition = None
+
+        constraints = list(self._posting_constraints(profile).values())
+
+        has_budget = isinstance(max_tuition, (int, float)) and max_tuition > 0
+
+        if not constraints:
+            if not has_budget:
+                return None
+            candidates = self._tuition_range(max_tuition)
         else:
-            parts.append(f"From {home_state}")
+            constraints.sort(key=len)
+            candidates = constraints[0]
+            for other in constraints[1:]:
+                if not candidates:
+                    break
+                candidates = candidates & other
 
-    gpa = profile.get("gpa")
-    try:
-        gpa_val = float(gpa)
-        if gpa_val > 0:
-            parts.append(f"GPA {gpa_val:.1f}")
-    except (TypeError, ValueError):
-        pass
+            if has_budget and candidates:
+                cut = bisect.bisect_right(self.tuition_values, max_tuition)
+                if cut < len(candidates):
+                    candidates = candidates & self._tuition_range(max_tuition)
+                else:
+                    # Cheaper to check each remaining candidate than to materialize the range
+                    candidates = {
+                        i
+                        for i in candidates
+                        if i in self.tuition_by_id
+                        and not self.tuition_by_id[i] > max_tuition
+                    }
 
-    degree_levels = profile.get("degree_levels") or []
-    if degree_levels:
-        parts.append(", ".join(degree_levels))
+        return candidates
 
-    interests = profile.get("interest_areas") or []
-    if interests:
-        parts.append(", ".join(interests))
+    def restrict(self, candidates: Set[int], profile: Dict[str, Any]) -> Set[int]:
+        """
+        The members of `candidates` that filter() would return for `profile`,
+        at a cost proportional to len(candidates) rather than the catalog.
+        """
+        states = allowed_states(profile)
+        for postings, keys in (
+            (self.by_degree, set(profile.get("degree_levels") or [])),
+            (self.by_interest, set(profile.get("interest_areas") or [])),
+            (self.by_state, states if states is not None else set()),
+        ):
+            if keys or postings is self.by_state and states is not None:
+                candidates = set().union(
+                    *(candidates & postings[key] for key in keys if key in postings)
+                )
+        terms = query_tokens(profile)
+        if terms and candidates:
+            candidates = candidates.intersection(self.text.search(terms))
+        max_tuition = profile.get("max_tuition")
+        if isinstance(max_tuition, (int, float)) and max_tuition > 0:
+            candidates = {
+                i
+                for i in candidates
+                if i in self.tuition_by_id and not self.tuition_by_id[i] > max_tuition
+            }
+        return candidates
 
-    max_tuition = profile.get("max_tuition")
-    if isinstance(max_tuition, (int, float)) and max_tuition > 0:
-        parts.append(f"Max tuition ~${max_tuition:,.0f}/year")
+    def _tuition_range(self, max_tuition: float) -> Set[int]:
+        cut = bisect.bisect_right(self.tuition_values, max_tuition)
+        return set(self.tuition_ids[:cut]) | self.tuition_nan_ids
 
-    return " · ".join(parts)
+    def _posting_constraints(self, profile: Dict[str, Any]) -> Dict[str, Set[int]]:
+        """
+        Posting set per active non-budget constraint, keyed by facet
+        dimension ("q" has no facet). Shared sets: never mutate them.
+        """
+        degree_pref = set(profile.get("degree_levels") or [])
+        interests_pref = set(profile.get("interest_areas") or [])
+        states = allowed_states(profile)
 
+        constraints: Dict[str, Set[int]] = {}
+        if degree_pref:
+            constraints["degree_level"] = self._union(self.by_degree, degree_pref)
+        if interests_pref:
+            constraints["interest_areas"] = self._union(self.by_interest, interests_pref)
+        if states is not None:
+            constraints["state"] = self._union(self.by_state, states)
+        terms = query_tokens(profile)
+        if terms:
+            constraints["q"] = set(self.text.search(terms))
+        return constraints
 
-def summarize_constraints(profile: Optional[Dict[str, Any]]) -> str:
+    def facets(self, profile: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+        """
+        Same contract as facet_counts. Each dimension tallies the
+        intersection of every other constraint's posting set in one pass;
+        with no other constraint it uses totals counted at build time.
+        """
+        constraints = self._posting_constraints(profile)
+        max_tuition = profile.get("max_tuition")
+        if isinstance(max_tuition, (int, float)) and max_tuition > 0:
+            constraints["tuition"] = self._tuition_range(max_tuition)
+
+        result: Dict[str, Dict[str, int]] = {}
+        for dimension in FACET_DIMENSIONS:
+            others = sorted(
+                (ids for key, ids in constraints.items() if key != dimension),
+                key=len,
+            )
+            if not others:
+                result[dimension] = self.facet_totals[dimension]
+                continue
+            candidates = others[0]
+            for other in others[1:]:
+                candidates = candidates & other
+            result[dimension] = self._tally(candidates, (dimension,))[dimension]
+        return result
+
+    def position_of(self, program_id: Any) -> Optional[int]:
+        """
+        Position of the first program with `program_id`, or None.
+        """
+        positions = self._position_by_program_id
+        if positions is None:
+            with self._lock:
+                positions = self._position_by_program_id
+                if positions is None:
+                    positions = {}
+                    for i, p in enumerate(self.programs):
+                        positions.setdefault(p.program_id, i)
+                    self._position_by_program_id = positions
+        return positions.get(program_id)
+
+    def _tally(self, ids: Iterable[int], dimensions: Tuple[str, ...]) -> Dict[str, Dict[str, int]]:
+        ids = ids if isinstance(ids, (range, list)) else list(ids)
+        counts = _empty_facets(dimensions)
+        for d in dimensions:
+            tally = counts[d]
+            tally.update(Counter(chain.from_iterable(map(self.facet_values[d].__getitem__, ids))))
+        return _sorted_facets(counts)
+
+
+# ---------------------------------------------------------------------------
+# Text index – BM25 over the searchable text fields
+# ---------------------------------------------------------------------------
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z])(?=[A-Z])")
+SEARCH_STOPWORDS = frozenset(
+    {"a", "an", "and", "at", "for", "in", "into", "of", "on", "or", "the", "to", "with"}
+)
+
+
+def tokenize(text: str) -> List[str]:
     """
-    Explicit summary of hard constraints applied in filtering.
+    Lowercase word tokens without stopwords; "DataScience" splits in two
+    and a plural "s" is dropped, so "sciences" finds "science".
     """
-    if not profile:
-        return ""
+    tokens = []
+    for token in _TOKEN_RE.findall(_CAMEL_RE.sub(" ", text).lower()):
+        if token in SEARCH_STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
 
-    parts: List[str] = []
 
-    degree_levels = profile.get("degree_levels") or []
-    interests = profile.get("interest_areas") or []
-    max_tuition = profile.get("max_tuition")
-    home_state = profile.get("home_state")
-    location_pref = (profile.get("location_pref") or "").lower()
+def query_tokens(profile: Dict[str, Any]) -> Tuple[str, ...]:
+    """
+    Distinct search terms of the profile's "q", sorted (order does not
+    change the result).
+    """
+    q = profile.get("q")
+    if not isinstance(q, str) or not q.strip():
+        return ()
+    return tuple(sorted(set(tokenize(q))))
 
-    if degree_levels:
-        parts.append("Degree: " + ", ".join(degree_levels))
 
-    if interests:
-        parts.append("Interests: " + ", ".join(interests))
+def _program_text(p: Program) -> str:
+    parts = []
+    for field in SEARCH_FIELDS:
+        value = p.get(field)
+        if isinstance(value, str):
+            parts.append(value)
+        elif isinstance(value, (list, tuple)):
+            parts.extend(v for v in value if isinstance(v, str))
+    return " ".join(parts)
 
-    if isinstance(max_tuition, (int, float)) and max_tuition > 0:
-        parts.append(f"Tuition ≤ ${max_tuition:,.0f}/year")
 
-    if location_pref == "instate" and home_state:
-        parts.append(f"In-state only ({home_state})")
-    elif location_pref == "out_of_state_ok":
-        parts.append("In-state or out-of-state")
-    elif location_pref == "anywhere":
-        parts.append("Anywhere in the U.S.")
+class TextIndex:
+    """
+    Tokenized inverted index over SEARCH_FIELDS, built once per dataset load.
 
-    return " · ".join(parts)
+    Each term maps to parallel arrays of program positions and term
+    frequencies; the per-document BM25 length norm is precomputed, so a
+    query only walks the posting lists of its own terms. Matching is OR:
+    a program matches if it contains any query term.
+    """
+
+    def __init__(self, programs: List[Program]):
+        self.programs = programs
+        self.postings: Dict[str, Tuple["array.array", "array.array"]] = {}
+
+        lengths: List[int] = []
+        for i, p in enumerate(programs):
+            tokens = tokenize(_program_text(p))
+            lengths.append(len(tokens))
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = (array.array("I"), array.array("I"))
+                posting[0].append(i)
+                posting[1].append(tf)
+
+        n = len(programs)
+        avgdl = (sum(lengths) / n) if n else 0.0
+        self.length_norm = array.array(
+            "d",
+            (BM25_K1 * (1 - BM25_B + BM25_B * (dl / avgdl if avgdl else 0.0)) for dl in lengths),
+        )
+        # Memoized per query; the returned dicts are shared and read-only
+        self.search = lru_cache(maxsize=256)(self._search)
+        self.scores_by_program = lru_cache(maxsize=256)(self._scores_by_program)
+        self.top_score = lru_cache(maxsize=256)(self._top_score)
+
+    def _search(self, terms: Tuple[str, ...]) -> Dict[int, float]:
+        """
+        BM25 score per matching program position.
+        """
+        n = len(self.programs)
+        norm = self.length_norm
+        scores: Dict[int, float] = {}
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs = posting
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            boost = idf * (BM25_K1 + 1)
+            get = scores.get
+            for i, tf in zip(ids, tfs):
+                scores[i] = get(i, 0.0) + boost * tf / (tf + norm[i])
+        return scores
+
+    def _scores_by_program(self, terms: Tuple[str, ...]) -> Dict[int, float]:
+        # Keyed by id(program), for callers holding an eligible subset
+        programs = self.programs
+        return {id(programs[i]): score for i, score in self.search(terms).items()}
+
+    def _top_score(self, terms: Tuple[str, ...]) -> float:
+        """
+        Best BM25 score over the whole catalog (0.0 when nothing matches).
+        """
+        return max(self.search(terms).values(), default=0.0)
+
+
+def search_scores(
+    terms: Tuple[str, ...],
+    programs: List[Program],
+    text: Optional["TextIndex"] = None,
+) -> Dict[int, float]:
+    """
+    BM25 scores by id(program) for the programs matching `terms`.
+
+    `text` is the TextIndex of the catalog `programs` was drawn from (such
+    as an eligible subset of a snapshot); without it `programs` is indexed
+    on the fly.
+    """
+    if text is None:
+        text = TextIndex(programs)
+    return text.scores_by_program(terms)
 
 
 # ---------------------------------------------------------------------------
-# Routes
+# Program columns – array layout for the numpy ranking engine
 # ---------------------------------------------------------------------------
 
-@app.route("/", methods=["GET", "POST"])
-def index():
-    programs = load_programs()
-    data_error = len(programs) == 0
+class ProgramColumns:
+    """
+    Column-oriented copy of the ranking inputs for a loaded program list.
 
-    profile: Optional[Dict[str, Any]] = None
-    recommendations: List[Dict[str, Any]] = []
-    active_tab = "profile"
+      - interest_matrix: bool (n_programs × n_interest_areas) bitmask
+      - degree_codes / state_codes: int codes (-1 for a missing state)
+      - tuition_sort: float tuition with unknown values as +inf
+      - name_rank: position of program_name in sorted order (for lexsort)
+    """
 
-    if request.method == "POST":
-        profile = build_profile_from_form(request.form)
-        session["v10_profile"] = profile
+    def __init__(self, programs: List[Program]):
+        self.programs = programs
+        self.row_of: Dict[int, int] = {id(p): i for i, p in enumerate(programs)}
 
-        if not data_error:
-            eligible = filter_programs_for_profile(profile, programs)
-            ranked = rank_programs(profile, eligible)
-            recommendations = build_explanations(profile, ranked)
+        self.interest_codes: Dict[str, int] = {}
+        self.degree_codes_map: Dict[str, int] = {}
+        self.state_codes_map: Dict[str, int] = {}
 
-        active_tab = "recommendations"
-    else:
-        profile = session.get("v10_profile")
-        if profile and not data_error:
-            eligible = filter_programs_for_profile(profile, programs)
-            ranked = rank_programs(profile, eligible)
-            recommendations = build_explanations(profile, ranked)
-        active_tab = "profile"
+        n = len(programs)
+        interest_rows: List[List[int]] = []
+        degree_codes = np.empty(n, dtype=np.int32)
+        state_codes = np.empty(n, dtype=np.int32)
+        tuition_sort = np.empty(n, dtype=np.float64)
+        names: List[str] = []
+        # NaN tuition has no total order, so such catalogs stay on the python engine
+        self.has_nan_tuition = False
 
-    profile_summary = summarize_profile(profile)
-    constraints_summary = summarize_constraints(profile)
+        for i, p in enumerate(programs):
+            interest_rows.append(
+                [
+                    self.interest_codes.setdefault(area, len(self.interest_codes))
+                    for area in set(p.get("interest_areas") or [])
+                ]
+            )
 
-    return render_template(
-        "index_v10.html",
-        app_name=APP_NAME,
-        profile=profile,
-        profile_summary=profile_summary,
-        constraints_summary=constraints_summary,
-        recommendations=recommendations,
-        active_tab=active_tab,
-        data_error=data_error,
-        degree_options=DEGREE_OPTIONS,
-        interest_options=INTEREST_OPTIONS,
-        us_states=US_STATES,
-        INTEREST_WEIGHT=INTEREST_WEIGHT,
-        DEGREE_WEIGHT=DEGREE_WEIGHT,
-        LOCATION_WEIGHT=LOCATION_WEIGHT,
-    )
+            degree_codes[i] = self.degree_codes_map.setdefault(
+                p.degree_key, len(self.degree_codes_map)
+            )
+
+            p_state = p.get("state") or None
+            state_codes[i] = (
+                self.state_codes_map.setdefault(p_state, len(self.state_codes_map))
+                if p_state
+                else -1
+            )
+
+            tuition_val = p.get("annual_tuition")
+            try:
+                tuition = (
+                    float(tuition_val)
+                    if tuition_val not in (None, "")
+                    else float("inf")
+                )
+            except (TypeError, ValueError):
+                tuition = float("inf")
+            if math.isnan(tuition):
+                self.has_nan_tuition = True
+            tuition_sort[i] = tuition
+
+            names.append(p.get("program_name") or "")
+
+        self.interest_matrix = np.zeros((n, len(self.interest_codes)), dtype=bool)
+        for i, codes in enumerate(interest_rows):
+            self.interest_matrix[i, codes] = True
+
+        self.degree_codes = degree_codes
+        self.state_codes = state_codes
+        self.tuition_sort = tuition_sort
+
+        # Equal names share a rank so lexsort stays stable on input order
+        name_ranks = {name: rank for rank, name in enumerate(sorted(set(names)))}
+        self.name_rank = np.array([name_ranks[name] for name in names], dtype=np.int64)
+
+    def rows_for(self, programs: List[Program]) -> Optional["np.ndarray"]:
+        """
+        Map program dicts back to column rows; None if any is not in this dataset.
+        """
+        row_of = self.row_of
+        rows = np.empty(len(programs), dtype=np.int64)
+        for j, p in enumerate(programs):
+            i = row_of.get(id(p))
+            if i is None or self.programs[i] is not p:
+                return None
+            rows[j] = i
+        return rows
+
+
+# ---------------------------------------------------------------------------
+# Similarity index – normalized feature vectors for "similar programs"
+# ---------------------------------------------------------------------------
+
+# Categorical features, one-hot encoded; each group is scaled to unit length
+SIMILARITY_CATEGORICAL = (
+    "degree_key",
+    "tuition_band",
+    "selectivity_band",
+    "institution_type",
+    "campus_type",
+    "size_category",
+    "urbanicity",
+    "cip_cluster",
+)
+TUITION_BANDS = (10000.0, 20000.0, 35000.0, 50000.0)
+
+
+def _tuition_band(tuition: Any) -> Optional[int]:
+    if not isinstance(tuition, (int, float)) or math.isnan(tuition):
+        return None
+    return bisect.bisect_right(TUITION_BANDS, tuition)
+
+
+class SimilarityIndex:
+    """
+    Row-normalized float32 feature matrix over a loaded program list:
+    interest-area multi-hot, the SIMILARITY_CATEGORICAL one-hots and a
+    TF-IDF of program_snippet over its SIMILARITY_TFIDF_TERMS most common
+    informative terms. Every feature group has unit norm before the row is
+    normalized, so no single group dominates; cosine similarity is a dot
+    product.
+
+    neighbors() scores one program against the catalog with a single
+    matrix-vector product and keeps SIMILAR_MAX_K with argpartition; the
+    result is memoized per program.
+    """
+
+    def __init__(self, programs: List[Program]):
+        self.programs = programs
+        self.position_by_id: Dict[Any, int] = {}
+        for i, p in enumerate(programs):
+            self.position_by_id.setdefault(p.program_id, i)
+
+        codes: Dict[Tuple[str, Any], int] = {}
+
+        def _code(key: Tuple[str, Any]) -> int:
+            code = codes.get(key)
+            if code is None:
+                code = codes[key] = len(codes)
+            return code
+
+        def _group(keys: List[Tuple[str, Any]], weights: List[float]) -> Tuple[List[int], List[float]]:
+            # One feature group scaled to unit length
+            scale = math.sqrt(sum(w * w for w in weights)) or 1.0
+            return [_code(k) for k in keys], [w / scale for w in weights]
+
+        # Programs share few distinct interest lists and snippets: encode each once
+        snippet_tokens: Dict[Any, List[str]] = {}
+        for p in programs:
+            if p.program_snippet not in snippet_tokens:
+                text = p.program_snippet
+                snippet_tokens[text] = tokenize(text) if isinstance(text, str) else []
+        vocab = self._snippet_vocabulary(
+            [snippet_tokens[p.program_snippet] for p in programs]
+        )
+        n = len(programs)
+
+        interest_groups: Dict[Any, Tuple[List[int], List[float]]] = {}
+        snippet_groups: Dict[Any, Tuple[List[int], List[float]]] = {}
+
+        rows: List[int] = []
+        cols: List[int] = []
+        vals: List[float] = []
+        for i, p in enumerate(programs):
+            areas = p.interest_areas or ()
+            group = interest_groups.get(areas)
+            if group is None:
+                keys = [("interest", a) for a in dict.fromkeys(areas)]
+                group = interest_groups[areas] = _group(keys, [1.0] * len(keys))
+
+            snippet = snippet_groups.get(p.program_snippet)
+            if snippet is None:
+                counts: Dict[str, int] = {}
+                for token in snippet_tokens[p.program_snippet]:
+                    if token in vocab:
+                        counts[token] = counts.get(token, 0) + 1
+                snippet = snippet_groups[p.program_snippet] = _group(
+                    [("snippet", t) for t in counts],
+                    [c * math.log((1 + n) / (1 + vocab[t])) + 1 for t, c in counts.items()],
+                )
+
+            for group_cols, group_vals in (group, snippet):
+                rows.extend([i] * len(group_cols))
+                cols.extend(group_cols)
+                vals.extend(group_vals)
+
+            for field in SIMILARITY_CATEGORICAL:
+                value = _tuition_band(p.annual_tuition) if field == "tuition_band" else getattr(p, field)
+                if value not in (None, ""):
+                    rows.append(i)
+                    cols.append(_code((field, value)))
+                    vals.append(1.0)
+
+        matrix = np.zeros((n, max(len(codes), 1)), dtype=np.float32)
+        # (row, feature) pairs are unique: keys never repeat within a program
+        matrix[np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)] = vals
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        self.matrix = matrix / norms
+
+        self.neighbors_of = lru_cache(maxsize=4096)(self._neighbors_of)
+
+    @staticmethod
+    def _snippet_vocabulary(snippets: List[List[str]]) -> Dict[str, int]:
+        """
+        Term -> document frequency for the terms used in TF-IDF: seen in at
+        least two snippets and at most half of them, most frequent first.
+        """
+        df: Dict[str, int] = {}
+        for tokens in snippets:
+            for token in set(tokens):
+                df[token] = df.get(token, 0) + 1
+        limit = max(len(snippets) // 2, 2)
+        usable = [(count, term) for term, count in df.items() if 2 <= count <= limit]
+        usable.sort(key=lambda ct: (-ct[0], ct[1]))
+        return {term: count for count, term in usable[:SIMILARITY_TFIDF_TERMS]}
+
+    def _neighbors_of(self, position: int) -> Tuple[Tuple[int, float], ...]:
+        scores = self.matrix @ self.matrix[position]
+        scores[position] = -np.inf
+        k = min(SIMILAR_MAX_K, len(scores) - 1)
+        if k <= 0:
+            return ()
+        top = np.argpartition(-scores, k - 1)[:k]
+        # Highest similarity first; ties in dataset order
+        top = top[np.lexsort((top, -scores[top]))]
+        return tuple((int(i), float(scores[i])) for i in top)
+
+    def neighbors(self, program_id: Any, k: int) -> Optional[List[Tuple[Program, float]]]:
+        """
+        Up to k most similar programs with their cosine similarity, or None
+        for an unknown program_id.
+        """
+        position = self.position_by_id.get(program_id)
+        if position is None:
+            return None
+        return [(self.programs[i], score) for i, score in self.neighbors_of(position)[:k]]
+
+
+# ---------------------------------------------------------------------------
+# Geography – state centroids, adjacency and the tables derived from them
+# ---------------------------------------------------------------------------
+
+# Approximate geographic center (lat, lon) of each state in US_STATES
+STATE_CENTROIDS: Dict[str, Tuple[float, float]] = {
+    "AL": (32.8, -86.8), "AK": (64.7, -152.3), "AZ": (34.3, -111.7), "AR": (34.9, -92.4),
+    "CA": (37.2, -119.4), "CO": (39.0, -105.5), "CT": (41.6, -72.7), "DE": (39.0, -75.5),
+    "FL": (28.6, -82.4), "GA": (32.7, -83.4), "HI": (20.3, -156.4), "ID": (44.4, -114.6),
+    "IL": (40.0, -89.2), "IN": (39.9, -86.3), "IA": (42.1, -93.5), "KS": (38.5, -98.4),
+    "KY": (37.5, -85.3), "LA": (31.1, -92.0), "ME": (45.4, -69.2), "MD": (39.0, -76.8),
+    "MA": (42.3, -71.8), "MI": (44.3, -85.4), "MN": (46.3, -94.3), "MS": (32.7, -89.7),
+    "MO": (38.4, -92.5), "MT": (47.0, -109.6), "NE": (41.5, -99.8), "NV": (39.3, -116.6),
+    "NH": (43.7, -71.6), "NJ": (40.2, -74.7), "NM": (34.4, -106.1), "NY": (42.9, -75.5),
+    "NC": (35.6, -79.4), "ND": (47.5, -100.5), "OH": (40.3, -82.8), "OK": (35.6, -97.5),
+    "OR": (43.9, -120.6), "PA": (40.9, -77.8), "RI": (41.7, -71.5), "SC": (33.9, -80.9),
+    "SD": (44.4, -100.2), "TN": (35.9, -86.4), "TX": (31.5, -99.3), "UT": (39.3, -111.7),
+    "VT": (44.1, -72.7), "VA": (37.5, -78.9), "WA": (47.4, -120.5), "WV": (38.6, -80.6),
+    "WI": (44.6, -90.0), "WY": (43.0, -107.6),
+}
+
+# States sharing a land border (corner-only contacts such as Four Corners excluded)
+STATE_NEIGHBORS: Dict[str, Tuple[str, ...]] = {
+    "AL": ("FL", "GA", "MS", "TN"),
+    "AK": (),
+    "AZ": ("CA", "NM", "NV", "UT"),
+    "AR": ("LA", "MO", "MS", "OK", "TN", "TX"),
+    "CA": ("AZ", "NV", "OR"),
+    "CO": ("KS", "NE", "NM", "OK", "UT", "WY"),
+    "CT": ("MA", "NY", "RI"),
+    "DE": ("MD", "NJ", "PA"),
+    "FL": ("AL", "GA"),
+    "GA": ("AL", "FL", "NC", "SC", "TN"),
+    "HI": (),
+    "ID": ("MT", "NV", "OR", "UT", "WA", "WY"),
+    "IL": ("IA", "IN", "KY", "MO", "WI"),
+    "IN": ("IL", "KY", "MI", "OH"),
+    "IA": ("IL", "MN", "MO", "NE", "SD", "WI"),
+    "KS": ("CO", "MO", "NE", "OK"),
+    "KY": ("IL", "IN", "MO", "OH", "TN", "VA", "WV"),
+    "LA": ("AR", "MS", "TX"),
+    "ME": ("NH",),
+    "MD": ("DE", "PA", "VA", "WV"),
+    "MA": ("CT", "NH", "NY", "RI", "VT"),
+    "MI": ("IN", "OH", "WI"),
+    "MN": ("IA", "ND", "SD", "WI"),
+    "MS": ("AL", "AR", "LA", "TN"),
+    "MO": ("AR", "IA", "IL", "KS", "KY", "NE", "OK", "TN"),
+    "MT": ("ID", "ND", "SD", "WY"),
+    "NE": ("CO", "IA", "KS", "MO", "SD", "WY"),
+    "NV": ("AZ", "CA", "ID", "OR", "UT"),
+    "NH": ("MA", "ME", "VT"),
+    "NJ": ("DE", "NY", "PA"),
+    "NM": ("AZ", "CO", "OK", "TX"),
+    "NY": ("CT", "MA", "NJ", "PA", "VT"),
+    "NC": ("GA", "SC", "TN", "VA"),
+    "ND": ("MN", "MT", "SD"),
+    "OH": ("IN", "KY", "MI", "PA", "WV"),
+    "OK": ("AR", "CO", "KS", "MO", "NM", "TX"),
+    "OR": ("CA", "ID", "NV", "WA"),
+    "PA": ("DE", "MD", "NJ", "NY", "OH", "WV"),
+    "RI": ("CT", "MA"),
+    "SC": ("GA", "NC"),
+    "SD": ("IA", "MN", "MT", "ND", "NE", "WY"),
+    "TN": ("AL", "AR", "GA", "KY", "MO", "MS", "NC", "VA"),
+    "TX": ("AR", "LA", "NM", "OK"),
+    "UT": ("AZ", "CO", "ID", "NV", "WY"),
+    "VT": ("MA", "NH", "NY"),
+    "VA": ("KY", "MD", "NC", "TN", "WV"),
+    "WA": ("ID", "OR"),
+    "WV": ("KY", "MD", "OH", "PA", "VA"),
+    "WI": ("IA", "IL", "MI", "MN"),
+    "WY": ("CO", "ID", "MT", "NE", "SD", "UT"),
+}
+
+# Graded location factor (× LOCATION_WEIGHT) when location is a preference, not a filter
+LOCATION_FACTOR_HOME = 1.0
+LOCATION_FACTOR_NEIGHBOR = 0.85
+LOCATION_FACTOR_NEAR = 0.8  # other states: falls linearly from this at 0 miles ...
+LOCATION_FACTOR_FAR = 0.4  # ... to this at LOCATION_FAR_MILES and beyond
+LOCATION_FAR_MILES = 2500.0
+LOCATION_FACTOR_UNKNOWN = 0.6
+
+
+def _centroid_miles(a: str, b: str) -> float:
+    (lat1, lon1), (lat2, lon2) = STATE_CENTROIDS[a], STATE_CENTROIDS[b]
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlambda = phi2 - phi1, math.radians(lon2 - lon1)
+    h = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * 3958.8 * math.asin(math.sqrt(h))
+
+
+def _location_factor(home: str, state: str) -> float:
+    if state == home:
+        return LOCATION_FACTOR_HOME
+    if state in STATE_NEIGHBORS[home]:
+        return LOCATION_FACTOR_NEIGHBOR
+    share = min(STATE_DISTANCES[home][state] / LOCATION_FAR_MILES, 1.0)
+    return round(LOCATION_FACTOR_NEAR - (LOCATION_FACTOR_NEAR - LOCATION_FACTOR_FAR) * share, 2)
+
+
+# Computed once at import; requests only do dictionary lookups and bisects
+STATE_DISTANCES: Dict[str, Dict[str, float]] = {
+    a: {b: 0.0 if a == b else round(_centroid_miles(a, b), 1) for b in US_STATES}
+    for a in US_STATES
+}
+LOCATION_FACTORS: Dict[str, Dict[str, float]] = {
+    a: {b: _location_factor(a, b) for b in US_STATES} for a in US_STATES
+}
+# Per home state: (sorted distances, states in the same order) for radius queries
+_STATES_BY_DISTANCE: Dict[str, Tuple[List[float], List[str]]] = {}
+for _home, _row in STATE_DISTANCES.items():
+    _ordered = sorted((d, s) for s, d in _row.items())
+    _STATES_BY_DISTANCE[_home] = ([d for d, _ in _ordered], [s for _, s in _ordered])
+
+
+def location_factor(home_state: Optional[str], program_state: Optional[str]) -> float:
+    """
+    Graded location factor for a program, LOCATION_FACTOR_UNKNOWN when
+    either state is missing or not a US_STATES code.
+    """
+    if home_state and program_state == home_state:
+        return LOCATION_FACTOR_HOME
+    row = LOCATION_FACTORS.get(home_state or "")
+    if row is None:
+        return LOCATION_FACTOR_UNKNOWN
+    return row.get(program_state or "", LOCATION_FACTOR_UNKNOWN)
+
+
+def _max_distance(profile: Dict[str, Any]) -> Optional[float]:
+    value = profile.get("max_distance")
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0:
+        return float(value)
+    return None
+
+
+def allowed_states(profile: Dict[str, Any]) -> Optional[Set[str]]:
+    """
+    States a program may be in under the profile's location preference, or
+    None when location is not a hard constraint:
+
+      - "instate": the home state
+      - "neighbors": the home state and the states bordering it
+      - "nearby": states whose centroid is within max_distance miles of
+        the home state's
+    """
+    home_state = profile.get("home_state") or None
+    location_pref = (profile.get("location_pref") or "").lower()
+    if not home_state:
+        return None
+    if location_pref == "instate":
+        return {home_state}
+    if home_state not in STATE_NEIGHBORS:
+        return {home_state} if location_pref in ("neighbors", "nearby") else None
+    if location_pref == "neighbors":
+        return {home_state, *STATE_NEIGHBORS[home_state]}
+    if location_pref == "nearby":
+        max_distance = _max_distance(profile)
+        if max_distance is None:
+            return None
+        distances, states = _STATES_BY_DISTANCE[home_state]
+        return set(states[:bisect.bisect_right(distances, max_distance)])
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Scoring helpers (no safety buckets in v10)
+# ---------------------------------------------------------------------------
+
+def _selectivity_target_gpa(selectivity_band: Optional[str]) -> float:
+    """
+    Map selectivity band to an approximate target GPA.
+    Used only for descriptive academic explanations, not for buckets.
+    """
+    band = (selectivity_band or "").lower()
+    if band == "highly_selective":
+        return 3.7
+    if band == "selective":
+        return 3.3
+    if band == "moderate":
+        return 2.8
+    # "open" / broad access or unknown
+    return 2.3
+
+
+def _build_interests_reason(
+    pref_interests: "set[str]",
+    program_interests: "set[str]",
+) -> str:
+    overlap = pref_interests & program_interests
+    if overlap:
+        return "Matches your interest areas: " + ", ".join(sorted(overlap)) + "."
+    if not pref_interests:
+        return "Offers a broad curriculum suitable for exploring different interests."
+    return "Offers related fields where you may discover new interests."
+
+
+# Academic explanation texts, one per verdict of _academic_verdict()
+ACADEMIC_REASONS: Dict[str, str] = {
+    "unspecified": (
+        "Academic context is based on general patterns; your GPA or the school's "
+        "selectivity band is not fully specified."
+    ),
+    "above": (
+        "Your GPA is somewhat above the typical range for this school, which suggests "
+        "a comfortable academic match."
+    ),
+    "in_line": (
+        "Your GPA is roughly in line with the typical range for this school, which "
+        "suggests a reasonable academic match."
+    ),
+    "below": (
+        "This school is more academically competitive than your current GPA range. "
+        "It may be more challenging, but could still be worth considering."
+    ),
+}
+
+
+def _academic_verdict(
+    gpa: float,
+    selectivity_band: Optional[str],
+) -> str:
+    """
+    Classify GPA against the band's target GPA: a key of ACADEMIC_REASONS.
+    """
+    if gpa <= 0 or not selectivity_band:
+        return "unspecified"
+
+    target_gpa = _selectivity_target_gpa(selectivity_band)
+    delta = gpa - target_gpa
+
+    if delta >= 0.3:
+        return "above"
+    if delta >= -0.2:
+        return "in_line"
+    return "below"
+
+
+def _build_academic_reason(
+    gpa: float,
+    selectivity_band: Optional[str],
+) -> str:
+    """
+    Provide a descriptive academic fit explanation, without safety/target/reach buckets.
+    """
+    return ACADEMIC_REASONS[_academic_verdict(gpa, selectivity_band)]
+
+
+# Location preferences whose explanations name neighbors and distances;
+# the others keep the original in-state / out-of-state wording
+DISTANCE_REASON_PREFS = frozenset({"neighbors", "nearby", "anywhere"})
+
+
+def _build_practical_reason(
+    home_state: Optional[str],
+    program_state: Optional[str],
+    max_tuition: Optional[float],
+    program_tuition: Optional[float],
+    describe_distance: bool = False,
+) -> str:
+    parts: List[str] = []
+
+    if home_state and program_state:
+        if program_state == home_state:
+            parts.append(
+                "Located in your home state, which may make it more convenient and potentially more affordable."
+            )
+        elif not describe_distance:
+            parts.append(
+                f"Located in {program_state}, outside your home state of {home_state}."
+            )
+        elif program_state in STATE_NEIGHBORS.get(home_state, ()):
+            parts.append(
+                f"Located in {program_state}, a neighboring state to your home state of {home_state}."
+            )
+        elif home_state in STATE_DISTANCES and program_state in STATE_DISTANCES:
+            miles = STATE_DISTANCES[home_state][program_state]
+            parts.append(
+                f"Located in {program_state}, roughly {round(miles, -1):,.0f} miles from your home state of {home_state}."
+            )
+        else:
+            parts.append(
+                f"Located in {program_state}, outside your home state of {home_state}."
+            )
+
+    if isinstance(max_tuition, (int, float)) and max_tuition > 0:
+        if isinstance(program_tuition, (int, float)):
+            if program_tuition <= max_tuition:
+                parts.append(
+                    f"Estimated tuition (~${program_tuition:,.0f} per year) fits within your comfortable range."
+                )
+            else:
+                parts.append(
+                    f"Estimated tuition (~${program_tuition:,.0f} per year) is above your stated comfort level."
+                )
+        else:
+            parts.append(
+                "Tuition information is not available for this program, so we cannot compare it to your budget."
+            )
+
+    if not parts:
+        return "A practical option to explore based on your broad preferences."
+
+    return " ".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# v10 Filtering logic – strict adherence to user preferences
+# ---------------------------------------------------------------------------
+
+def filter_programs_for_profile(
+    profile: Dict[str, Any],
+    programs: List[Program],
+    index: Optional["ProgramIndex"] = None,
+) -> List[Program]:
+    """
+    Apply hard filters based directly on Tab 1 preferences.
+
+    Hard constraints:
+      - At least one interest area selected: program must intersect with those.
+      - At least one degree level selected: program.degree_level must be one of them.
+      - If max_tuition > 0:
+          - program must have numeric tuition
+          - tuition must be <= max_tuition.
+      - If location_pref is "instate", "neighbors" or "nearby" and home_state
+        is provided: program.state must be one of allowed_states(profile).
+      - If a keyword query "q" is given: program text must contain one of its terms.
+
+    When `index` (the ProgramIndex built over `programs`) is given, the
+    answer comes from its posting sets instead of a scan.
+    """
+    if index is not None:
+        return index.filter(profile)
+
+    degree_pref = set(profile.get("degree_levels") or [])
+    interests_pref = set(profile.get("interest_areas") or [])
+
+    max_tuition = profile.get("max_tuition")
+    if isinstance(max_tuition, (int, float)) and max_tuition <= 0:
+        max_tuition = None
+
+    states = allowed_states(profile)
+    terms = set(query_tokens(profile))
+
+    eligible: List[Program] = []
+
+    for p in programs:
+        # Degree level match
+        p_degree = (p.get("degree_level") or "").strip()
+        if degree_pref and p_degree not in degree_pref:
+            continue
+
+        # Interest areas match (intersection must be non-empty)
+        p_interests = set(p.get("interest_areas") or [])
+        if interests_pref and not (p_interests & interests_pref):
+            continue
+
+        # Max tuition constraint (if user specified)
+        tuition = p.get("annual_tuition")
+        if isinstance(max_tuition, (int, float)) and max_tuition > 0:
+            # For exact adherence: if tuition is unknown, we cannot assert it is <= max → exclude
+            if not isinstance(tuition, (int, float)):
+                continue
+            if tuition > max_tuition:
+                continue
+
+        # Location preference
+        p_state = p.get("state") or None
+        if states is not None and p_state not in states:
+            continue
+
+        # Keyword match
+        if terms and terms.isdisjoint(tokenize(_program_text(p))):
+            continue
+
+        eligible.append(p)
+
+    return eligible
+
+
+# ---------------------------------------------------------------------------
+# Facet counts – results per degree / interest / state / tuition bucket
+# ---------------------------------------------------------------------------
+
+FACET_DIMENSIONS = ("degree_level", "interest_areas", "state", "tuition")
+
+
+def _tuition_bucket(tuition: Any) -> str:
+    if not isinstance(tuition, (int, float)) or math.isnan(tuition):
+        return "unknown"
+    i = bisect.bisect_left(TUITION_FACET_EDGES, tuition)
+    if i == len(TUITION_FACET_EDGES):
+        return f"{TUITION_FACET_EDGES[-1]}+"
+    low = TUITION_FACET_EDGES[i - 1] if i else 0
+    return f"{low}-{TUITION_FACET_EDGES[i]}"
+
+
+TUITION_BUCKETS = tuple(
+    _tuition_bucket(edge) for edge in TUITION_FACET_EDGES
+) + (f"{TUITION_FACET_EDGES[-1]}+", "unknown")
+
+
+def _facet_values(p: Program, dimension: str) -> Iterable[str]:
+    if dimension == "degree_level":
+        return (p.degree_key,) if p.degree_key else ()
+    if dimension == "interest_areas":
+        return dict.fromkeys(p.interest_areas or ())
+    if dimension == "state":
+        return (p.state,) if p.state else ()
+    return (_tuition_bucket(p.annual_tuition),)
+
+
+def _empty_facets(dimensions: Iterable[str]) -> Dict[str, Dict[str, int]]:
+    return {d: dict.fromkeys(TUITION_BUCKETS, 0) if d == "tuition" else {} for d in dimensions}
+
+
+def _sorted_facets(counts: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
+    # Tuition buckets keep their range order; other values sort by name
+    return {
+        d: values if d == "tuition" else dict(sorted(values.items()))
+        for d, values in counts.items()
+    }
+
+
+def facet_counts(
+    profile: Dict[str, Any],
+    programs: List[Program],
+    index: Optional["ProgramIndex"] = None,
+) -> Dict[str, Dict[str, int]]:
+    """
+    Result counts per degree level, interest area, state and tuition bucket.
+
+    Each dimension applies every hard constraint of
+    filter_programs_for_profile except its own, so a count is how many
+    results that option would give ("Associate (12)"). When `index` (the
+    ProgramIndex built over `programs`) is given, counts come from its
+    posting sets; otherwise from one pass that records which constraints
+    each program fails.
+    """
+    if index is not None:
+        return index.facets(profile)
+
+    degree_pref = set(profile.get("degree_levels") or [])
+    interests_pref = set(profile.get("interest_areas") or [])
+    states = allowed_states(profile)
+    terms = set(query_tokens(profile))
+    max_tuition = profile.get("max_tuition")
+    has_budget = isinstance(max_tuition, (int, float)) and max_tuition > 0
+
+    counts = _empty_facets(FACET_DIMENSIONS)
+    for p in programs:
+        failed: List[str] = []
+        if degree_pref and (p.get("degree_level") or "").strip() not in degree_pref:
+            failed.append("degree_level")
+        if interests_pref and not (set(p.get("interest_areas") or []) & interests_pref):
+            failed.append("interest_areas")
+        if has_budget:
+            tuition = p.get("annual_tuition")
+            if not isinstance(tuition, (int, float)) or tuition > max_tuition:
+                failed.append("tuition")
+        if states is not None and (p.get("state") or None) not in states:
+            failed.append("state")
+        if terms and terms.isdisjoint(tokenize(_program_text(p))):
+            # Keywords have no facet of their own: failing them excludes everywhere
+            continue
+
+        if len(failed) > 1:
+            continue
+        for d in failed or FACET_DIMENSIONS:
+            tally = counts[d]
+            for value in _facet_values(p, d):
+                tally[value] = tally.get(value, 0) + 1
+    return _sorted_facets(counts)
+
+
+# ---------------------------------------------------------------------------
+# v10 Ranking logic – simple fit score for ordering (no safety buckets)
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class ScoringWeights:
+    """
+    Points for a full match on each fit score component.
+    """
+
+    interest: float = INTEREST_WEIGHT
+    degree: float = DEGREE_WEIGHT
+    location: float = LOCATION_WEIGHT
+
+
+DEFAULT_WEIGHTS = ScoringWeights()
+# Components as fractions of a full match (interest overlap ratio, degree
+# match, location factor); any weighting is these times its weights
+UNIT_WEIGHTS = ScoringWeights(1.0, 1.0, 1.0)
+
+
+def rank_programs(
+    profile: Dict[str, Any],
+    programs: List[Program],
+    limit: Optional[int] = None,
+    offset: int = 0,
+    weights: ScoringWeights = DEFAULT_WEIGHTS,
+    columns: Optional["ProgramColumns"] = None,
+    text: Optional["TextIndex"] = None,
+) -> List[Recommendation]:
+    """
+    Compute a fit_score used only for ordering, not for eligibility.
+
+    Components (`weights`, by default the module constants):
+      - Interest overlap (up to INTEREST_WEIGHT)
+      - Degree match (up to DEGREE_WEIGHT)
+      - Location preference alignment (up to LOCATION_WEIGHT)
+
+    fit_score is always normalized against every program passed in; with
+    `limit` set only the page [offset, offset + limit) of the ordering is
+    selected and returned.
+
+    With a keyword query ("q"), each program's BM25 relevance is scaled to
+    0..SEARCH_WEIGHT against the best match in the whole catalog (so a
+    narrow filter does not inflate it), reported as search_score_component
+    and added to fit_score for ordering only; fit_score itself never
+    includes it. `text` is the catalog's TextIndex; without it `programs`
+    is indexed on the fly and is its own catalog.
+
+    RANKING_ENGINE selects the implementation; both produce identical output.
+    The numpy engine needs `columns`, the ProgramColumns built over the
+    dataset `programs` was drawn from; without them the python engine runs.
+    """
+    offset = max(int(offset or 0), 0)
+    if limit is not None:
+        limit = max(int(limit), 0)
+
+    if RANKING_ENGINE == "numpy":
+        ranked_np = _rank_programs_numpy(profile, programs, columns, limit, offset, weights)
+        if ranked_np is not None:
+            return ranked_np
+
+    return _rank_programs_python(profile, programs, limit, offset, weights, text)
+
+
+def rank_variants(
+    profile: Dict[str, Any],
+    programs: List[Program],
+    variants: Dict[str, ScoringWeights],
+    limit: Optional[int] = None,
+    offset: int = 0,
+    columns: Optional["ProgramColumns"] = None,
+    text: Optional["TextIndex"] = None,
+) -> Dict[str, List[Recommendation]]:
+    """
+    rank_programs() once per named weighting, in one pass: the unweighted
+    components are computed once and every variant is a reweighting of
+    them. Each ranking is identical to rank_programs() with its weights
+    (`columns` and `text` as there).
+    """
+    offset = max(int(offset or 0), 0)
+    if limit is not None:
+        limit = max(int(limit), 0)
+
+    if RANKING_ENGINE == "numpy":
+        ranked_np = _rank_variants_numpy(profile, programs, columns, variants, limit, offset)
+        if ranked_np is not None:
+            return ranked_np
+
+    return _rank_variants_python(profile, programs, variants, limit, offset, text)
+
+
+def _rank_variants_python(
+    profile: Dict[str, Any],
+    programs: List[Program],
+    variants: Dict[str, ScoringWeights],
+    limit: Optional[int],
+    offset: int,
+    text: Optional["TextIndex"] = None,
+) -> Dict[str, List[Recommendation]]:
+    # rank_variants() on the reference engine: each variant scales the
+    # unit components (w * (1.0 * x) == w * x, so scores match exactly)
+    unit = _score_programs(profile, programs, UNIT_WEIGHTS)
+    if text is None and query_tokens(profile):
+        # Indexed once for all variants
+        text = TextIndex(programs)
+    ranked: Dict[str, List[Recommendation]] = {}
+    for name, w in variants.items():
+        wi, wd, wl = w.interest, w.degree, w.location
+        scored = []
+        for p, interest, degree, location, _ in unit:
+            interest, degree, location = wi * interest, wd * degree, wl * location
+            scored.append((p, interest, degree, location, interest + degree + location))
+        ranked[name] = _rank_scored(profile, programs, scored, limit, offset, text)
+    return ranked
+
+
+def _tuition_sort_value(tuition_val: Any) -> float:
+    try:
+        return (
+            float(tuition_val)
+            if tuition_val not in (None, "")
+            else float("inf")
+        )
+    except (TypeError, ValueError):
+        return float("inf")
+
+
+def _rank_programs_python(
+    profile: Dict[str, Any],
+    programs: List[Program],
+    limit: Optional[int] = None,
+    offset: int = 0,
+    weights: ScoringWeights = DEFAULT_WEIGHTS,
+    text: Optional["TextIndex"] = None,
+) -> List[Recommendation]:
+    """
+    Reference ranking engine: one pass per program with interest bitmasks,
+    then a heap selection of the requested page.
+    """
+    scored = _score_programs(profile, programs, weights)
+    return _rank_scored(profile, programs, scored, limit, offset, text)
+
+
+def _score_programs(
+    profile: Dict[str, Any],
+    programs: List[Program],
+    weights: ScoringWeights = DEFAULT_WEIGHTS,
+) -> List[tuple]:
+    """
+    (program, interest, degree, location, raw_total) per program, unrounded.
+    """
+    interests_pref = set(profile.get("interest_areas") or [])
+    degree_pref = set(profile.get("degree_levels") or [])
+    home_state = profile.get("home_state") or None
+    location_pref = (profile.get("location_pref") or "").lower()
+    pref_mask = known_interest_mask(interests_pref)
+    interest_weight, degree_weight, location_weight = (
+        weights.interest,
+        weights.degree,
+        weights.location,
+    )
+
+    # (program, interest, degree, location, raw_total) – wrapped only once selected
+    scored: List[tuple] = []
+
+    for p in programs:
+        p_degree = p.degree_key
+        p_state = p.state or None
+
+        # Interest component
+        if interests_pref:
+            overlap = bin(p.interest_mask & pref_mask).count("1")
+            ratio = overlap / len(interests_pref)
+            interest_score = interest_weight * ratio
+        else:
+            interest_score = 0.0
+
+        # Degree component
+        degree_score = degree_weight if p_degree in degree_pref else 0.0
+
+        # Location component
+        location_score = 0.0
+        if not location_pref:
+            # Slight default preference score
+            location_score = location_weight / 2
+        elif location_pref == "instate":
+            # Already filtered to in-state; give full score
+            location_score = location_weight
+        else:
+            # Graded by adjacency and centroid distance to the home state
+            location_score = location_weight * location_factor(home_state, p_state)
+
+        raw_total = interest_score + degree_score + location_score
+        scored.append((p, interest_score, degree_score, location_score, raw_total))
+
+    return scored
+
+
+def _rank_scored(
+    profile: Dict[str, Any],
+    programs: List[Program],
+    scored: List[tuple],
+    limit: Optional[int],
+    offset: int,
+    text: Optional["TextIndex"] = None,
+) -> List[Recommendation]:
+    """
+    Normalize, order and page _score_programs() output for `programs`
+    (`text` as in rank_programs).
+    """
+    if not scored:
+        return []
+
+    max_raw = max(entry[4] for entry in scored) or 1.0
+
+    fits = [int(round((entry[4] / max_raw) * 100)) for entry in scored]
+
+    # Keyword relevance, relative to the best match in the catalog
+    search: Optional[List[float]] = None
+    terms = query_tokens(profile)
+    if terms:
+        if text is None:
+            text = TextIndex(programs)
+        relevance = search_scores(terms, programs, text)
+        max_bm25 = text.top_score(terms) or 1.0
+        search = [
+            round(SEARCH_WEIGHT * relevance.get(id(entry[0]), 0.0) / max_bm25, 1)
+            for entry in scored
+        ]
+
+    # Sort by fit (plus relevance) descending, then tuition ascending, then program name
+    def _sort_key(i: int):
+        p = scored[i][0]
+        return (
+            -fits[i] if search is None else -(fits[i] + search[i]),
+            _tuition_sort_value(p.annual_tuition),
+            p.program_name or "",
+        )
+
+    if limit is None:
+        order = sorted(range(len(scored)), key=_sort_key)[offset:]
+    else:
+        # nsmallest is equivalent to sorted(...)[:n], ties included
+        order = heapq.nsmallest(offset + limit, range(len(scored)), key=_sort_key)[offset:]
+
+    ranked: List[Recommendation] = []
+    for i in order:
+        p, interest_score, degree_score, location_score, raw_total = scored[i]
+        ranked.append(
+            Recommendation(
+                p,
+                interest_score_component=round(interest_score, 1),
+                degree_score_component=round(degree_score, 1),
+                location_score_component=round(location_score, 1),
+                raw_total=raw_total,
+                fit_score=fits[i],
+                search_score_component=None if search is None else search[i],
+            )
+        )
+
+    return ranked
+
+
+def _rank_programs_numpy(
+    profile: Dict[str, Any],
+    programs: List[Program],
+    columns: Optional["ProgramColumns"],
+    limit: Optional[int] = None,
+    offset: int = 0,
+    weights: ScoringWeights = DEFAULT_WEIGHTS,
+) -> Optional[List[Recommendation]]:
+    """
+    Columnar ranking engine over `columns`.
+
+    Returns None when the columns cannot serve this call (numpy missing,
+    programs not from the columns' dataset, NaN tuition, keyword query),
+    so the caller falls back to the python engine.
+    """
+    components = _column_components(profile, programs, columns)
+    if components is None:
+        return None
+    rows, interest, degree, location = components
+    if not len(rows):
+        return []
+
+    return _rank_columns(
+        columns,
+        rows,
+        programs,
+        weights.interest * interest,
+        weights.degree * degree,
+        weights.location * location,
+        limit,
+        offset,
+    )
+
+
+def _rank_variants_numpy(
+    profile: Dict[str, Any],
+    programs: List[Program],
+    columns: Optional["ProgramColumns"],
+    variants: Dict[str, ScoringWeights],
+    limit: Optional[int],
+    offset: int,
+) -> Optional[Dict[str, List[Recommendation]]]:
+    # rank_variants() on the columns: one (variants × programs) array per
+    # component, weighted by broadcasting; None under the same conditions
+    # as _rank_programs_numpy
+    components = _column_components(profile, programs, columns)
+    if components is None:
+        return None
+    rows, interest, degree, location = components
+    if not len(rows):
+        return {name: [] for name in variants}
+
+    w = np.array(
+        [[v.interest, v.degree, v.location] for v in variants.values()], dtype=np.float64
+    ).reshape(-1, 3)
+    interest_by_variant = w[:, 0:1] * interest
+    degree_by_variant = w[:, 1:2] * degree
+    location_by_variant = w[:, 2:3] * location
+
+    return {
+        name: _rank_columns(
+            columns,
+            rows,
+            programs,
+            interest_by_variant[v],
+            degree_by_variant[v],
+            location_by_variant[v],
+            limit,
+            offset,
+        )
+        for v, name in enumerate(variants)
+    }
+
+
+def _column_components(
+    profile: Dict[str, Any],
+    programs: List[Program],
+    columns: Optional["ProgramColumns"],
+) -> Optional[tuple]:
+    """
+    (rows, interest, degree, location) of `programs` in `columns`, with each
+    component array unweighted (a fraction of a full match), or None when
+    the columns cannot serve them.
+    """
+    if query_tokens(profile):
+        return None
+    if columns is None or columns.has_nan_tuition:
+        return None
+    rows = columns.rows_for(programs)
+    if rows is None:
+        return None
+
+    interests_pref = set(profile.get("interest_areas") or [])
+    degree_pref = set(profile.get("degree_levels") or [])
+    home_state = profile.get("home_state") or None
+    location_pref = (profile.get("location_pref") or "").lower()
+
+    n = len(rows)
+
+    # Interest component
+    if interests_pref:
+        pref_codes = [
+            columns.interest_codes[a]
+            for a in interests_pref
+            if a in columns.interest_codes
+        ]
+        overlap = (
+            columns.interest_matrix[np.ix_(rows, np.array(pref_codes, dtype=np.int64))]
+            .sum(axis=1)
+        )
+        interest = overlap / len(interests_pref)
+    else:
+        interest = np.zeros(n, dtype=np.float64)
+
+    # Degree component
+    degree_codes = [
+        columns.degree_codes_map[d] for d in degree_pref if d in columns.degree_codes_map
+    ]
+    degree = np.where(np.isin(columns.degree_codes[rows], degree_codes), 1.0, 0.0)
+
+    # Location component
+    if not location_pref:
+        location = np.full(n, 0.5)
+    elif location_pref == "instate":
+        location = np.full(n, 1.0)
+    else:
+        # One factor per state code; the trailing entry serves code -1 (no state)
+        by_code = np.array(
+            [location_factor(home_state, state) for state in columns.state_codes_map]
+            + [LOCATION_FACTOR_UNKNOWN],
+            dtype=np.float64,
+        )
+        location = by_code[columns.state_codes[rows]]
+
+    return rows, interest, degree, location
+
+
+def _rank_columns(
+    columns: "ProgramColumns",
+    rows: "np.ndarray",
+    programs: List[Program],
+    interest_score: "np.ndarray",
+    degree_score: "np.ndarray",
+    location_score: "np.ndarray",
+    limit: Optional[int],
+    offset: int,
+) -> List[Recommendation]:
+    # Normalize, order and page the numpy engine's component arrays
+    raw_total = interest_score + degree_score + location_score
+
+    max_raw = float(raw_total.max()) or 1.0
+    fit_score = np.rint((raw_total / max_raw) * 100).astype(np.int64)
+
+    order = np.lexsort(
+        (columns.name_rank[rows], columns.tuition_sort[rows], -fit_score)
+    )
+    order = order[offset:] if limit is None else order[offset:offset + limit]
+
+    # Python's round(x, 1) is correctly rounded; apply it once per distinct value
+    rounded: Dict[float, float] = {}
+
+    def _round1(values: "np.ndarray") -> List[float]:
+        out = []
+        for v in values.tolist():
+            r = rounded.get(v)
+            if r is None:
+                r = rounded[v] = round(v, 1)
+            out.append(r)
+        return out
+
+    interest_out = _round1(interest_score[order])
+    degree_out = _round1(degree_score[order])
+    location_out = _round1(location_score[order])
+    raw_out = raw_total[order].tolist()
+    fit_out = fit_score[order].tolist()
+
+    ranked: List[Recommendation] = []
+    for j, k in enumerate(order.tolist()):
+        ranked.append(
+            Recommendation(
+                programs[k],
+                interest_score_component=interest_out[j],
+                degree_score_component=degree_out[j],
+                location_score_component=location_out[j],
+                raw_total=raw_out[j],
+                fit_score=fit_out[j],
+            )
+        )
+
+    return ranked
+
+
+# Interest explanation text by overlap bitmask (bits are global, so the
+# text for a non-empty overlap never depends on the rest of the profile)
+_interest_reasons_by_mask: Dict[int, str] = {}
+_INTEREST_REASON_CACHE_LIMIT = 4096
+
+
+class Explainer:
+    """
+    Per-profile explanation context shared by all Recommendations of a request.
+
+    Texts come from the same _build_*_reason helpers (so they are identical
+    to computing them eagerly), memoized by the only inputs they depend on:
+    interest overlap mask, selectivity band, and (state, tuition).
+    """
+
+    __slots__ = (
+        "interests_pref",
+        "pref_mask",
+        "home_state",
+        "max_tuition",
+        "describe_distance",
+        "gpa",
+        "_academic",
+        "_practical",
+    )
+
+    def __init__(self, profile: Dict[str, Any]):
+        self.interests_pref = frozenset(profile.get("interest_areas") or [])
+        self.pref_mask = known_interest_mask(self.interests_pref)
+        self.home_state = profile.get("home_state") or None
+        self.max_tuition = profile.get("max_tuition")
+        self.describe_distance = (
+            (profile.get("location_pref") or "").lower() in DISTANCE_REASON_PREFS
+        )
+
+        try:
+            self.gpa = float(profile.get("gpa") or 0.0)
+        except (TypeError, ValueError):
+            self.gpa = 0.0
+
+        self._academic: Dict[Optional[str], str] = {}
+        self._practical: Dict[Tuple[Optional[str], Optional[float]], str] = {}
+
+    def interests(self, program: Program) -> str:
+        overlap = program.interest_mask & self.pref_mask
+        if not overlap:
+            return _build_interests_reason(set(self.interests_pref), set())
+        text = _interest_reasons_by_mask.get(overlap)
+        if text is None:
+            text = _build_interests_reason(
+                set(self.interests_pref), set(program.interest_areas or ())
+            )
+            if len(_interest_reasons_by_mask) < _INTEREST_REASON_CACHE_LIMIT:
+                _interest_reasons_by_mask[overlap] = text
+        return text
+
+    def academic(self, program: Program) -> str:
+        band = program.selectivity_band
+        text = self._academic.get(band)
+        if text is None:
+            text = self._academic[band] = _build_academic_reason(self.gpa, band)
+        return text
+
+    def practical(self, program: Program) -> str:
+        key = (program.state or None, program.annual_tuition)
+        text = self._practical.get(key)
+        if text is None:
+            text = self._practical[key] = _build_practical_reason(
+                self.home_state, key[0], self.max_tuition, key[1], self.describe_distance
+            )
+        return text
+
+
+def build_explanations(
+    profile: Dict[str, Any],
+    programs: List[Recommendation],
+) -> List[Recommendation]:
+    """
+    Attach human-readable 'why' explanations to each ranked program.
+
+    Attaches one shared Explainer to the (request-local) Recommendation
+    views; the why_* texts are generated on first access. Bare Program
+    records are wrapped first.
+    """
+    explainer = Explainer(profile)
+
+    enriched: List[Recommendation] = []
+
+    for rec in programs:
+        if not isinstance(rec, Recommendation):
+            rec = Recommendation(rec)
+        rec.explainer = explainer
+        enriched.append(rec)
+
+    return enriched
+
+
+# ---------------------------------------------------------------------------
+# Profile builder (form → profile dict) and summaries
+# ---------------------------------------------------------------------------
+
+def build_profile_from_form(form) -> Dict[str, Any]:
+    """
+    Convert incoming form fields into a normalized profile dict (v10).
+    """
+    get = form.get
+    getlist = form.getlist
+
+    role = get("role") or ""
+    current_status = get("current_status") or ""
+    home_state = get("home_state") or ""
+    gpa_raw = get("gpa") or ""
+
+    try:
+        gpa = float(gpa_raw) if gpa_raw != "" else 0.0
+    except (TypeError, ValueError):
+        gpa = 0.0
+
+    degree_levels = [v for v in getlist("degree_levels") if v]
+    interest_areas = [v for v in getlist("interest_areas") if v]
+
+    max_tuition_raw = get("max_tuition") or ""
+    sat_raw = get("sat_score") or ""
+    act_raw = get("act_score") or ""
+    # Lowercased once here; "out_of_state_ok" is the pre-v10 name of "anywhere"
+    location_pref = (get("location_pref") or "").strip().lower()
+    if location_pref == "out_of_state_ok":
+        location_pref = "anywhere"
+    max_distance_raw = get("max_distance") or ""
+    q = (get("q") or "").strip()
+
+    try:
+        max_tuition = float(max_tuition_raw) if max_tuition_raw != "" else None
+    except (TypeError, ValueError):
+        max_tuition = None
+
+    try:
+        max_distance = float(max_distance_raw) if max_distance_raw != "" else None
+    except (TypeError, ValueError):
+        max_distance = None
+
+    try:
+        sat_score = int(sat_raw) if sat_raw != "" else None
+    except (TypeError, ValueError):
+        sat_score = None
+
+    try:
+        act_score = int(act_raw) if act_raw != "" else None
+    except (TypeError, ValueError):
+        act_score = None
+
+    profile: Dict[str, Any] = {
+        "role": role,
+        "current_status": current_status,
+        "home_state": home_state,
+        "gpa": gpa,
+        "degree_levels": degree_levels,
+        "interest_areas": interest_areas,
+        "max_tuition": max_tuition,
+        "sat_score": sat_score,
+        "act_score": act_score,
+        "location_pref": location_pref,
+        "max_distance": max_distance,
+        "q": q,
+    }
+    return profile
+
+
+class _JSONForm:
+    """
+    Read a JSON object through the form interface build_profile_from_form uses.
+    Scalars are passed as strings, as a browser form would send them.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self._data = data
+
+    @staticmethod
+    def _as_text(value: Any) -> Any:
+        if value is None or isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        return None
+
+    def get(self, key: str) -> Any:
+        return self._as_text(self._data.get(key))
+
+    def getlist(self, key: str) -> List[Any]:
+        value = self._data.get(key)
+        values = value if isinstance(value, list) else [value]
+        return [v for v in (self._as_text(v) for v in values) if v]
+
+
+def build_profile_from_json(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Same as build_profile_from_form, for a decoded JSON request body.
+    """
+    return build_profile_from_form(_JSONForm(data))
+
+
+def summarize_profile(profile: Optional[Dict[str, Any]]) -> str:
+    """
+    Build a short human-readable summary for the Recommendations tab header.
+    """
+    if not profile:
+        return ""
+
+    parts: List[str] = []
+
+    role = (profile.get("role") or "").lower()
+    if role == "student":
+        parts.append("Student")
+    elif role == "parent":
+        parts.append("Parent")
+
+    home_state = profile.get("home_state")
+    if home_state:
+        if parts:
+            parts[-1] = f"{parts[-1]} from {home_state}"
+        else:
+            parts.append(f"From {home_state}")
+
+    gpa = profile.get("gpa")
+    try:
+        gpa_val = float(gpa)
+        if gpa_val > 0:
+            parts.append(f"GPA {gpa_val:.1f}")
+    except (TypeError, ValueError):
+        pass
+
+    degree_levels = profile.get("degree_levels") or []
+    if degree_levels:
+        parts.append(", ".join(degree_levels))
+
+    interests = profile.get("interest_areas") or []
+    if interests:
+        parts.append(", ".join(interests))
+
+    max_tuition = profile.get("max_tuition")
+    if isinstance(max_tuition, (int, float)) and max_tuition > 0:
+        parts.append(f"Max tuition ~${max_tuition:,.0f}/year")
+
+    return " · ".join(parts)
+
+
+def summarize_constraints(profile: Optional[Dict[str, Any]]) -> str:
+    """
+    Explicit summary of hard constraints applied in filtering.
+    """
+    if not profile:
+        return ""
+
+    parts: List[str] = []
+
+    degree_levels = profile.get("degree_levels") or []
+    interests = profile.get("interest_areas") or []
+    max_tuition = profile.get("max_tuition")
+    home_state = profile.get("home_state")
+    location_pref = (profile.get("location_pref") or "").lower()
+
+    if degree_levels:
+        parts.append("Degree: " + ", ".join(degree_levels))
+
+    if interests:
+        parts.append("Interests: " + ", ".join(interests))
+
+    if isinstance(max_tuition, (int, float)) and max_tuition > 0:
+        parts.append(f"Tuition ≤ ${max_tuition:,.0f}/year")
+
+    if location_pref == "instate" and home_state:
+        parts.append(f"In-state only ({home_state})")
+    elif location_pref == "neighbors" and home_state:
+        parts.append(f"{home_state} or a neighboring state")
+    elif location_pref == "nearby" and home_state and _max_distance(profile) is not None:
+        parts.append(f"Within {_max_distance(profile):,.0f} miles of {home_state}")
+    elif location_pref == "anywhere":
+        parts.append("Anywhere in the U.S.")
+
+    if query_tokens(profile):
+        parts.append(f"Keywords: “{profile.get('q', '').strip()}”")
+
+    return " · ".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Ranking experiments – weight arms assigned per session
+# ---------------------------------------------------------------------------
+
+class Experiment:
+    """
+    Named set of ScoringWeights arms. A session id is hashed together with
+    the experiment name onto the arms' shares, so a session stays in its arm
+    across requests, processes and restarts, and a new experiment name
+    reshuffles every session.
+
+    File format (EXPERIMENT_PATH; also read by `evaluate-weights`):
+
+        {"name": "location-2026-10",
+         "arms": {"control": {"share": 2},
+                  "location_heavy": {"interest": 60, "location": 20}}}
+
+    Omitted weights default to the module constants and "share" to 1.
+    """
+
+    __slots__ = ("name", "arms", "_bounds", "_total")
+
+    def __init__(self, name: str, arms: Dict[str, ScoringWeights], shares: Dict[str, int]):
+        self.name = name
+        self.arms = arms
+        self._bounds: List[int] = []
+        total = 0
+        for arm in arms:
+            total += shares[arm]
+            self._bounds.append(total)
+        self._total = total
+
+    @classmethod
+    def from_dict(cls, raw: Any) -> "Experiment":
+        """
+        Validate a parsed experiment file. Raises ValueError.
+        """
+        if not isinstance(raw, dict) or not isinstance(raw.get("arms"), dict) or not raw["arms"]:
+            raise ValueError('expected an object with a non-empty "arms" object')
+        arms: Dict[str, ScoringWeights] = {}
+        shares: Dict[str, int] = {}
+        for arm, spec in raw["arms"].items():
+            if not isinstance(spec, dict):
+                raise ValueError(f"arm {arm!r}: expected an object")
+            values = {}
+            for field in ("interest", "degree", "location"):
+                value = spec.get(field, getattr(DEFAULT_WEIGHTS, field))
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or not (
+                    0 <= value < math.inf
+                ):
+                    raise ValueError(f"arm {arm!r}: {field} must be a non-negative number")
+                values[field] = float(value)
+            if not any(values.values()):
+                raise ValueError(f"arm {arm!r}: at least one weight must be positive")
+            share = spec.get("share", 1)
+            if isinstance(share, bool) or not isinstance(share, int) or share < 0:
+                raise ValueError(f"arm {arm!r}: share must be a non-negative integer")
+            arms[str(arm)] = ScoringWeights(**values)
+            shares[str(arm)] = share
+        if not sum(shares.values()):
+            raise ValueError("at least one arm needs a positive share")
+        return cls(str(raw.get("name") or "experiment"), arms, shares)
+
+    def assign(self, session_id: str) -> str:
+        digest = hashlib.sha256(f"{self.name}\0{session_id}".encode("utf-8")).digest()
+        point = int.from_bytes(digest[:8], "big") % self._total
+        return list(self.arms)[bisect.bisect_right(self._bounds, point)]
+
+
+def load_experiment(path: str) -> Experiment:
+    """
+    Read an experiment file. Raises ValueError naming the file.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return Experiment.from_dict(json.load(f))
+    except (OSError, ValueError) as exc:
+        raise ValueError(f"Invalid experiment file {path}: {exc}") from exc
+
+
+_experiment: Optional[Experiment] = None
+_experiment_mtime: Optional[float] = None
+_experiment_lock = threading.Lock()
+
+
+def current_experiment() -> Optional[Experiment]:
+    """
+    The experiment in EXPERIMENT_PATH, or None when none is configured.
+
+    The file is re-read when its mtime changes (one stat call per request),
+    so arms can be added, reweighted or stopped without a redeploy. A
+    missing or invalid file keeps the last good experiment.
+    """
+    global _experiment, _experiment_mtime
+    if EXPERIMENT_PATH is None:
+        return None
+    try:
+        mtime = os.stat(EXPERIMENT_PATH).st_mtime
+    except OSError:
+        return _experiment
+    if mtime != _experiment_mtime:
+        with _experiment_lock:
+            if mtime != _experiment_mtime:
+                _experiment_mtime = mtime
+                try:
+                    _experiment = load_experiment(EXPERIMENT_PATH)
+                except ValueError as exc:
+                    print(f"[WARN] {exc}; keeping the previous experiment")
+                else:
+                    print(f"[INFO] Loaded experiment {_experiment.name!r} ({', '.join(_experiment.arms)})")
+    return _experiment
+
+
+def session_arm(session_id: Optional[str] = None) -> Tuple[Optional[Experiment], Optional[str]]:
+    """
+    (experiment, arm) for a session, or (None, None) without an experiment.
+    Defaults to the browser session's id, which is created on first use.
+    """
+    experiment = current_experiment()
+    if experiment is None:
+        return None, None
+    if session_id is None:
+        session_id = session.get("v10_session_id")
+        if session_id is None:
+            session_id = session["v10_session_id"] = secrets.token_urlsafe(12)
+    return experiment, experiment.assign(session_id)
+
+
+# ---------------------------------------------------------------------------
+# Recommendation cache – LRU + TTL keyed by profile fingerprint
+# ---------------------------------------------------------------------------
+
+def _gpa_bucket(gpa_value: Any) -> Tuple[str, ...]:
+    """
+    Collapse a GPA to the distinctions _build_academic_reason can make:
+    one verdict per selectivity target GPA.
+    """
+    try:
+        gpa = float(gpa_value or 0.0)
+    except (TypeError, ValueError):
+        gpa = 0.0
+
+    return tuple(
+        _academic_verdict(gpa, band)
+        for band in ("highly_selective", "selective", "moderate", "open")
+    )
+
+
+def profile_fingerprint(profile: Dict[str, Any]) -> str:
+    """
+    Canonical hash of the profile fields that affect recommendations.
+    Profiles that would produce identical results share a fingerprint.
+    """
+    max_tuition = profile.get("max_tuition")
+    if not (isinstance(max_tuition, (int, float)) and max_tuition > 0):
+        max_tuition = None
+    else:
+        max_tuition = float(max_tuition)
+
+    location_pref = (profile.get("location_pref") or "").lower()
+    canonical = {
+        "degree_levels": sorted(set(profile.get("degree_levels") or [])),
+        "interest_areas": sorted(set(profile.get("interest_areas") or [])),
+        "home_state": profile.get("home_state") or None,
+        "location_pref": location_pref,
+        "max_distance": _max_distance(profile) if location_pref == "nearby" else None,
+        "max_tuition": max_tuition,
+        "gpa_bucket": list(_gpa_bucket(profile.get("gpa"))),
+        "query": list(query_tokens(profile)),
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:32]
+
+
+class RecommendationCache:
+    """
+    Bounded, thread-safe LRU cache whose entries also expire after `ttl` seconds.
+    Cleared whenever the dataset is (re)loaded.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+recommendation_cache = RecommendationCache(
+    RECOMMENDATION_CACHE_SIZE, RECOMMENDATION_CACHE_TTL
+)
+# Serialized program records for the details endpoint, keyed by (version, position)
+program_json_cache = RecommendationCache(
+    PROGRAM_DETAILS_CACHE_SIZE, PROGRAM_DETAILS_CACHE_TTL
+)
+
+
+# ---------------------------------------------------------------------------
+# Result handles – stored scores for incremental refinement
+# ---------------------------------------------------------------------------
+
+# Profile fields refine_results() can change without a full recompute
+REFINABLE_FIELDS = frozenset({"max_tuition", "interest_areas", "degree_levels"})
+
+
+class ResultState:
+    """
+    One profile's eligible programs in a snapshot, as dataset positions in
+    dataset order, with each program's unrounded score components in
+    parallel arrays. Never mutated once built.
+
+    The components are scored with `weights`; `experiment` and `arm` name
+    the experiment arm they came from (None without one), so refinements
+    keep ranking and tagging results the same way.
+    """
+
+    __slots__ = (
+        "version",
+        "profile",
+        "positions",
+        "interest",
+        "degree",
+        "location",
+        "weights",
+        "experiment",
+        "arm",
+    )
+
+    def __init__(
+        self,
+        version: int,
+        profile: Dict[str, Any],
+        positions: Iterable[int],
+        interest: Iterable[float],
+        degree: Iterable[float],
+        location: Iterable[float],
+        weights: ScoringWeights = DEFAULT_WEIGHTS,
+        experiment: Optional[str] = None,
+        arm: Optional[str] = None,
+    ):
+        self.version = version
+        self.profile = profile
+        self.positions = array.array("I", positions)
+        self.interest = array.array("d", interest)
+        self.degree = array.array("d", degree)
+        self.location = array.array("d", location)
+        self.weights = weights
+        self.experiment = experiment
+        self.arm = arm
+
+    @classmethod
+    def compute(
+        cls,
+        profile: Dict[str, Any],
+        snapshot: ProgramSnapshot,
+        weights: ScoringWeights = DEFAULT_WEIGHTS,
+        experiment: Optional[str] = None,
+        arm: Optional[str] = None,
+    ) -> "ResultState":
+        """
+        Filter and score from scratch.
+        """
+        positions = snapshot.index.filter_positions(profile)
+        scored = _score_programs(profile, [snapshot.programs[i] for i in positions], weights)
+        return cls(
+            snapshot.version,
+            profile,
+            positions,
+            [entry[1] for entry in scored],
+            [entry[2] for entry in scored],
+            [entry[3] for entry in scored],
+            weights,
+            experiment,
+            arm,
+        )
+
+    @property
+    def experiment_info(self) -> Dict[str, Any]:
+        # Response fields naming the experiment arm, as api_recommendations adds them
+        if self.experiment is None:
+            return {}
+        return {"experiment": {"name": self.experiment, "arm": self.arm}}
+
+    @property
+    def total(self) -> int:
+        return len(self.positions)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            a.itemsize * len(a)
+            for a in (self.positions, self.interest, self.degree, self.location)
+        )
+
+    def entries(self) -> Iterator[Tuple[int, float, float, float]]:
+        return zip(self.positions, self.interest, self.degree, self.location)
+
+    def rank(
+        self,
+        snapshot: ProgramSnapshot,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> List[Recommendation]:
+        """
+        rank_programs() over the stored eligible set, from the stored scores
+        (RANKING_ENGINE picks the engine, as in rank_programs).
+        """
+        offset = max(int(offset or 0), 0)
+        eligible = [snapshot.programs[i] for i in self.positions]
+        columns = snapshot.columns
+        if (
+            RANKING_ENGINE == "numpy"
+            and columns is not None
+            and not columns.has_nan_tuition
+            and not query_tokens(self.profile)
+        ):
+            if not eligible:
+                return []
+            return _rank_columns(
+                columns,
+                np.frombuffer(self.positions, dtype=np.uint32).astype(np.int64),
+                eligible,
+                np.frombuffer(self.interest, dtype=np.float64),
+                np.frombuffer(self.degree, dtype=np.float64),
+                np.frombuffer(self.location, dtype=np.float64),
+                limit,
+                offset,
+            )
+        scored = [
+            (p, interest, degree, location, interest + degree + location)
+            for p, interest, degree, location in zip(
+                eligible, self.interest, self.degree, self.location
+            )
+        ]
+        return _rank_scored(self.profile, eligible, scored, limit, offset, snapshot.index.text)
+
+
+def _result_fields(profile: Dict[str, Any]) -> Dict[str, Any]:
+    # Profile values that decide eligibility and scores, normalized
+    max_tuition = profile.get("max_tuition")
+    location_pref = (profile.get("location_pref") or "").lower()
+    return {
+        "max_tuition": (
+            float(max_tuition)
+            if isinstance(max_tuition, (int, float)) and max_tuition > 0
+            else None
+        ),
+        "interest_areas": frozenset(profile.get("interest_areas") or []),
+        "degree_levels": frozenset(profile.get("degree_levels") or []),
+        "home_state": profile.get("home_state") or None,
+        "location_pref": location_pref,
+        "max_distance": _max_distance(profile) if location_pref == "nearby" else None,
+        "q": query_tokens(profile),
+    }
+
+
+def refine_results(
+    state: ResultState,
+    profile: Dict[str, Any],
+    snapshot: ProgramSnapshot,
+) -> Tuple[ResultState, bool]:
+    """
+    ResultState for `profile`, reusing `state` (built for the same snapshot)
+    when only REFINABLE_FIELDS changed. Returns (state, incremental).
+
+    Stored programs are re-checked only against constraints that were
+    tightened, and new candidates are looked up only where one was
+    loosened: the newly admitted tuition range, or the postings of added
+    interests or degrees. Interest and degree components are rescored only
+    when those fields changed, and location components are always kept.
+    The result is identical to ResultState.compute() for the new profile
+    with the state's weights, and keeps the state's experiment arm.
+    """
+    weights = state.weights
+    before, after = _result_fields(state.profile), _result_fields(profile)
+    changed = {field for field in after if after[field] != before[field]}
+    if not changed <= REFINABLE_FIELDS or any(
+        before[field] and not after[field] for field in ("interest_areas", "degree_levels")
+    ):
+        # Other fields, or a list constraint dropped entirely (admits nearly everything)
+        return ResultState.compute(profile, snapshot, weights, state.experiment, state.arm), False
+
+    index = snapshot.index
+    programs = snapshot.programs
+    old_budget, new_budget = before["max_tuition"], after["max_tuition"]
+    interests_pref = set(after["interest_areas"])
+    degree_pref = after["degree_levels"]
+
+    # Programs a tightened constraint may now exclude
+    checks: List[Callable[[int], bool]] = []
+    if new_budget is not None and (old_budget is None or new_budget < old_budget):
+        tuition_by_id = index.tuition_by_id
+        checks.append(lambda i: i in tuition_by_id and not tuition_by_id[i] > new_budget)
+    pref_mask = known_interest_mask(interests_pref)
+    # An empty list is no constraint, so starting one also tightens
+    tightened = {
+        field
+        for field in ("interest_areas", "degree_levels")
+        if after[field] and (not before[field] or before[field] - after[field])
+    }
+    if "interest_areas" in tightened:
+        checks.append(lambda i: programs[i].interest_mask & pref_mask)
+    if "degree_levels" in tightened:
+        checks.append(lambda i: programs[i].degree_key in degree_pref)
+
+    positions: List[int] = list(state.positions)
+    interest: List[float] = list(state.interest)
+    degree: List[float] = list(state.degree)
+    location: List[float] = list(state.location)
+    for check in checks:
+        keep = [j for j, i in enumerate(positions) if check(i)]
+        positions = [positions[j] for j in keep]
+        interest = [interest[j] for j in keep]
+        degree = [degree[j] for j in keep]
+        location = [location[j] for j in keep]
+
+    if "interest_areas" in changed:
+        # As _score_programs computes it, once per distinct interest mask
+        masks = [programs[i].interest_mask for i in positions]
+        score_of = {
+            mask: weights.interest * (bin(mask & pref_mask).count("1") / len(interests_pref))
+            for mask in set(masks)
+        }
+        interest = [score_of[mask] for mask in masks]
+    if "degree_levels" in changed:
+        degree = [weights.degree if programs[i].degree_key in degree_pref else 0.0 for i in positions]
+
+    # Programs a loosened constraint may now admit
+    candidates: Set[int] = set()
+    if old_budget is not None and (new_budget is None or new_budget > old_budget):
+        start = bisect.bisect_right(index.tuition_values, old_budget)
+        stop = (
+            len(index.tuition_values)
+            if new_budget is None
+            else bisect.bisect_right(index.tuition_values, new_budget)
+        )
+        candidates.update(index.tuition_ids[start:stop])
+        if new_budget is None:
+            candidates |= index.tuition_unknown_ids
+    for field, postings in (("interest_areas", index.by_interest), ("degree_levels", index.by_degree)):
+        if before[field]:
+            for key in after[field] - before[field]:
+                candidates |= postings.get(key, set())
+
+    if candidates:
+        candidates.difference_update(state.positions)
+        added = sorted(index.restrict(candidates, profile))
+        if added:
+            scored = _score_programs(profile, [programs[i] for i in added], weights)
+            positions += added
+            interest += [entry[1] for entry in scored]
+            degree += [entry[2] for entry in scored]
+            location += [entry[3] for entry in scored]
+            # Two sorted runs: a linear merge for Timsort
+            order = sorted(range(len(positions)), key=positions.__getitem__)
+            positions = [positions[j] for j in order]
+            interest = [interest[j] for j in order]
+            degree = [degree[j] for j in order]
+            location = [location[j] for j in order]
+
+    refined = ResultState(
+        snapshot.version,
+        profile,
+        positions,
+        interest,
+        degree,
+        location,
+        weights,
+        state.experiment,
+        state.arm,
+    )
+    return refined, True
+
+
+class ResultHandleStore:
+    """
+    Thread-safe LRU of ResultState by opaque handle. Bounded by the total
+    size of the stored arrays rather than a count, and every handle
+    expires after `ttl` seconds. Cleared whenever the dataset is (re)loaded.
+    """
+
+    def __init__(self, budget_bytes: int, ttl: float):
+        self.budget_bytes = budget_bytes
+        self.ttl = ttl
+        self.used_bytes = 0
+        self._entries: "OrderedDict[str, Tuple[float, ResultState]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, handle: str) -> Optional[ResultState]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                self._drop(handle)
+                return None
+            self._entries.move_to_end(handle)
+            return entry[1]
+
+    def put(self, state: ResultState) -> Optional[str]:
+        """
+        Store `state` and return its new handle, or None if it alone
+        exceeds the budget.
+        """
+        size = state.nbytes
+        if size > self.budget_bytes:
+            return None
+        handle = secrets.token_urlsafe(12)
+        now = time.monotonic()
+        with self._lock:
+            while self._entries and next(iter(self._entries.values()))[0] <= now:
+                self._drop(next(iter(self._entries)))
+            self._entries[handle] = (now + self.ttl, state)
+            self.used_bytes += size
+            while self.used_bytes > self.budget_bytes:
+                self._drop(next(iter(self._entries)))
+        return handle
+
+    def _drop(self, handle: str) -> None:
+        _, state = self._entries.pop(handle)
+        self.used_bytes -= state.nbytes
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+
+result_handles = ResultHandleStore(RESULT_HANDLE_BUDGET_BYTES, RESULT_HANDLE_TTL)
+
+
+# ---------------------------------------------------------------------------
+# Static assets – fingerprinted, precompressed, served from memory
+# ---------------------------------------------------------------------------
+
+class StaticAsset:
+    """
+    One file from STATIC_ASSETS, read once: its content hash, fingerprinted
+    name (style_v10.<hash>.css) and every encoding worth sending, keyed by
+    Content-Encoding ("identity", "gzip", "zstd").
+    """
+
+    __slots__ = ("filename", "hashed_name", "etag", "mimetype", "mtime", "variants")
+
+    def __init__(self, filename: str):
+        path = os.path.join(BASE_DIR, filename)
+        self.mtime = os.stat(path).st_mtime
+        with open(path, "rb") as f:
+            data = f.read()
+
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(filename)
+        self.filename = filename
+        self.hashed_name = f"{stem}.{digest}{ext}"
+        self.etag = digest
+        self.mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+        self.variants: Dict[str, bytes] = {"identity": data}
+        compressed = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+        if zstandard is not None:
+            compressed["zstd"] = zstandard.ZstdCompressor(level=19).compress(data)
+        for encoding, body in compressed.items():
+            # Tiny files can grow when compressed
+            if len(body) < len(data):
+                self.variants[encoding] = body
+
+    def negotiate(self, accept_encodings: Any) -> str:
+        """
+        Best encoding the client accepts: zstd, then gzip, then identity.
+        `accept_encodings` is request.accept_encodings (q=0 refuses).
+        """
+        for encoding in ("zstd", "gzip"):
+            if encoding in self.variants and accept_encodings[encoding] > 0:
+                return encoding
+        return "identity"
+
+
+_static_assets: Optional[Dict[str, StaticAsset]] = None
+_static_lock = threading.Lock()
+
+
+def static_assets() -> Dict[str, StaticAsset]:
+    """
+    STATIC_ASSETS by original filename, built on first use. In debug mode
+    an edited file is picked up on the next call.
+    """
+    global _static_assets
+    assets = _static_assets
+    stale = None
+    if assets is not None and app.debug:
+        try:
+            if any(
+                os.stat(os.path.join(BASE_DIR, a.filename)).st_mtime != a.mtime
+                for a in assets.values()
+            ):
+                stale, assets = assets, None
+        except OSError:
+            stale, assets = assets, None
+    if assets is None:
+        with _static_lock:
+            # Another thread may have built them while this one waited
+            assets = _static_assets
+            if assets is None or assets is stale:
+                assets = {name: StaticAsset(name) for name in STATIC_ASSETS}
+                _static_assets = assets
+    return assets
+
+
+@app.url_defaults
+def _fingerprint_static_url(endpoint: str, values: Dict[str, Any]) -> None:
+    # url_for("static", filename="main_v10.js") → /static/main_v10.<hash>.js
+    if endpoint == "static":
+        asset = static_assets().get(values.get("filename", ""))
+        if asset is not None:
+            values["filename"] = asset.hashed_name
+
+
+@app.route(f"{STATIC_URL_PATH}/<path:filename>", endpoint="static")
+def static_file(filename: str):
+    """
+    Serve a STATIC_ASSETS file in the encoding the client prefers.
+
+    Fingerprinted names are cached as immutable. The plain name still
+    works (for links that bypass url_for) but must be revalidated via
+    its ETag. Any other path is a 404.
+    """
+    assets = static_assets()
+    asset = assets.get(filename)
+    immutable = False
+    if asset is None:
+        asset = next((a for a in assets.values() if a.hashed_name == filename), None)
+        immutable = asset is not None
+    if asset is None:
+        return app.response_class("Not found.\n", status=404, mimetype="text/plain")
+
+    encoding = asset.negotiate(request.accept_encodings)
+    response = app.response_class(asset.variants[encoding], mimetype=asset.mimetype)
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = STATIC_CACHE_CONTROL if immutable else "no-cache"
+    # One ETag per encoding: the bodies differ
+    response.set_etag(asset.etag if encoding == "identity" else f"{asset.etag}-{encoding}")
+    return response.make_conditional(request)
+
+
+# ---------------------------------------------------------------------------
+# Traffic capture – anonymized profiles appended off the request thread
+# ---------------------------------------------------------------------------
+
+LOCATION_PREFS = ("", "instate", "neighbors", "nearby", "anywhere")
+_CATEGORY_RE = re.compile(r"[a-z_]{1,40}")
+
+
+def _rounded(value: Any, step: float) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    return round(round(value / step) * step, 1)
+
+
+def anonymize_profile(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Capturable copy of a build_profile_from_form() profile: only values the
+    form offers survive, numbers are coarsened (GPA to 0.1, budget to $500,
+    distance to 10 miles), test scores (unused by the pipeline) are dropped,
+    and "q" keeps only words that occur in the dataset, so free text typed
+    by a user is never written out.
+    """
+    snapshot = _snapshot
+    vocabulary = snapshot.index.text.postings if snapshot is not None else {}
+    role = profile.get("role") or ""
+    status = profile.get("current_status") or ""
+    home_state = profile.get("home_state") or ""
+    location_pref = (profile.get("location_pref") or "").lower()
+    gpa = _rounded(profile.get("gpa"), 0.1)
+    return {
+        "role": role if _CATEGORY_RE.fullmatch(role) else "",
+        "current_status": status if _CATEGORY_RE.fullmatch(status) else "",
+        "home_state": home_state if home_state in US_STATES else "",
+        "gpa": min(max(gpa, 0.0), 5.0) if gpa is not None else 0.0,
+        "degree_levels": [d for d in profile.get("degree_levels") or [] if d in DEGREE_OPTIONS],
+        "interest_areas": [a for a in profile.get("interest_areas") or [] if a in INTEREST_OPTIONS],
+        "max_tuition": _rounded(profile.get("max_tuition"), 500.0),
+        "sat_score": None,
+        "act_score": None,
+        "location_pref": location_pref if location_pref in LOCATION_PREFS else "",
+        "max_distance": _rounded(profile.get("max_distance"), 10.0),
+        "q": " ".join(t for t in tokenize(profile.get("q") or "") if t in vocabulary),
+    }
+
+
+class CaptureWriter:
+    """
+    Appends captured profiles to a JSONL file, one per line: the
+    anonymize_profile() fields plus "captured_at" (Unix time) and
+    "endpoint", so the file replays with replay_v10.py and can be fed to
+    `batch` or `evaluate-weights` as is.
+
+    submit() only enqueues; a background thread anonymizes, serializes and
+    appends everything queued once per `flush_interval`, in one write. When
+    the queue is full, profiles are dropped and counted instead of blocking
+    the request. Each forked worker starts its own thread and appends to the
+    same file (append mode keeps each write's lines whole).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        queue_size: int = CAPTURE_QUEUE_SIZE,
+        flush_interval: float = CAPTURE_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def submit(self, endpoint: str, profile: Dict[str, Any], **extra: Any) -> None:
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait((time.time(), endpoint, profile, extra))
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked: the queued items belong to the parent, and its thread is gone
+                self._queue = queue.Queue(self._queue.maxsize)
+                self.written = self.dropped = 0
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [item for item in batch if item is not None]
+            if batch:
+                self._write(batch)
+            if not stopping:
+                time.sleep(self.flush_interval)
+
+    def _write(self, batch: List[tuple]) -> None:
+        lines = []
+        for captured_at, endpoint, profile, extra in batch:
+            record = anonymize_profile(profile)
+            record.update(extra)
+            record["captured_at"] = round(captured_at, 3)
+            record["endpoint"] = endpoint
+            lines.append(_dumps_line(record))
+        try:
+            with open(self.path, "ab") as f:
+                f.write(b"".join(lines))
+        except OSError as exc:
+            print(f"[WARN] Traffic capture to {self.path} failed: {exc}")
+            return
+        self.written += len(lines)
+
+    def close(self) -> None:
+        """
+        Write everything still queued and stop the thread (run at exit).
+        """
+        thread = self._thread
+        if thread is None or self._pid != os.getpid() or not thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=self.flush_interval)
+        except queue.Full:
+            pass
+        thread.join(timeout=self.flush_interval + 5.0)
+        print(f"[INFO] Traffic capture: {self.written} profiles written, {self.dropped} dropped")
+
+
+capture_writer: Optional[CaptureWriter] = CaptureWriter(CAPTURE_PATH) if CAPTURE_PATH else None
+
+
+# ---------------------------------------------------------------------------
+# Request profiling – cProfile or stack sampling, tracemalloc per stage
+# ---------------------------------------------------------------------------
+#
+# Only active when PROFILE_DIR is set. Otherwise the request hooks are not
+# registered and the pipeline pays one global lookup, as with metrics.
+
+PROFILING_ENABLED = PROFILE_DIR is not None
+PROFILE_ID_RE = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9]+-[0-9]+$")
+PROFILE_DATA_SUFFIXES = {"cprofile": ".pstats", "sample": ".collapsed"}
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack every `interval` seconds into
+    collapsed stacks ("outer;inner count" per line, as flamegraph.pl and
+    speedscope read them).
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.counts.items()))
+
+
+class RequestProfile:
+    """
+    Profile of one request: cProfile (or a StackSampler) on the request
+    thread, plus wall time and tracemalloc peak for each pipeline stage.
+
+    mark(stage) closes the stage that is running; the stages of a page
+    request are request, filter, rank, explain, view and render (filter to
+    explain only run on a recommendation cache miss).
+    """
+
+    _sequence = 0
+    _sequence_lock = threading.Lock()
+
+    def __init__(self, mode: str):
+        with RequestProfile._sequence_lock:
+            RequestProfile._sequence += 1
+            sequence = RequestProfile._sequence
+        self.started_at = time.time()
+        self.profile_id = (
+            time.strftime("%Y%m%dT%H%M%S", time.gmtime(self.started_at))
+            + f"-{os.getpid()}-{sequence}"
+        )
+        self.mode = mode
+        self.method = request.method
+        self.path = request.path
+        self.endpoint = request.endpoint
+        self.status: Optional[int] = None
+        self.stages: List[Dict[str, Any]] = []
+
+        # tracemalloc first, so starting it is neither profiled nor counted
+        self._owns_tracemalloc = not tracemalloc.is_tracing()
+        if self._owns_tracemalloc:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        self._stage_started = self._started = time.perf_counter()
+
+        self._profiler: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+        if mode == "sample":
+            self._sampler = StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+            self._sampler.start()
+        else:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter()
+        current, peak = tracemalloc.get_traced_memory()
+        self.stages.append(
+            {
+                "stage": stage,
+                "ms": round((now - self._stage_started) * 1000.0, 3),
+                # Most memory allocated at once during the stage, over what it started with
+                "peak_alloc_bytes": max(peak - self._baseline, 0),
+            }
+        )
+        tracemalloc.reset_peak()
+        self._baseline = current
+        self._stage_started = now
+
+    def finish(self, directory: str) -> str:
+        """
+        Stop profiling, write the profile and its metadata to `directory`
+        and return the metadata path.
+        """
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+        self.mark("render")
+        duration = time.perf_counter() - self._started
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.profile_id)
+        data_path = base + PROFILE_DATA_SUFFIXES[self.mode]
+        if self._profiler is not None:
+            self._profiler.dump_stats(data_path)
+        else:
+            with open(data_path, "w", encoding="utf-8") as f:
+                f.write(self._sampler.collapsed())
+
+        meta = {
+            "id": self.profile_id,
+            "mode": self.mode,
+            "file": os.path.basename(data_path),
+            "method": self.method,
+            "path": self.path,
+            "endpoint": self.endpoint,
+            "status": self.status,
+            "started_at": round(self.started_at, 3),
+            "duration_ms": round(duration * 1000.0, 3),
+            "peak_alloc_bytes": max(stage["peak_alloc_bytes"] for stage in self.stages),
+            "stages": self.stages,
+        }
+        if self._sampler is not None:
+            meta["samples"] = sum(self._sampler.counts.values())
+        # Metadata last and atomically: listed profiles always have their data
+        tmp_path = f"{base}.json.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_path, base + ".json")
+        return base + ".json"
+
+
+# One profiled request at a time per process: tracemalloc is process-wide
+_profile_slot = threading.Lock()
+
+
+def _profile_authorized() -> bool:
+    header = request.headers.get(PROFILE_HEADER)
+    if PROFILE_TOKEN is None or header is None:
+        return False
+    return secrets.compare_digest(header.encode("utf-8"), PROFILE_TOKEN.encode("utf-8"))
+
+
+def _start_request_profile() -> None:
+    if request.endpoint in (None, "static", "profiles_index", "profile_data"):
+        return
+    if not _profile_authorized() and not (
+        PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    ):
+        return
+    # Busy with another request: this one goes unprofiled rather than waiting
+    if not _profile_slot.acquire(blocking=False):
+        return
+    try:
+        g.request_profile = RequestProfile("sample" if PROFILE_MODE == "sample" else "cprofile")
+    except Exception:
+        _profile_slot.release()
+        raise
+
+
+def _tag_request_profile(response: Response) -> Response:
+    current = g.pop("request_profile", None)
+    if current is not None:
+        current.status = response.status_code
+        if _profile_authorized():
+            response.headers["X-Course-Finder-Profile-Id"] = current.profile_id
+        # Called once the server has sent the whole body, so a streamed
+        # page's rendering is part of the profile
+        response.call_on_close(lambda: _finish_request_profile(current))
+    return response
+
+
+def _abandon_request_profile(exc: Optional[BaseException]) -> None:
+    # A request that failed without a response still gets its profile written
+    current = g.pop("request_profile", None)
+    if current is not None:
+        current.status = 500
+        _finish_request_profile(current)
+
+
+def _finish_request_profile(current: RequestProfile) -> None:
+    try:
+        current.finish(PROFILE_DIR)
+        prune_profiles(PROFILE_DIR, PROFILE_RETENTION)
+    except OSError as err:
+        print(f"[WARN] Could not write request profile: {err}")
+    finally:
+        _profile_slot.release()
+
+
+def mark_profile_stage(stage: str) -> None:
+    """
+    End the running stage of this request's profile, if it is profiled.
+    Callers check PROFILING_ENABLED first.
+    """
+    if has_request_context():
+        current = g.get("request_profile")
+        if current is not None:
+            current.mark(stage)
+
+
+def list_profiles(directory: str) -> List[Dict[str, Any]]:
+    """
+    Metadata of the profiles in `directory`, newest first.
+    """
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith(".json")]
+    except FileNotFoundError:
+        return []
+    profiles = []
+    for name in names:
+        try:
+            with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # pruned meanwhile, or not ours
+    profiles.sort(key=lambda meta: meta.get("started_at", 0), reverse=True)
+    return profiles
+
+
+def prune_profiles(directory: str, keep: int) -> int:
+    """
+    Delete all but the newest `keep` profiles; returns how many were deleted.
+    Workers sharing the directory may prune concurrently.
+    """
+    deleted = 0
+    for meta in list_profiles(directory)[keep:]:
+        for name in (meta.get("id", "") + ".json", meta.get("file", "")):
+            try:
+                os.remove(os.path.join(directory, os.path.basename(name)))
+            except OSError:
+                pass
+        deleted += 1
+    return deleted
+
+
+# ---------------------------------------------------------------------------
+# Routes
+# ---------------------------------------------------------------------------
+
+def recommend_page(
+    profile: Dict[str, Any],
+    snapshot: ProgramSnapshot,
+    offset: int = 0,
+    limit: Optional[int] = RECOMMENDATIONS_PAGE_SIZE,
+    experiment: Optional[Experiment] = None,
+    arm: Optional[str] = None,
+) -> Tuple[List[Recommendation], int]:
+    """
+    Filter → rank → explain for one page of `snapshot`'s results.
+    Returns (explained page, total number of eligible programs).
+
+    With an experiment, the page is ranked with `arm`'s weights. A miss
+    ranks every arm in one rank_variants() pass and caches each arm's page,
+    so the profile's other arms are then served from the cache as well.
+
+    Pages are served from recommendation_cache, keyed by snapshot version
+    and weights; the cached lists are shared between requests and must not
+    be mutated.
+    """
+    variants = {arm: DEFAULT_WEIGHTS} if experiment is None else experiment.arms
+    base_key = (snapshot.version, profile_fingerprint(profile), offset, limit)
+    key = base_key + (variants[arm],)
+    cached = recommendation_cache.get(key)
+    if cached is not None:
+        if METRICS_ENABLED:
+            _observe_counts(*cached)
+            if has_request_context():
+                g.setdefault("server_timing", []).append('cache;desc="hit"')
+        return cached
+
+    if METRICS_ENABLED or PROFILING_ENABLED:
+        results = _timed_pipeline(profile, snapshot, offset, limit, variants)
+    else:
+        eligible = filter_programs_for_profile(profile, snapshot.programs, snapshot.index)
+        columns, text = snapshot.columns, snapshot.index.text
+        if len(variants) == 1:
+            ranked_by_arm = {
+                arm: rank_programs(
+                    profile, eligible, limit, offset, variants[arm], columns=columns, text=text
+                )
+            }
+        else:
+            ranked_by_arm = rank_variants(
+                profile, eligible, variants, limit, offset, columns=columns, text=text
+            )
+        results = {
+            name: (build_explanations(profile, ranked), len(eligible))
+            for name, ranked in ranked_by_arm.items()
+        }
+
+    for name, result in results.items():
+        recommendation_cache.put(base_key + (variants[name],), result)
+    return results[arm]
+
+
+def recommend_facets(
+    profile: Dict[str, Any],
+    snapshot: ProgramSnapshot,
+) -> Dict[str, Dict[str, int]]:
+    """
+    facet_counts() over `snapshot`, cached per snapshot version like pages.
+    """
+    key = (snapshot.version, profile_fingerprint(profile), "facets")
+    cached = recommendation_cache.get(key)
+    if cached is None:
+        cached = facet_counts(profile, snapshot.programs, snapshot.index)
+        recommendation_cache.put(key, cached)
+    return cached
+
+
+def _timed_pipeline(
+    profile: Dict[str, Any],
+    snapshot: ProgramSnapshot,
+    offset: int,
+    limit: Optional[int],
+    variants: Dict[Optional[str], ScoringWeights],
+) -> Dict[Optional[str], Tuple[List[Recommendation], int]]:
+    clock = time.perf_counter
+    if PROFILING_ENABLED:
+        mark_profile_stage("request")
+    started = clock()
+    eligible = filter_programs_for_profile(profile, snapshot.programs, snapshot.index)
+    filtered = clock()
+    if PROFILING_ENABLED:
+        mark_profile_stage("filter")
+    columns, text = snapshot.columns, snapshot.index.text
+    if len(variants) == 1:
+        ((name, weights),) = variants.items()
+        ranked_by_arm = {
+            name: rank_programs(profile, eligible, limit, offset, weights, columns=columns, text=text)
+        }
+    else:
+        ranked_by_arm = rank_variants(
+            profile, eligible, variants, limit, offset, columns=columns, text=text
+        )
+    ranked_at = clock()
+    if PROFILING_ENABLED:
+        mark_profile_stage("rank")
+    results = {
+        name: (build_explanations(profile, ranked), len(eligible))
+        for name, ranked in ranked_by_arm.items()
+    }
+    explained = clock()
+    if PROFILING_ENABLED:
+        mark_profile_stage("explain")
+
+    if METRICS_ENABLED:
+        record_stage("filter", filtered - started)
+        record_stage("rank", ranked_at - filtered)
+        record_stage("explain", explained - ranked_at)
+        # Every arm's page has the same length and total
+        _observe_counts(*next(iter(results.values())))
+    return results
+
+
+def _observe_counts(page: List[Recommendation], total: int) -> None:
+    metrics.observe("course_finder_eligible_programs", total)
+    metrics.observe("course_finder_returned_programs", len(page))
+
+
+def stream_page(template_name: str, **context: Any) -> Response:
+    """
+    Render a template as a chunked response instead of one in-memory string.
+    Template events are grouped STREAM_BUFFER_EVENTS at a time per chunk.
+    """
+    template = app.jinja_env.get_template(template_name)
+    app.update_template_context(context)
+    stream = template.stream(context)
+    stream.enable_buffering(STREAM_BUFFER_EVENTS)
+    if PROFILING_ENABLED:
+        mark_profile_stage("view")
+    if METRICS_ENABLED:
+        stream = _timed_render(stream)
+    return Response(stream_with_context(stream), mimetype="text/html")
+
+
+def _timed_render(chunks: Iterable[str]) -> Iterator[str]:
+    # Rendering happens while the body streams, after the headers are sent,
+    # so it only reaches the histogram, not Server-Timing.
+    clock = time.perf_counter
+    spent = 0.0
+    iterator = iter(chunks)
+    while True:
+        started = clock()
+        chunk = next(iterator, None)
+        spent += clock() - started
+        if chunk is None:
+            break
+        yield chunk
+    metrics.observe("course_finder_stage_seconds", spent, stage="render")
+
+
+@app.route("/", methods=["GET", "POST"])
+def index():
+    snapshot = get_snapshot()
+    programs = snapshot.programs
+    data_error = len(programs) == 0
+
+    profile: Optional[Dict[str, Any]] = None
+    recommendations: List[Recommendation] = []
+    total_matches = 0
+    facets: Optional[Dict[str, Dict[str, int]]] = None
+    active_tab = "profile"
+    experiment, arm = session_arm()
+
+    if request.method == "POST":
+        profile = build_profile_from_form(request.form)
+        session["v10_profile"] = profile
+        if capture_writer is not None:
+            capture_writer.submit("/", profile)
+
+        if not data_error:
+            recommendations, total_matches = recommend_page(
+                profile, snapshot, experiment=experiment, arm=arm
+            )
+            facets = recommend_facets(profile, snapshot)
+
+        active_tab = "recommendations"
+    else:
+        profile = session.get("v10_profile")
+        if profile and not data_error:
+            recommendations, total_matches = recommend_page(
+                profile, snapshot, experiment=experiment, arm=arm
+            )
+            facets = recommend_facets(profile, snapshot)
+        active_tab = "profile"
+
+    # Streamed: header, profile tab and constraints go out before the cards,
+    # which are rendered one at a time from an iterator over the page.
+    return stream_page(
+        "index_v10.html",
+        **index_context(profile, recommendations, total_matches, active_tab, data_error, facets),
+    )
+
+
+def index_context(
+    profile: Optional[Dict[str, Any]],
+    recommendations: List[Recommendation],
+    total_matches: int,
+    active_tab: str,
+    data_error: bool,
+    facets: Optional[Dict[str, Dict[str, int]]] = None,
+) -> Dict[str, Any]:
+    """
+    Template context for index_v10.html.
+    """
+    return {
+        "app_name": APP_NAME,
+        "profile": profile,
+        "profile_summary": summarize_profile(profile),
+        # Cards fetch their details for this profile (see api_program_details)
+        "profile_key": profile_fingerprint(profile) if profile else "",
+        "constraints_summary": summarize_constraints(profile),
+        "recommendations": iter(recommendations),
+        "recommendation_count": len(recommendations),
+        "total_matches": total_matches,
+        "facets": facets,
+        "page_size": RECOMMENDATIONS_PAGE_SIZE,
+        "active_tab": active_tab,
+        "data_error": data_error,
+        "degree_options": DEGREE_OPTIONS,
+        "interest_options": INTEREST_OPTIONS,
+        "us_states": US_STATES,
+    }
+
+
+@app.route("/recommendations", methods=["GET"])
+def recommendations_page():
+    """
+    Next page of recommendation cards for the session profile ("Load more").
+    Returns the rendered cards plus paging info as JSON.
+    """
+    snapshot = get_snapshot()
+    profile = session.get("v10_profile")
+
+    try:
+        offset = max(int(request.args.get("offset", 0)), 0)
+    except (TypeError, ValueError):
+        offset = 0
+
+    if not profile or not snapshot.programs:
+        return jsonify({"html": "", "total": 0, "next_offset": None})
+
+    experiment, arm = session_arm()
+    page, total = recommend_page(profile, snapshot, offset=offset, experiment=experiment, arm=arm)
+    started = time.perf_counter()
+    program_card = get_template_attribute("index_v10.html", "program_card")
+    html = "".join(str(program_card(p)) for p in page)
+    if METRICS_ENABLED:
+        record_stage("render", time.perf_counter() - started)
+
+    next_offset = offset + len(page)
+    return jsonify(
+        {
+            "html": html,
+            "total": total,
+            "next_offset": next_offset if next_offset < total else None,
+        }
+    )
+
+
+def _json_bytes(payload: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def _json_response(payload: Any, status: int = 200):
+    return app.response_class(_json_bytes(payload), status=status, mimetype="application/json")
+
+
+def _page_param(value: Any, default: Optional[int]) -> Optional[int]:
+    if value is None:
+        return default
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return default
+
+
+@app.route("/api/recommendations", methods=["POST"])
+def api_recommendations():
+    """
+    JSON recommendations for a profile given as a JSON body with the same
+    fields as the profile form, plus optional "offset" and "limit".
+
+    The strong ETag covers the dataset content, the profile fingerprint,
+    the page and the summaries, so a matching If-None-Match gets a 304
+    without running the pipeline.
+
+    With a ranking experiment configured, the results are ranked with the
+    weights of the arm assigned to "session_id" (or the browser session),
+    and the response names the experiment and arm.
+
+    With "handle": true the eligible set and its scores are kept, and the
+    response's "handle" can be passed to /api/recommendations/<handle>/refine
+    (no ETag then: every response carries a new handle). The handle keeps
+    the arm's weights, so refinements are ranked and tagged the same way.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return _json_response({"error": "Request body must be a JSON object."}, 400)
+
+    snapshot = get_snapshot()
+    if not snapshot.programs:
+        return _json_response({"error": "The program dataset could not be loaded."}, 503)
+
+    profile = build_profile_from_json(data)
+    offset = _page_param(data.get("offset"), 0)
+    limit = _page_param(data.get("limit"), None)
+    if capture_writer is not None:
+        capture_writer.submit("/api/recommendations", profile, offset=offset, limit=limit)
+
+    session_id = data.get("session_id")
+    experiment, arm = session_arm(session_id if isinstance(session_id, str) else None)
+    weights = DEFAULT_WEIGHTS if experiment is None else experiment.arms[arm]
+    extra = {} if experiment is None else {"experiment": {"name": experiment.name, "arm": arm}}
+
+    if data.get("handle") is True:
+        state = ResultState.compute(
+            profile, snapshot, weights, None if experiment is None else experiment.name, arm
+        )
+        page = build_explanations(profile, state.rank(snapshot, limit, offset))
+        return _json_response(
+            _recommendations_payload(
+                snapshot,
+                profile,
+                page,
+                state.total,
+                offset,
+                handle=result_handles.put(state),
+                **state.experiment_info,
+            )
+        )
+
+    profile_summary = summarize_profile(profile)
+    constraints_summary = summarize_constraints(profile)
+
+    etag_source = json.dumps(
+        [
+            snapshot.version,
+            snapshot.source_hash,
+            profile_fingerprint(profile),
+            offset,
+            limit,
+            profile_summary,
+            constraints_summary,
+            [weights.interest, weights.degree, weights.location],
+            extra,
+        ]
+    )
+    etag = hashlib.sha256(etag_source.encode("utf-8")).hexdigest()[:32]
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        return response
+
+    page, total = recommend_page(
+        profile, snapshot, offset=offset, limit=limit, experiment=experiment, arm=arm
+    )
+
+    response = _json_response(
+        _recommendations_payload(snapshot, profile, page, total, offset, **extra)
+    )
+    response.set_etag(etag)
+    return response
+
+
+def _recommendations_payload(
+    snapshot: ProgramSnapshot,
+    profile: Dict[str, Any],
+    page: List[Recommendation],
+    total: int,
+    offset: int,
+    **extra: Any,
+) -> Dict[str, Any]:
+    return dict(
+        {
+            "dataset_version": snapshot.version,
+            "total": total,
+            "facets": recommend_facets(profile, snapshot),
+            "offset": offset,
+            "profile_summary": summarize_profile(profile),
+            "constraints_summary": summarize_constraints(profile),
+            "recommendations": [rec.to_dict() for rec in page],
+        },
+        **extra,
+    )
+
+
+@app.route("/api/recommendations/<handle>/refine", methods=["POST"])
+def api_refine_recommendations(handle: str):
+    """
+    Recommendations for a stored result's profile with some fields changed.
+    The JSON body holds only the changed profile fields (same names as the
+    profile form), plus optional "offset" and "limit".
+
+    Changes to max_tuition, interest_areas and degree_levels are applied
+    incrementally (see refine_results); anything else is recomputed in full.
+    Either way the response equals POST /api/recommendations for the merged
+    profile (ranked with the handle's experiment arm), plus "refinement"
+    ("incremental" or "full") and a new "handle" for the refined result.
+    404 once the handle expired or the dataset was reloaded.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return _json_response({"error": "Request body must be a JSON object."}, 400)
+
+    snapshot = get_snapshot()
+    state = result_handles.get(handle)
+    if state is None or state.version != snapshot.version:
+        return _json_response(
+            {"error": "Unknown or expired result handle; request /api/recommendations again."},
+            404,
+        )
+
+    changes = build_profile_from_json(data)
+    profile = dict(state.profile)
+    profile.update({key: value for key, value in changes.items() if key in data})
+    offset = _page_param(data.get("offset"), 0)
+    limit = _page_param(data.get("limit"), None)
+
+    refined, incremental = refine_results(state, profile, snapshot)
+    page = build_explanations(profile, refined.rank(snapshot, limit, offset))
+    return _json_response(
+        _recommendations_payload(
+            snapshot,
+            profile,
+            page,
+            refined.total,
+            offset,
+            handle=result_handles.put(refined),
+            refinement="incremental" if incremental else "full",
+            **refined.experiment_info,
+        )
+    )
+
+
+def program_details(
+    profile: Dict[str, Any],
+    program: Program,
+    weights: ScoringWeights = DEFAULT_WEIGHTS,
+) -> Dict[str, Any]:
+    """
+    The profile-dependent part of a program's details: its score
+    components, the fit bars (each component as a percentage of its
+    weight), the program's interest areas the profile selected, and the
+    why_* texts. Values equal those of the program's Recommendation.
+    """
+    _, interest, degree, location, _ = _score_programs(profile, [program], weights)[0]
+    (rec,) = build_explanations(
+        profile,
+        [Recommendation(program, round(interest, 1), round(degree, 1), round(location, 1))],
+    )
+
+    def _bar(score: float, weight: float) -> float:
+        return round(score / weight * 100, 1) if weight > 0 else 0.0
+
+    interests_pref = set(profile.get("interest_areas") or [])
+    return {
+        "interest_matches": [a for a in program.interest_areas or () if a in interests_pref],
+        "interest_score_component": rec.interest_score_component,
+        "degree_score_component": rec.degree_score_component,
+        "location_score_component": rec.location_score_component,
+        "fit_bars": {
+            "interests": _bar(interest, weights.interest),
+            "degree": _bar(degree, weights.degree),
+            "location": _bar(location, weights.location),
+        },
+        "why_interests": rec.why_interests,
+        "why_academic": rec.why_academic,
+        "why_practical": rec.why_practical,
+    }
+
+
+def _program_json(snapshot: ProgramSnapshot, position: int) -> bytes:
+    # The static part of a details response, serialized once per program
+    key = (snapshot.version, position)
+    body = program_json_cache.get(key)
+    if body is None:
+        body = _json_bytes(snapshot.programs[position].to_dict())
+        program_json_cache.put(key, body)
+    return body
+
+
+@app.route("/api/programs/<program_id>/details", methods=["GET"])
+def api_program_details(program_id: str):
+    """
+    Details of one program for the session's profile, loaded by the
+    recommendation cards and the details modal instead of being rendered
+    into every card.
+
+    `profile` must be the fingerprint of the session's profile (the
+    cards' data-profile), which also makes the URL change with the
+    profile. The response is {"program": record, ...program_details()}.
+    The program record is serialized once per program and cached; only
+    the profile-dependent part is computed per call. Responses carry a
+    strong ETag and may be reused by the browser for
+    PROGRAM_DETAILS_MAX_AGE seconds. 404 for an unknown program, or for
+    a profile that is no longer the session's.
+    """
+    snapshot = get_snapshot()
+    position = snapshot.index.position_of(program_id)
+    if position is None:
+        return _json_response({"error": f"Unknown program: {program_id}"}, 404)
+
+    fingerprint = request.args.get("profile") or ""
+    profile = session.get("v10_profile")
+    if not profile or profile_fingerprint(profile) != fingerprint:
+        return _json_response(
+            {"error": "The profile has changed; generate recommendations again."}, 404
+        )
+
+    experiment, arm = session_arm()
+    weights = DEFAULT_WEIGHTS if experiment is None else experiment.arms[arm]
+    etag_source = json.dumps(
+        [
+            snapshot.version,
+            snapshot.source_hash,
+            program_id,
+            fingerprint,
+            [weights.interest, weights.degree, weights.location],
+        ]
+    )
+    etag = hashlib.sha256(etag_source.encode("utf-8")).hexdigest()[:32]
+    cache_control = f"private, max-age={PROGRAM_DETAILS_MAX_AGE}"
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        details = program_details(profile, snapshot.programs[position], weights)
+        details["dataset_version"] = snapshot.version
+        dynamic = _json_bytes(details)
+        body = b'{"program":' + _program_json(snapshot, position) + b"," + dynamic[1:]
+        response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+@app.route("/api/programs/<program_id>/similar", methods=["GET"])
+def api_similar_programs(program_id: str):
+    """
+    Programs most similar to `program_id` ("more like this"), by cosine
+    similarity of the snapshot's precomputed feature vectors.
+    `k` (default SIMILAR_DEFAULT_K) is capped at SIMILAR_MAX_K.
+    """
+    snapshot = get_snapshot()
+    if snapshot.similarity is None:
+        return _json_response({"error": "Similar programs are not available for this dataset."}, 503)
+
+    k = min(_page_param(request.args.get("k"), SIMILAR_DEFAULT_K), SIMILAR_MAX_K)
+    neighbors = snapshot.similarity.neighbors(program_id, k)
+    if neighbors is None:
+        return _json_response({"error": f"Unknown program: {program_id}"}, 404)
+
+    similar = []
+    for program, score in neighbors:
+        row = program.to_dict()
+        row["similarity"] = round(score, 4)
+        similar.append(row)
+    return _json_response(
+        {
+            "dataset_version": snapshot.version,
+            "program_id": program_id,
+            "similar": similar,
+        }
+    )
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    """
+    Hit/miss counters for the in-process recommendation cache.
+    """
+    return jsonify(recommendation_cache.stats())
+
+
+def _add_server_timing(response: Response) -> Response:
+    timings = g.get("server_timing")
+    if timings:
+        response.headers["Server-Timing"] = ", ".join(timings)
+    return response
+
+
+if METRICS_ENABLED:
+    app.after_request(_add_server_timing)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """
+    Prometheus text exposition of the stage histograms plus cache and
+    dataset gauges for this process. 404 unless metrics are enabled.
+    """
+    if not METRICS_ENABLED:
+        return app.response_class("Metrics are disabled.\n", status=404, mimetype="text/plain")
+
+    cache = recommendation_cache.stats()
+    snapshot = get_snapshot()
+    lines = [
+        "# HELP course_finder_cache_requests_total Recommendation cache lookups.",
+        "# TYPE course_finder_cache_requests_total counter",
+        f'course_finder_cache_requests_total{{result="hit"}} {cache["hits"]}',
+        f'course_finder_cache_requests_total{{result="miss"}} {cache["misses"]}',
+        "# HELP course_finder_dataset_version Version of the dataset snapshot being served.",
+        "# TYPE course_finder_dataset_version gauge",
+        f"course_finder_dataset_version {snapshot.version}",
+        "# HELP course_finder_dataset_programs Programs in the dataset snapshot.",
+        "# TYPE course_finder_dataset_programs gauge",
+        f"course_finder_dataset_programs {len(snapshot.programs)}",
+    ]
+    body = metrics.render() + "\n".join(lines) + "\n"
+    return app.response_class(body, mimetype="text/plain; version=0.0.4")
+
+
+if PROFILING_ENABLED:
+    app.before_request(_start_request_profile)
+    app.after_request(_tag_request_profile)
+    app.teardown_request(_abandon_request_profile)
+
+
+def _profiles_unavailable() -> Optional[Response]:
+    if not PROFILING_ENABLED or PROFILE_TOKEN is None:
+        # Profiles reveal code paths and timings: never served without a token
+        return _json_response({"error": "Request profiling is disabled."}, 404)
+    if not _profile_authorized():
+        return _json_response({"error": f"Send the profiling token in {PROFILE_HEADER}."}, 403)
+    return None
+
+
+@app.route("/debug/profiles", methods=["GET"])
+def profiles_index():
+    """
+    Captured request profiles of every worker, newest first.
+    404 unless profiling and a token are configured, 403 without the token.
+    """
+    unavailable = _profiles_unavailable()
+    if unavailable is not None:
+        return unavailable
+    profiles = list_profiles(PROFILE_DIR)
+    for meta in profiles:
+        meta["url"] = f"/debug/profiles/{meta.get('id')}"
+    return _json_response(
+        {
+            "mode": "sample" if PROFILE_MODE == "sample" else "cprofile",
+            "sample_rate": PROFILE_SAMPLE_RATE,
+            "retention": PROFILE_RETENTION,
+            "profiles": profiles,
+        }
+    )
+
+
+@app.route("/debug/profiles/<profile_id>", methods=["GET"])
+def profile_data(profile_id: str):
+    """
+    The pstats or collapsed-stack file of one profile, as a download.
+    """
+    unavailable = _profiles_unavailable()
+    if unavailable is not None:
+        return unavailable
+    if PROFILE_ID_RE.match(profile_id):
+        for suffix in PROFILE_DATA_SUFFIXES.values():
+            path = os.path.join(PROFILE_DIR, profile_id + suffix)
+            try:
+                with open(path, "rb") as f:
+                    body = f.read()
+            except FileNotFoundError:
+                continue
+            response = app.response_class(
+                body,
+                mimetype="text/plain" if suffix == ".collapsed" else "application/octet-stream",
+            )
+            response.headers["Content-Disposition"] = f"attachment; filename={profile_id}{suffix}"
+            return response
+    return _json_response({"error": "Unknown profile"}, 404)
+
+
+# ---------------------------------------------------------------------------
+# Command-line tools
+# ---------------------------------------------------------------------------
+
+def build_synthetic_catalog(
+    programs: List[Program],
+    size: int,
+    seed: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Resample `programs` into a larger catalog with the same schema.
+    Field values are mixed across programs so ties and edge cases are exercised.
+    """
+    rng = random.Random(seed)
+    if not programs:
+        return []
+
+    states = sorted({p.get("state") for p in programs if p.get("state")})
+    catalog: List[Dict[str, Any]] = []
+
+    for i in range(size):
+        p = rng.choice(programs).to_dict()
+        p["program_id"] = f"SYN-{i:07d}"
+        p["program_name"] = rng.choice(programs).get("program_name")
+        p["state"] = rng.choice(states) if states else None
+        p["degree_level"] = rng.choice(programs).get("degree_level")
+        p["interest_areas"] = list(rng.choice(programs).get("interest_areas") or [])
+        if rng.random() < 0.05:
+            p["annual_tuition"] = None
+        else:
+            p["annual_tuition"] = float(rng.randrange(3000, 60001, 500))
+        catalog.append(p)
+
+    return catalog
+
+
+def _sample_profiles(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Deterministic spread of profiles covering every filter/ranking branch.
+    """
+    rng = random.Random(seed)
+    profiles: List[Dict[str, Any]] = []
+    for _ in range(count):
+        profiles.append(
+            {
+                "home_state": rng.choice(US_STATES + [""]),
+                "gpa": rng.choice([0.0, 2.5, 3.0, 3.5, 4.0]),
+                "degree_levels": rng.sample(DEGREE_OPTIONS, rng.randint(0, len(DEGREE_OPTIONS))),
+                "interest_areas": rng.sample(INTEREST_OPTIONS, rng.randint(0, len(INTEREST_OPTIONS))),
+                "max_tuition": rng.choice([None, 0.0, 10000.0, 18500.0, 25000.0, 60000.0]),
+                "location_pref": rng.choice(["", "instate", "neighbors", "nearby", "anywhere"]),
+                "max_distance": rng.choice([None, 0.0, 250.0, 600.0, 1500.0]),
+            }
+        )
+    return profiles
+
+
+# Weightings for the batched-variant parity check, including zero weights
+_CHECK_VARIANTS = {
+    "default": DEFAULT_WEIGHTS,
+    "interest_only": ScoringWeights(100.0, 0.0, 0.0),
+    "location_heavy": ScoringWeights(50.0, 15.0, 35.0),
+    "fractional": ScoringWeights(62.5, 22.3, 15.2),
+}
+
+
+def _compare_engines(
+    programs: List[Program],
+    profiles: List[Dict[str, Any]],
+) -> int:
+    def _rows(ranked: Optional[List[Recommendation]]) -> Optional[List[Dict[str, Any]]]:
+        return None if ranked is None else [r.to_dict() for r in ranked]
+
+    # Number of profiles whose numpy ranking differs from the python one
+    index = ProgramIndex(programs)
+    columns = ProgramColumns(programs)
+    mismatches = 0
+    for profile in profiles:
+        eligible = filter_programs_for_profile(profile, programs, index)
+        expected = _rows(_rank_programs_python(profile, eligible))
+        actual = _rows(_rank_programs_numpy(profile, eligible, columns))
+        if actual is None or actual != expected:
+            mismatches += 1
+            continue
+        page = RECOMMENDATIONS_PAGE_SIZE
+        if (
+            _rows(_rank_programs_python(profile, eligible, page, page)) != expected[page:2 * page]
+            or _rows(_rank_programs_numpy(profile, eligible, columns, page, page)) != expected[page:2 * page]
+        ):
+            mismatches += 1
+            continue
+        # Batched variants: every engine's page equals its single-weighting ranking
+        by_engine = (
+            _rank_variants_python(profile, eligible, _CHECK_VARIANTS, page, 0),
+            _rank_variants_numpy(profile, eligible, columns, _CHECK_VARIANTS, page, 0),
+        )
+        for name, weights in _CHECK_VARIANTS.items():
+            single = _rows(_rank_programs_python(profile, eligible, page, 0, weights))
+            if any(_rows(variants[name]) != single for variants in by_engine):
+                mismatches += 1
+                break
+    return mismatches
+
+
+def check_ranking_engines(synthetic_size: int = 20000, profile_count: int = 200) -> int:
+    """
+    Parity check: the numpy engine must match the python engine exactly
+    (values and ordering, full and paged, and batched rank_variants) on the
+    shipped dataset and on a synthetic catalog.
+    Returns a process exit code.
+    """
+    if np is None:
+        print("[ERROR] numpy is not installed; the numpy engine is unavailable.")
+        return 1
+
+    profiles = _sample_profiles(profile_count)
+    programs = load_programs()
+    failed = _compare_engines(programs, profiles)
+    print(f"{DATA_PATH}: {len(programs)} programs, {failed} mismatching profiles")
+
+    synthetic = normalize_programs(build_synthetic_catalog(programs, synthetic_size))
+    synthetic_failed = _compare_engines(synthetic, profiles)
+    print(f"synthetic: {len(synthetic)} programs, {synthetic_failed} mismatching profiles")
+
+    return 1 if failed or synthetic_failed else 0
+
+
+def _refinements(profile: Dict[str, Any], rng: random.Random) -> List[Dict[str, Any]]:
+    # Single- and multi-field changes a user might make next
+    budget = profile.get("max_tuition")
+    interests = list(profile.get("interest_areas") or [])
+    degrees = list(profile.get("degree_levels") or [])
+    changes: List[Dict[str, Any]] = [
+        {"max_tuition": rng.choice([None, 8000.0, 15000.0, 30000.0, 80000.0])},
+        {"max_tuition": (budget or 20000.0) + 5000.0},
+        {"interest_areas": interests + [rng.choice(INTEREST_OPTIONS)]},
+        {"interest_areas": interests[1:]},
+        {"degree_levels": degrees + [rng.choice(DEGREE_OPTIONS)]},
+        {"degree_levels": degrees[:-1]},
+        {"max_tuition": 40000.0, "interest_areas": interests + [rng.choice(INTEREST_OPTIONS)]},
+        {"home_state": rng.choice(US_STATES)},
+    ]
+    return [dict(profile, **change) for change in changes]
+
+
+def check_refinement(synthetic_size: int = 20000, profile_count: int = 100) -> int:
+    """
+    Parity check: refine_results() must give exactly the eligible set and
+    scores of a full recompute for the changed profile, and the same first
+    two pages as filter + rank_programs, under each of _CHECK_VARIANTS.
+    Returns a process exit code.
+    """
+    rng = random.Random(0)
+    programs = load_programs()
+    synthetic = ProgramSnapshot.build(
+        normalize_programs(build_synthetic_catalog(programs, synthetic_size)), 0
+    )
+
+    def _rows(ranked: List[Recommendation]) -> List[Dict[str, Any]]:
+        return [r.to_dict() for r in ranked]
+
+    pages = 2 * RECOMMENDATIONS_PAGE_SIZE
+    variants = list(_CHECK_VARIANTS.values())
+    mismatches = incremental = checked = 0
+    for n, profile in enumerate(_sample_profiles(profile_count)):
+        weights = variants[n % len(variants)]
+        state = ResultState.compute(profile, synthetic, weights)
+        for refined_profile in _refinements(profile, rng):
+            refined, was_incremental = refine_results(state, refined_profile, synthetic)
+            recomputed = ResultState.compute(refined_profile, synthetic, weights)
+            eligible = filter_programs_for_profile(refined_profile, synthetic.programs, synthetic.index)
+            checked += 1
+            incremental += was_incremental
+            if list(refined.entries()) != list(recomputed.entries()) or _rows(
+                refined.rank(synthetic, pages)
+            ) != _rows(
+                rank_programs(
+                    refined_profile,
+                    eligible,
+                    pages,
+                    0,
+                    weights,
+                    columns=synthetic.columns,
+                    text=synthetic.index.text,
+                )
+            ):
+                mismatches += 1
+
+    print(
+        f"synthetic: {len(synthetic.programs)} programs, {checked} refinements "
+        f"({incremental} incremental), {mismatches} mismatching"
+    )
+    return 1 if mismatches else 0
+
+
+def compile_data(json_path: str = DATA_PATH, out_path: Optional[str] = None) -> int:
+    """
+    Compile json_path to the binary columnar format and verify that the
+    compiled file decodes to exactly the records the JSON loader builds.
+    Returns a process exit code.
+    """
+    try:
+        out_path = compile_dataset(json_path, out_path)
+        with open(json_path, "rb") as f:
+            expected = [p.to_dict() for p in normalize_programs(json.loads(f.read().decode("utf-8")))]
+        started = time.perf_counter()
+        actual = [p.to_dict() for p in read_compiled_dataset(out_path)]
+        elapsed = time.perf_counter() - started
+    except (OSError, ValueError, DatasetError) as exc:
+        print(f"[ERROR] {exc}")
+        return 1
+
+    if actual != expected:
+        print(f"[ERROR] {out_path} does not round-trip to the records in {json_path}")
+        os.remove(out_path)
+        return 1
+    print(
+        f"{json_path} -> {out_path}: {len(actual)} programs, "
+        f"{os.path.getsize(out_path)} bytes, loads in {elapsed * 1000:.1f} ms"
+    )
+    return 0
+
+
+# Dataset shared by batch workers: set in the parent before the pool forks,
+# or loaded once per worker by _init_batch_worker under "spawn".
+_batch_snapshot: Optional[ProgramSnapshot] = None
+_batch_limit: Optional[int] = RECOMMENDATIONS_PAGE_SIZE
+
+
+def _load_batch_snapshot(data_path: str) -> ProgramSnapshot:
+    # Bypasses get_snapshot(): no watcher thread, no shared locks to fork
+    programs, mtime, digest = _read_dataset(data_path)
+    return ProgramSnapshot.build(programs, 0, mtime, digest)
+
+
+def _init_batch_worker(data_path: str, limit: Optional[int]) -> None:
+    global _batch_snapshot, _batch_limit
+    if _batch_snapshot is None:
+        _batch_snapshot = _load_batch_snapshot(data_path)
+    _batch_limit = limit
+
+
+def _dumps_line(payload: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload) + b"\n"
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def _recommend_batch_chunk(lines: List[bytes]) -> List[bytes]:
+    """
+    Run the full pipeline for one chunk of JSONL profile lines.
+    Returns one output line per input line, in order.
+    """
+    snapshot = _batch_snapshot
+    out: List[bytes] = []
+    for line in lines:
+        try:
+            data = json.loads(line)
+        except ValueError:
+            out.append(_dumps_line({"error": "Line is not valid JSON."}))
+            continue
+        if not isinstance(data, dict):
+            out.append(_dumps_line({"error": "Line must be a JSON object."}))
+            continue
+
+        # Normalized as the JSON API does, so a mistyped field cannot fail the run
+        profile = build_profile_from_json(data)
+        eligible = filter_programs_for_profile(profile, snapshot.programs, snapshot.index)
+        ranked = rank_programs(
+            profile, eligible, _batch_limit, columns=snapshot.columns, text=snapshot.index.text
+        )
+        build_explanations(profile, ranked)
+        out.append(
+            _dumps_line(
+                {
+                    "total": len(eligible),
+                    "recommendations": [rec.to_dict() for rec in ranked],
+                }
+            )
+        )
+    return out
+
+
+def _read_chunks(f, chunk_size: int):
+    chunk: List[bytes] = []
+    for line in f:
+        if not line.strip():
+            continue
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(
+    in_path: str,
+    out_path: str,
+    workers: Optional[int] = None,
+    chunk_size: int = 64,
+    limit: Optional[int] = RECOMMENDATIONS_PAGE_SIZE,
+    data_path: str = DATA_PATH,
+) -> int:
+    """
+    Recommend for every profile in a JSONL file (one profile object per
+    line, normalized like a JSON API body) and write one JSONL result per
+    non-blank input line, in input order.
+
+    Chunks of `chunk_size` lines are fanned out over a process pool; at
+    most two chunks per worker are in flight, so memory stays bounded
+    whatever the input size. Progress goes to stderr.
+    Returns a process exit code.
+    """
+    global _batch_snapshot, _batch_limit
+
+    try:
+        snapshot = _load_batch_snapshot(data_path)
+    except DatasetError as exc:
+        print(f"[ERROR] {exc}", file=sys.stderr)
+        return 1
+    if not snapshot.programs:
+        print(f"[ERROR] No programs in {data_path}", file=sys.stderr)
+        return 1
+
+    workers = workers or os.cpu_count() or 1
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+    if ctx.get_start_method() == "fork":
+        # Children inherit the loaded dataset copy-on-write
+        _batch_snapshot = snapshot
+    _batch_limit = limit
+
+    done = 0
+    started = last_report = time.perf_counter()
+
+    def _report(final: bool = False) -> None:
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        label = "done" if final else "progress"
+        print(f"[INFO] batch {label}: {done} profiles, {rate:.1f} profiles/sec", file=sys.stderr)
+
+    try:
+        with open(in_path, "rb") as src, open(out_path, "wb") as dst, ctx.Pool(
+            workers, initializer=_init_batch_worker, initargs=(data_path, limit)
+        ) as pool:
+            pending: deque = deque()
+            for chunk in _read_chunks(src, chunk_size):
+                pending.append(pool.apply_async(_recommend_batch_chunk, (chunk,)))
+                while len(pending) > 2 * workers:
+                    results = pending.popleft().get()
+                    dst.writelines(results)
+                    done += len(results)
+                if time.perf_counter() - last_report >= 5.0:
+                    last_report = time.perf_counter()
+                    _report()
+            while pending:
+                results = pending.popleft().get()
+                dst.writelines(results)
+                done += len(results)
+    except OSError as exc:
+        print(f"[ERROR] {exc}", file=sys.stderr)
+        return 1
+    finally:
+        _batch_snapshot = None
+
+    _report(final=True)
+    return 0
+
+
+def _batch_command(args: List[str]) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="app_v10.py batch")
+    parser.add_argument("input", help="JSONL file, one profile dict per line")
+    parser.add_argument("output", help="JSONL file for the results")
+    parser.add_argument("--workers", type=int, default=None, help="pool size (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="profiles per task")
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=RECOMMENDATIONS_PAGE_SIZE,
+        help="recommendations per profile (0 for all)",
+    )
+    opts = parser.parse_args(args)
+    return run_batch(
+        opts.input,
+        opts.output,
+        workers=opts.workers,
+        chunk_size=max(opts.chunk_size, 1),
+        limit=opts.limit or None,
+    )
+
+
+def _rank_biased_overlap(ranked: List[int], baseline: List[int], p: float = 0.9) -> float:
+    """
+    Extrapolated rank-biased overlap of two equal-length top-k lists
+    (Webber et al., 2010): 1.0 when identical, weighted towards the top.
+    """
+    k = len(baseline)
+    if not k:
+        return 1.0
+    seen_ranked: Set[int] = set()
+    seen_baseline: Set[int] = set()
+    overlap = 0
+    total = 0.0
+    for depth, (a, b) in enumerate(zip(ranked, baseline), 1):
+        if a == b:
+            overlap += 1
+        else:
+            overlap += (a in seen_baseline) + (b in seen_ranked)
+        seen_ranked.add(a)
+        seen_baseline.add(b)
+        total += overlap / depth * p ** depth
+    return overlap / k * p ** k + (1 - p) / p * total
+
+
+def evaluate_weights(
+    experiment_path: str,
+    profiles_path: str,
+    k: int = RECOMMENDATIONS_PAGE_SIZE,
+    baseline: Optional[str] = None,
+    data_path: str = DATA_PATH,
+    out_path: Optional[str] = None,
+) -> int:
+    """
+    Compare every arm of an experiment file against a baseline arm (default:
+    the first) over a JSONL corpus of profiles, without serving traffic.
+
+    Each profile is filtered once and all arms are ranked in one
+    rank_variants() pass. Per arm, averaged over profiles with eligible
+    programs, relative to the baseline's top k:
+      overlap_at_k  share of the baseline's top k still in the arm's top k
+      rbo           rank-biased overlap (p=0.9) of the two top-k lists
+      churn_at_k    share of top-k positions holding a different program
+      changed       share of profiles whose top-k list differs at all
+    Prints a table, and writes the report as JSON to `out_path` if given.
+    Returns a process exit code.
+    """
+    try:
+        experiment = load_experiment(experiment_path)
+        snapshot = _load_batch_snapshot(data_path)
+    except (ValueError, DatasetError) as exc:
+        print(f"[ERROR] {exc}", file=sys.stderr)
+        return 1
+    baseline = baseline or next(iter(experiment.arms))
+    if baseline not in experiment.arms:
+        print(f"[ERROR] No arm {baseline!r} in {experiment_path}", file=sys.stderr)
+        return 1
+
+    arms = experiment.arms
+    sums = {arm: [0.0, 0.0, 0.0, 0] for arm in arms}
+    evaluated = skipped = 0
+    started = time.perf_counter()
+    try:
+        with open(profiles_path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    data = None
+                if not isinstance(data, dict):
+                    skipped += 1
+                    continue
+                # Normalized as the JSON API does, as in batch
+                profile = build_profile_from_json(data)
+                eligible = filter_programs_for_profile(profile, snapshot.programs, snapshot.index)
+                if not eligible:
+                    continue
+                ranked = rank_variants(
+                    profile,
+                    eligible,
+                    arms,
+                    limit=k,
+                    columns=snapshot.columns,
+                    text=snapshot.index.text,
+                )
+                expected = [id(rec.program) for rec in ranked[baseline]]
+                expected_set = set(expected)
+                for arm, recs in ranked.items():
+                    actual = [id(rec.program) for rec in recs]
+                    moved = sum(a != b for a, b in zip(actual, expected))
+                    totals = sums[arm]
+                    totals[0] += len(expected_set.intersection(actual)) / len(expected)
+                    totals[1] += _rank_biased_overlap(actual, expected)
+                    totals[2] += moved / len(expected)
+                    totals[3] += moved > 0
+                evaluated += 1
+    except OSError as exc:
+        print(f"[ERROR] {exc}", file=sys.stderr)
+        return 1
+
+    report = {
+        "experiment": experiment.name,
+        "baseline": baseline,
+        "k": k,
+        "profiles": evaluated,
+        "skipped_lines": skipped,
+        "arms": {
+            arm: {
+                "weights": {
+                    "interest": weights.interest,
+                    "degree": weights.degree,
+                    "location": weights.location,
+                },
+                "overlap_at_k": round(sums[arm][0] / evaluated, 4) if evaluated else None,
+                "rbo": round(sums[arm][1] / evaluated, 4) if evaluated else None,
+                "churn_at_k": round(sums[arm][2] / evaluated, 4) if evaluated else None,
+                "changed": round(sums[arm][3] / evaluated, 4) if evaluated else None,
+            }
+            for arm, weights in arms.items()
+        },
+    }
+
+    print(
+        f"{experiment.name}: {evaluated} profiles, {len(arms)} arms, top {k} vs {baseline!r} "
+        f"({time.perf_counter() - started:.1f}s)"
+    )
+    print(f"{'arm':<24} {'weights':<20} {'overlap':>8} {'rbo':>8} {'churn':>8} {'changed':>8}")
+    for arm, row in report["arms"].items():
+        w = row["weights"]
+        weights_text = f"{w['interest']:g}/{w['degree']:g}/{w['location']:g}"
+        values = [row[field] for field in ("overlap_at_k", "rbo", "churn_at_k", "changed")]
+        print(f"{arm:<24} {weights_text:<20} " + " ".join(
+            f"{'-' if v is None else format(v, '.4f'):>8}" for v in values
+        ))
+
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+    return 0
+
+
+def _evaluate_command(args: List[str]) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="app_v10.py evaluate-weights")
+    parser.add_argument("experiment", help="experiment JSON file (see Experiment)")
+    parser.add_argument("profiles", help="JSONL file, one profile dict per line")
+    parser.add_argument("--k", type=int, default=RECOMMENDATIONS_PAGE_SIZE, help="top-k depth")
+    parser.add_argument("--baseline", default=None, help="arm to compare against (default: first)")
+    parser.add_argument("--out", default=None, help="write the report as JSON")
+    opts = parser.parse_args(args)
+    return evaluate_weights(
+        opts.experiment,
+        opts.profiles,
+        k=max(opts.k, 1),
+        baseline=opts.baseline,
+        out_path=opts.out,
+    )
+
+
+def main(argv: List[str]) -> int:
+    """
+    Entry point for `python app_v10.py [command]`.
+
+      (no command)   run the local demo server
+      check-engines  verify the numpy ranking engine against the python one
+      check-refine   verify incremental refinement against a full recompute
+      compile-data [json] [out]
+                     build the compiled dataset (default: next to DATA_PATH)
+      batch in.jsonl out.jsonl [--workers N] [--chunk-size N] [--limit N]
+                     recommend for a file of profiles over a process pool
+      evaluate-weights experiment.json profiles.jsonl [--k N] [--baseline ARM] [--out F]
+                     compare weight arms' rankings offline (overlap, churn)
+    """
+    command = argv[0] if argv else "serve"
+
+    if command == "serve":
+        # For local demo
+        app.run(host="0.0.0.0", port=5000, debug=True)
+        return 0
+    if command == "check-engines":
+        return check_ranking_engines()
+    if command == "check-refine":
+        return check_refinement()
+    if command == "compile-data":
+        return compile_data(*argv[1:3])
+    if command == "batch":
+        return _batch_command(argv[1:])
+    if command == "evaluate-weights":
+        return _evaluate_command(argv[1:])
+
+    print(f"Unknown command: {command}")
+    return 2
 
 
 if __name__ == "__main__":
-    # For local demo
-    app.run(host="0.0.0.0", port=5000, debug=True)
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,507 @@
+"""
+Benchmark suite for the v10 recommendation pipeline.
+
+Generates synthetic catalogs with the schema and value distributions of
+programs_v7.json, runs a matrix of profile shapes against them and times
+each pipeline stage separately:
+
+    load_programs, filter_programs_for_profile, rank_programs,
+    build_explanations, render_template
+
+Results (p50/p95/p99 latency per stage, peak memory) are written as JSON
+with stable key order, so files from two versions can be diffed or
+compared with --baseline. With --fork-workers N, per-worker memory of N
+forked workers is also measured with and without the dataset preloaded
+in the parent (Linux only).
+
+    python bench_v10.py --sizes 1000,100000,1000000 --out bench_results.json
+    python bench_v10.py --baseline old.json --out new.json
+    python bench_v10.py --sizes 100000 --fork-workers 4
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+import traceback
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from flask import render_template
+
+import app_v10
+from app_v10 import (
+    DEGREE_OPTIONS,
+    INTEREST_OPTIONS,
+    RECOMMENDATIONS_PAGE_SIZE,
+    US_STATES,
+    Program,
+    ProgramSnapshot,
+    app,
+    build_explanations,
+    filter_programs_for_profile,
+    index_context,
+    rank_programs,
+)
+
+RESULTS_FORMAT_VERSION = 1
+DEFAULT_SIZES = (1000, 100000, 1000000)
+STAGES = (
+    "filter_programs_for_profile",
+    "rank_programs",
+    "build_explanations",
+    "render_template",
+)
+
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+
+def iter_benchmark_catalog(
+    programs: List[Program],
+    size: int,
+    seed: int = 0,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield `size` raw program dicts drawn from the empirical distributions
+    of `programs`: degree level and interest areas come from one source
+    program (keeping their correlation), state and tuition from others,
+    and tuition is jittered by up to ±10% within the observed range.
+    """
+    rng = random.Random(seed)
+    tuitions = [p.annual_tuition for p in programs if p.annual_tuition is not None]
+    low, high = (min(tuitions), max(tuitions)) if tuitions else (0.0, 0.0)
+
+    for i in range(size):
+        p = rng.choice(programs).to_dict()
+        p["program_id"] = f"BENCH-{i:07d}"
+        p["program_name"] = f"{rng.choice(programs).program_name} {i % 997}"
+        p["state"] = rng.choice(programs).state
+        p["city"] = rng.choice(programs).city
+
+        tuition = rng.choice(programs).annual_tuition
+        if tuition is not None:
+            tuition = round(min(max(tuition * rng.uniform(0.9, 1.1), low), high), -1)
+        p["annual_tuition"] = tuition
+        yield p
+
+
+def write_catalog(path: str, rows: Iterator[Dict[str, Any]]) -> None:
+    """
+    Stream rows into a JSON array file without holding them all in memory.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, row in enumerate(rows):
+            if i:
+                f.write(",\n")
+            f.write(json.dumps(row))
+        f.write("]\n")
+
+
+def profile_matrix(per_shape: int, seed: int = 0) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Profiles grouped by shape, from narrow in-state budget searches to
+    wide-open ones. Shapes are fixed; states, GPAs and picks vary.
+    """
+    rng = random.Random(seed)
+
+    def _profile(degrees: int, interests: int, budget: Optional[float], pref: str) -> Dict[str, Any]:
+        return {
+            "home_state": rng.choice(US_STATES),
+            "gpa": rng.choice([2.5, 3.0, 3.5, 3.9]),
+            "degree_levels": rng.sample(DEGREE_OPTIONS, degrees),
+            "interest_areas": rng.sample(INTEREST_OPTIONS, interests),
+            "max_tuition": budget,
+            "location_pref": pref,
+        }
+
+    shapes: Dict[str, Callable[[], Dict[str, Any]]] = {
+        "narrow_instate_budget": lambda: _profile(1, 1, 15000.0, "instate"),
+        "instate_budget": lambda: _profile(2, 2, 25000.0, "instate"),
+        "typical": lambda: _profile(2, 3, None, ""),
+        "budget_anywhere": lambda: _profile(3, 4, 30000.0, "anywhere"),
+        "wide_open": lambda: _profile(len(DEGREE_OPTIONS), len(INTEREST_OPTIONS), None, "anywhere"),
+        "unconstrained": lambda: _profile(0, 0, None, ""),
+    }
+    return {name: [make() for _ in range(per_shape)] for name, make in shapes.items()}
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """
+    Nearest-rank p50/p95/p99 of samples given in seconds, reported in ms.
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def _rank(q: float) -> float:
+        index = max(int(-(-q * len(ordered) // 100)) - 1, 0)
+        return round(ordered[index] * 1000.0, 3)
+
+    return {"runs": len(ordered), "p50_ms": _rank(50), "p95_ms": _rank(95), "p99_ms": _rank(99)}
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / scale, 1)
+
+
+def _memory_mb(pid: int) -> Optional[Dict[str, float]]:
+    """
+    Resident (rss), proportional (pss: shared pages split between their
+    users) and unique (uss: private pages) memory of a process.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    kb: Dict[str, int] = {}
+    for line in lines[1:]:
+        key, value, *_ = line.split()
+        kb[key.rstrip(":")] = int(value)
+    return {
+        "rss_mb": round(kb.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(kb.get("Pss", 0) / 1024, 1),
+        "uss_mb": round((kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024, 1),
+    }
+
+
+def _forked_worker(path: Optional[str], snapshot: Optional[ProgramSnapshot], profiles: List[Dict[str, Any]], ready: int, release: int) -> None:
+    # Child: load unless preloaded, serve the profiles, then wait to be measured
+    status = 1
+    try:
+        if path is not None:
+            snapshot = app_v10._load_batch_snapshot(path)
+        for profile in profiles:
+            eligible = filter_programs_for_profile(profile, snapshot.programs, snapshot.index)
+            recs = rank_programs(profile, eligible, columns=snapshot.columns, text=snapshot.index.text)
+            build_explanations(profile, recs[:RECOMMENDATIONS_PAGE_SIZE])
+        gc.collect()
+        os.write(ready, b"1")
+        os.read(release, 1)
+        status = 0
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        os._exit(status)
+
+
+def worker_memory(path: str, profiles: List[Dict[str, Any]], workers: int) -> Optional[Dict[str, Any]]:
+    """
+    Fork `workers` children that each serve `profiles`, once loading the
+    catalog per worker and once with it preloaded (and gc-frozen, as
+    preload_dataset() does) in the parent. Reports mean per-worker memory
+    and the total PSS of parent plus workers for each mode.
+    """
+    if _memory_mb(os.getpid()) is None or not hasattr(os, "fork"):
+        return None
+
+    def _measure(preload: bool) -> Dict[str, Any]:
+        snapshot: Optional[ProgramSnapshot] = None
+        if preload:
+            snapshot = app_v10._load_batch_snapshot(path)
+            gc.collect()
+            gc.freeze()
+        ready_r, ready_w = os.pipe()
+        release_r, release_w = os.pipe()
+        pids: List[int] = []
+        try:
+            for _ in range(workers):
+                pid = os.fork()
+                if pid == 0:
+                    os.close(ready_r)
+                    os.close(release_w)
+                    _forked_worker(None if preload else path, snapshot, profiles, ready_w, release_r)
+                pids.append(pid)
+            # Only the workers hold these ends now: a dead worker reads as EOF
+            os.close(ready_w)
+            os.close(release_r)
+            ready_w = release_r = -1
+            for _ in pids:
+                if not os.read(ready_r, 1):
+                    raise SystemExit("[ERROR] a forked worker failed")
+            samples = [_memory_mb(pid) for pid in pids]
+            parent = _memory_mb(os.getpid())
+        finally:
+            os.close(release_w)
+            for pid in pids:
+                os.waitpid(pid, 0)
+            for fd in (ready_r, ready_w, release_r):
+                if fd >= 0:
+                    os.close(fd)
+            if preload:
+                gc.unfreeze()
+        result = {
+            key: round(sum(s[key] for s in samples) / len(samples), 1)
+            for key in ("rss_mb", "pss_mb", "uss_mb")
+        }
+        result["total_pss_mb"] = round(parent["pss_mb"] + sum(s["pss_mb"] for s in samples), 1)
+        return result
+
+    return {
+        "workers": workers,
+        "per_worker_load": _measure(preload=False),
+        "preload": _measure(preload=True),
+    }
+
+
+def _run_profile(profile: Dict[str, Any], snapshot: ProgramSnapshot, timings: Dict[str, List[float]]) -> None:
+    clock = time.perf_counter
+
+    started = clock()
+    eligible = filter_programs_for_profile(profile, snapshot.programs, snapshot.index)
+    filtered = clock()
+    page = rank_programs(
+        profile,
+        eligible,
+        RECOMMENDATIONS_PAGE_SIZE,
+        columns=snapshot.columns,
+        text=snapshot.index.text,
+    )
+    ranked = clock()
+    build_explanations(profile, page)
+    for rec in page:
+        # Explanations are lazy; the page template reads all three
+        rec.why_interests, rec.why_academic, rec.why_practical
+    explained = clock()
+    with app.test_request_context("/"):
+        render_template(
+            "index_v10.html",
+            **index_context(profile, page, len(eligible), "recommendations", False),
+        )
+    rendered = clock()
+
+    timings["filter_programs_for_profile"].append(filtered - started)
+    timings["rank_programs"].append(ranked - filtered)
+    timings["build_explanations"].append(explained - ranked)
+    timings["render_template"].append(rendered - explained)
+
+
+def _stage_peaks(profile: Dict[str, Any], snapshot: ProgramSnapshot) -> Dict[str, int]:
+    """
+    tracemalloc peak (bytes) of each stage for one profile.
+    """
+    peaks: Dict[str, int] = {}
+
+    def _traced(stage: str, fn: Callable[[], Any]) -> Any:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        peaks[stage] = max(peaks.get(stage, 0), tracemalloc.get_traced_memory()[1] - base)
+        return result
+
+    eligible = _traced(
+        "filter_programs_for_profile",
+        lambda: filter_programs_for_profile(profile, snapshot.programs, snapshot.index),
+    )
+    page = _traced(
+        "rank_programs",
+        lambda: rank_programs(
+            profile,
+            eligible,
+            RECOMMENDATIONS_PAGE_SIZE,
+            columns=snapshot.columns,
+            text=snapshot.index.text,
+        ),
+    )
+    _traced(
+        "build_explanations",
+        lambda: [
+            (r.why_interests, r.why_academic, r.why_practical)
+            for r in build_explanations(profile, page)
+        ],
+    )
+    with app.test_request_context("/"):
+        _traced(
+            "render_template",
+            lambda: render_template(
+                "index_v10.html",
+                **index_context(profile, page, len(eligible), "recommendations", False),
+            ),
+        )
+    return peaks
+
+
+def bench_size(
+    size: int,
+    matrix: Dict[str, List[Dict[str, Any]]],
+    source: List[Program],
+    workdir: str,
+    load_runs: int,
+    seed: int,
+    fork_workers: int = 0,
+) -> Dict[str, Any]:
+    path = os.path.join(workdir, f"catalog_{size}.json")
+    write_catalog(path, iter_benchmark_catalog(source, size, seed))
+
+    # Before the load runs, so the parent holds no catalog of its own
+    memory = None
+    if fork_workers > 0:
+        memory = worker_memory(path, [p for ps in matrix.values() for p in ps[:2]], fork_workers)
+        print(f"[INFO] size {size}: worker memory done", file=sys.stderr)
+
+    load_times: List[float] = []
+    snapshot: Optional[ProgramSnapshot] = None
+    for _ in range(load_runs):
+        snapshot = None
+        gc.collect()
+        started = time.perf_counter()
+        # What get_snapshot() does on first load, minus the watcher
+        snapshot = app_v10._load_batch_snapshot(path)
+        load_times.append(time.perf_counter() - started)
+    os.remove(path)
+
+    shapes: Dict[str, Any] = {}
+    for shape, profiles in matrix.items():
+        timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        for profile in profiles:
+            _run_profile(profile, snapshot, timings)
+
+        tracemalloc.start()
+        try:
+            peaks = _stage_peaks(profiles[0], snapshot)
+        finally:
+            tracemalloc.stop()
+
+        shapes[shape] = {
+            stage: dict(percentiles(timings[stage]), peak_alloc_kb=round(peaks[stage] / 1024, 1))
+            for stage in STAGES
+        }
+        print(f"[INFO] size {size}: {shape} done", file=sys.stderr)
+
+    result = {
+        "programs": len(snapshot.programs),
+        "load_programs": percentiles(load_times),
+        "shapes": shapes,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    if memory is not None:
+        result["worker_memory"] = memory
+    return result
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Stage percentiles in `current` that are more than `threshold` times
+    slower than in `baseline`, as readable lines.
+    """
+    regressions: List[str] = []
+
+    def _check(label: str, old: Dict[str, Any], new: Dict[str, Any]) -> None:
+        for key in ("p50_ms", "p95_ms"):
+            if old.get(key) and new.get(key) and new[key] > old[key] * threshold:
+                regressions.append(f"{label} {key}: {old[key]} -> {new[key]}")
+
+    for size, result in current["sizes"].items():
+        before = baseline.get("sizes", {}).get(size)
+        if before is None:
+            continue
+        _check(f"{size} load_programs", before["load_programs"], result["load_programs"])
+        for shape, stages in result["shapes"].items():
+            for stage, stats in stages.items():
+                old = before["shapes"].get(shape, {}).get(stage)
+                if old:
+                    _check(f"{size} {shape} {stage}", old, stats)
+    return regressions
+
+
+def run_benchmarks(
+    sizes: List[int],
+    per_shape: int = 20,
+    load_runs: int = 3,
+    seed: int = 0,
+    fork_workers: int = 0,
+) -> Dict[str, Any]:
+    source = app_v10.load_programs()
+    if not source:
+        raise SystemExit(f"[ERROR] No programs in {app_v10.DATA_PATH}")
+
+    matrix = profile_matrix(per_shape, seed)
+    results: Dict[str, Any] = {
+        "format": RESULTS_FORMAT_VERSION,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "ranking_engine": app_v10.RANKING_ENGINE,
+            "numpy": app_v10.np.__version__ if app_v10.np is not None else None,
+        },
+        "settings": {
+            "profiles_per_shape": per_shape,
+            "load_runs": load_runs,
+            "seed": seed,
+            "fork_workers": fork_workers,
+        },
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        # Ascending, so the process-wide peak RSS reported per size is its own
+        for size in sorted(sizes):
+            results["sizes"][str(size)] = bench_size(
+                size, matrix, source, workdir, load_runs, seed, fork_workers
+            )
+    return results
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="bench_v10.py", description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes",
+        default=",".join(str(s) for s in DEFAULT_SIZES),
+        help="comma-separated catalog sizes",
+    )
+    parser.add_argument("--profiles-per-shape", type=int, default=20)
+    parser.add_argument("--load-runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--fork-workers",
+        type=int,
+        default=0,
+        help="also measure per-worker memory of N forked workers (default 0: off)",
+    )
+    parser.add_argument("--out", default="bench_results.json", help="results file")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.25,
+        help="slowdown ratio reported as a regression (default 1.25)",
+    )
+    opts = parser.parse_args(argv)
+
+    sizes = [int(s) for s in opts.sizes.split(",") if s.strip()]
+    results = run_benchmarks(
+        sizes, opts.profiles_per_shape, max(opts.load_runs, 1), opts.seed, opts.fork_workers
+    )
+
+    with open(opts.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"[INFO] results written to {opts.out}", file=sys.stderr)
+
+    if opts.baseline:
+        with open(opts.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, opts.threshold)
+        for line in regressions:
+            print(f"[REGRESSION] {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,44 @@
+"""
+Gunicorn settings for Course Finder v10 with the dataset shared by all workers.
+
+    gunicorn -c gunicorn_v10.conf.py app_v10:app
+
+The app and its dataset snapshot are loaded once in the master process and
+frozen (when_ready) before workers are forked, so the workers share those memory pages
+copy-on-write instead of each holding (and parsing) their own copy.
+
+Environment:
+  COURSE_FINDER_V10_BIND     address to listen on (default 0.0.0.0:8000)
+  COURSE_FINDER_V10_WORKERS  number of worker processes (default 4)
+
+After changing the dataset file, send SIGHUP to the master: it reloads the
+file before forking the replacement workers, which then share the new
+snapshot. Until then, each worker's own hot reload keeps it current with a
+private copy.
+"""
+
+import os
+
+bind = os.environ.get("COURSE_FINDER_V10_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("COURSE_FINDER_V10_WORKERS", "4"))
+
+# Import app_v10 in the master, before any worker is forked
+preload_app = True
+
+
+def when_ready(server):
+    import app_v10
+
+    snapshot = app_v10.preload_dataset()
+    server.log.info(
+        "Preloaded dataset version %s (%s programs)",
+        snapshot.version,
+        len(snapshot.programs),
+    )
+
+
+def on_reload(server):
+    import app_v10
+
+    # Once per SIGHUP, before the replacement workers are forked
+    app_v10.preload_dataset()
@@ -5,7 +5,9 @@
   - GPA / tuition sliders
   - Quick Fill + Clear
   - Filters + sorting on recommendations
-  - Details modal wiring
+  - "Load more" paging of recommendation cards
+  - Lazy card details (chips, fit bars, explanations) from the details API
+  - Details modal wiring (incl. "Similar programs")
 */
 
 document.addEventListener("DOMContentLoaded", () => {
@@ -32,6 +34,7 @@ document.addEventListener("DOMContentLoaded", () => {
   const sortBySelect = document.getElementById("sort-by");
   const cardsContainer = document.getElementById("recommendations-list");
   const resultCount = document.getElementById("result-count");
+  const loadMoreBtn = document.getElementById("btn-load-more");
 
   // ------------------------------------------------------------------------
   // Required fields
@@ -166,7 +169,7 @@ document.addEventListener("DOMContentLoaded", () => {
     if (!profileForm) return;
     profileForm.reset();
 
-    ["current_status", "home_state", "location_pref"].forEach((id) => {
+    ["current_status", "home_state", "location_pref", "max_distance"].forEach((id) => {
       const el = document.getElementById(id);
       if (el) el.value = "";
     });
@@ -250,7 +253,17 @@ document.addEventListener("DOMContentLoaded", () => {
     });
 
     if (resultCount) {
-      resultCount.textContent = String(visible);
+      // Report server counts (all matches, not just loaded pages) where they apply:
+      // the total without filters, the degree facet count for a degree filter alone
+      const total = parseInt(cardsContainer.dataset.total || "", 10);
+      const degreeCount = parseInt(
+        filterDegree?.selectedOptions[0]?.dataset.count || "",
+        10
+      );
+      let count = visible;
+      if (!deg && Number.isNaN(maxT) && !Number.isNaN(total)) count = total;
+      else if (deg && Number.isNaN(maxT) && !Number.isNaN(degreeCount)) count = degreeCount;
+      resultCount.textContent = String(count);
     }
 
     // Sort all cards (visible + hidden) by chosen key
@@ -289,12 +302,230 @@ document.addEventListener("DOMContentLoaded", () => {
 
   applyFiltersAndSort();
 
+  // ------------------------------------------------------------------------
+  // Load more: fetch the next page of cards rendered by the server
+  // ------------------------------------------------------------------------
+  async function loadMoreRecommendations() {
+    if (!loadMoreBtn || !cardsContainer) return;
+    const offset = loadMoreBtn.dataset.nextOffset;
+    if (!offset) return;
+
+    loadMoreBtn.disabled = true;
+    try {
+      const resp = await fetch(
+        `/recommendations?offset=${encodeURIComponent(offset)}`,
+        { headers: { Accept: "application/json" } }
+      );
+      if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+      const data = await resp.json();
+
+      cardsContainer.insertAdjacentHTML("beforeend", data.html || "");
+      cardsContainer.dataset.total = String(data.total ?? "");
+      observeCards();
+
+      if (data.next_offset === null || data.next_offset === undefined) {
+        loadMoreBtn.parentElement.classList.add("d-none");
+        delete loadMoreBtn.dataset.nextOffset;
+      } else {
+        loadMoreBtn.dataset.nextOffset = String(data.next_offset);
+      }
+      applyFiltersAndSort();
+    } catch (err) {
+      console.error("Could not load more recommendations", err);
+    } finally {
+      loadMoreBtn.disabled = false;
+    }
+  }
+
+  if (loadMoreBtn) {
+    loadMoreBtn.addEventListener("click", (e) => {
+      e.preventDefault();
+      loadMoreRecommendations();
+    });
+  }
+
+  // ------------------------------------------------------------------------
+  // Card details: fetched per program for the current profile, the first
+  // time a card nears the viewport or its details modal opens
+  // ------------------------------------------------------------------------
+  const detailsRequests = new Map();
+
+  function fetchDetails(programId) {
+    let request = detailsRequests.get(programId);
+    if (!request) {
+      const profileKey = cardsContainer?.dataset.profile || "";
+      request = fetch(
+        `/api/programs/${encodeURIComponent(programId)}/details` +
+          `?profile=${encodeURIComponent(profileKey)}`,
+        { headers: { Accept: "application/json" } }
+      ).then((resp) => {
+        if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+        return resp.json();
+      });
+      // A failed request may be retried later
+      request.catch(() => detailsRequests.delete(programId));
+      detailsRequests.set(programId, request);
+    }
+    return request;
+  }
+
+  function element(tag, className, text) {
+    const el = document.createElement(tag);
+    if (className) el.className = className;
+    if (text !== undefined) el.textContent = text;
+    return el;
+  }
+
+  function renderCardDetails(card, details) {
+    const target = card.querySelector(".program-details");
+    if (!target || target.dataset.loaded) return;
+    const program = details.program || {};
+    const matches = new Set(details.interest_matches || []);
+    target.replaceChildren();
+
+    const areas = program.interest_areas || [];
+    if (areas.length) {
+      const chips = element("div", "mt-2");
+      areas.forEach((area) => {
+        chips.appendChild(
+          element("span", matches.has(area) ? "cf-chip cf-chip-match" : "cf-chip", area)
+        );
+      });
+      target.appendChild(chips);
+    }
+    if (program.program_snippet) {
+      target.appendChild(
+        element("p", "program-snippet small text-secondary mt-2 mb-0", program.program_snippet)
+      );
+    }
+
+    const row = element("div", "row mt-3 mb-2");
+    const barsCol = element("div", "col-md-6");
+    barsCol.appendChild(element("div", "small text-muted mb-1", "Fit dimensions"));
+    const bars = element("div", "fit-dimensions");
+    const fitBars = details.fit_bars || {};
+    [
+      ["Interests", fitBars.interests],
+      ["Degree", fitBars.degree],
+      ["Location", fitBars.location],
+    ].forEach(([label, pct]) => {
+      const dimension = element("div", "fit-dimension");
+      dimension.appendChild(element("span", "", label));
+      const bar = element("div", "fit-bar");
+      const fill = element("div", "fit-bar-fill");
+      fill.style.width = `${pct || 0}%`;
+      bar.appendChild(fill);
+      dimension.appendChild(bar);
+      bars.appendChild(dimension);
+    });
+    barsCol.appendChild(bars);
+    row.appendChild(barsCol);
+    if (program.median_salary_band) {
+      const salaryCol = element("div", "col-md-6");
+      salaryCol.appendChild(
+        element(
+          "div",
+          "small text-muted",
+          `Typical early-career earnings: ${program.median_salary_band}`
+        )
+      );
+      row.appendChild(salaryCol);
+    }
+    target.appendChild(row);
+
+    const why = element("div", "small text-muted");
+    why.appendChild(element("strong", "", "Why this recommendation?"));
+    [details.why_interests, details.why_academic, details.why_practical].forEach((text) => {
+      why.appendChild(element("div", "", text || ""));
+    });
+    target.appendChild(why);
+
+    target.dataset.loaded = "true";
+    target.hidden = false;
+  }
+
+  async function loadCardDetails(card) {
+    const programId = card.dataset.programId;
+    if (!programId) return null;
+    try {
+      const details = await fetchDetails(programId);
+      renderCardDetails(card, details);
+      return details;
+    } catch (err) {
+      console.error("Could not load program details", err);
+      return null;
+    }
+  }
+
+  const cardObserver =
+    "IntersectionObserver" in window
+      ? new IntersectionObserver(
+          (entries) => {
+            entries.forEach((entry) => {
+              if (!entry.isIntersecting) return;
+              cardObserver.unobserve(entry.target);
+              loadCardDetails(entry.target);
+            });
+          },
+          { rootMargin: "200px 0px" }
+        )
+      : null;
+
+  function observeCards() {
+    if (!cardObserver || !cardsContainer) return;
+    cardsContainer
+      .querySelectorAll(".program-card:not([data-observed])")
+      .forEach((card) => {
+        card.dataset.observed = "true";
+        cardObserver.observe(card);
+      });
+  }
+
+  observeCards();
+
   // ------------------------------------------------------------------------
   // Details modal
   // ------------------------------------------------------------------------
   const detailsModal = document.getElementById("detailsModal");
+  const similarSection = document.getElementById("detailsModalSimilarSection");
+  const similarList = document.getElementById("detailsModalSimilar");
+
+  async function loadSimilarPrograms(programId) {
+    if (!similarSection || !similarList) return;
+    similarSection.hidden = true;
+    similarList.replaceChildren();
+    similarList.dataset.programId = programId;
+
+    try {
+      const resp = await fetch(
+        `/api/programs/${encodeURIComponent(programId)}/similar?k=5`,
+        { headers: { Accept: "application/json" } }
+      );
+      if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+      const data = await resp.json();
+      // Ignore a late response for a program that is no longer shown
+      if (similarList.dataset.programId !== programId) return;
+
+      for (const p of data.similar || []) {
+        const item = document.createElement("li");
+        item.textContent = [p.program_name, p.institution_name]
+          .filter(Boolean)
+          .join(" · ");
+        similarList.appendChild(item);
+      }
+      similarSection.hidden = similarList.children.length === 0;
+    } catch (err) {
+      console.error("Could not load similar programs", err);
+    }
+  }
+
+  function setText(id, text) {
+    const el = document.getElementById(id);
+    if (el) el.textContent = text;
+  }
+
   if (detailsModal) {
-    detailsModal.addEventListener("show.bs.modal", (event) => {
+    detailsModal.addEventListener("show.bs.modal", async (event) => {
       const triggerBtn = event.relatedTarget;
       if (!triggerBtn) return;
       const programId = triggerBtn.getAttribute("data-program-id");
@@ -304,12 +535,8 @@ document.addEventListener("DOMContentLoaded", () => {
       const card = document.querySelector(selector);
       if (!card) return;
 
-      const title = card.querySelector(".card-title")?.textContent || "";
-      const institutionLine =
-        card.querySelector(".text-muted.small")?.textContent || "";
+      // Summary fields are on the minimal card; the rest comes with the details
       const fitScore = card.dataset.fitScore || "";
-      const degreeLevel = card.dataset.degreeLevel || "";
-
       const tuition = (() => {
         const t = card.dataset.tuition;
         if (!t) return "Not available";
@@ -318,25 +545,28 @@ document.addEventListener("DOMContentLoaded", () => {
         return `$${num.toLocaleString("en-US", { maximumFractionDigits: 0 })}/year`;
       })();
 
-      const whyBlocks = card.querySelectorAll(".mb-2.small.text-muted div");
-      const whyInterests = whyBlocks[0]?.textContent || "";
-      const whyAcademic = whyBlocks[1]?.textContent || "";
-      const whyPractical = whyBlocks[2]?.textContent || "";
-
-      document.getElementById("detailsModalTitle").textContent = title;
-      document.getElementById("detailsModalInstitution").textContent =
-        institutionLine;
-      document.getElementById("detailsModalFitScore").textContent = fitScore
-        ? `${fitScore}/100`
-        : "";
-      document.getElementById("detailsModalDegree").textContent = degreeLevel;
-      document.getElementById("detailsModalTuition").textContent = tuition;
-      document.getElementById("detailsModalWhyInterests").textContent =
-        whyInterests;
-      document.getElementById("detailsModalWhyAcademic").textContent =
-        whyAcademic;
-      document.getElementById("detailsModalWhyPractical").textContent =
-        whyPractical;
+      setText("detailsModalTitle", card.querySelector(".card-title")?.textContent.trim() || "");
+      setText(
+        "detailsModalInstitution",
+        card.querySelector(".program-institution")?.textContent.trim() || ""
+      );
+      setText("detailsModalFitScore", fitScore ? `${fitScore}/100` : "");
+      setText("detailsModalDegree", card.dataset.degreeLevel || "");
+      setText("detailsModalTuition", tuition);
+      ["detailsModalWhyInterests", "detailsModalWhyAcademic", "detailsModalWhyPractical"].forEach(
+        (id) => setText(id, "Loading…")
+      );
+      detailsModal.dataset.programId = programId;
+
+      loadSimilarPrograms(programId);
+
+      const details = await loadCardDetails(card);
+      // Ignore a late response for a program that is no longer shown
+      if (detailsModal.dataset.programId !== programId) return;
+      const unavailable = "Details are unavailable. Generate recommendations again.";
+      setText("detailsModalWhyInterests", details ? details.why_interests : unavailable);
+      setText("detailsModalWhyAcademic", details ? details.why_academic : "");
+      setText("detailsModalWhyPractical", details ? details.why_practical : "");
     });
   }
 });
@@ -0,0 +1,373 @@
+"""
+Replay captured traffic against Course Finder v10 and report how it held up.
+
+Reads a capture file (COURSE_FINDER_V10_CAPTURE, one anonymized profile per
+line with "captured_at" and "endpoint") and sends each profile to the
+endpoint it was captured from: the profile form to POST /, API calls to
+POST /api/recommendations. Plain profile-per-line files replay as form
+posts.
+
+    python replay_v10.py captured.jsonl
+    python replay_v10.py captured.jsonl --target http://127.0.0.1:8000 --speed 10 --concurrency 8
+    python replay_v10.py captured.jsonl --speed 0 --concurrency 4 --out replay.json
+
+By default requests go through the Flask test client in this process. With
+--target they go over HTTP, e.g. to a local gunicorn (gunicorn_v10.conf.py).
+
+Requests keep their recorded spacing, divided by --speed (--speed 0 sends
+them back to back). At most --concurrency are in flight. When all are busy,
+the next request starts late, and that delay is reported as "lag". A
+growing lag means the target cannot keep up with the recorded rate at this
+speed.
+"""
+
+import argparse
+import http.client
+import json
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+REPORT_FORMAT_VERSION = 1
+FORM_ENDPOINT = "/"
+API_ENDPOINT = "/api/recommendations"
+PROFILE_FIELDS = (
+    "role",
+    "current_status",
+    "home_state",
+    "gpa",
+    "degree_levels",
+    "interest_areas",
+    "max_tuition",
+    "sat_score",
+    "act_score",
+    "location_pref",
+    "max_distance",
+    "q",
+)
+
+
+# ---------------------------------------------------------------------------
+# Captured requests
+# ---------------------------------------------------------------------------
+
+class Event:
+    """
+    One request to replay: when it was captured, where it goes, its body.
+    """
+
+    __slots__ = ("captured_at", "endpoint", "body", "content_type")
+
+    def __init__(self, captured_at: Optional[float], endpoint: str, body: bytes, content_type: str):
+        self.captured_at = captured_at
+        self.endpoint = endpoint
+        self.body = body
+        self.content_type = content_type
+
+
+def _form_pairs(record: Dict[str, Any]) -> List[Tuple[str, str]]:
+    # As a browser submits the profile form: one pair per list item, no empty fields
+    pairs: List[Tuple[str, str]] = []
+    for field in PROFILE_FIELDS:
+        value = record.get(field)
+        for item in value if isinstance(value, list) else [value]:
+            if item is None or item == "":
+                continue
+            if isinstance(item, float):
+                item = f"{item:g}"
+            pairs.append((field, str(item)))
+    return pairs
+
+
+def event_for(record: Dict[str, Any]) -> Event:
+    """
+    The request a captured record replays as.
+    """
+    captured_at = record.get("captured_at")
+    if not isinstance(captured_at, (int, float)) or isinstance(captured_at, bool):
+        captured_at = None
+    if record.get("endpoint") == API_ENDPOINT:
+        payload = {field: record.get(field) for field in PROFILE_FIELDS}
+        for key in ("offset", "limit"):
+            if record.get(key) is not None:
+                payload[key] = record[key]
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        return Event(captured_at, API_ENDPOINT, body, "application/json")
+    body = urlencode(_form_pairs(record)).encode("ascii")
+    return Event(captured_at, FORM_ENDPOINT, body, "application/x-www-form-urlencoded")
+
+
+def read_events(path: str, limit: Optional[int] = None) -> Iterator[Event]:
+    """
+    Events in file order; blank and malformed lines are skipped.
+    """
+    count = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if limit is not None and count >= limit:
+                return
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                count += 1
+                yield event_for(record)
+
+
+# ---------------------------------------------------------------------------
+# Targets
+# ---------------------------------------------------------------------------
+
+class TestClientTarget:
+    """
+    Sends requests to app_v10.app in this process, one test client per thread.
+    """
+
+    name = "test-client"
+
+    def __init__(self) -> None:
+        import app_v10
+
+        self.app = app_v10.app
+        app_v10.get_snapshot()  # load the dataset before the clock starts
+        self._local = threading.local()
+
+    def send(self, event: Event) -> int:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.post(event.endpoint, data=event.body, content_type=event.content_type)
+        response.get_data()  # the page streams; include rendering
+        return response.status_code
+
+
+class HTTPTarget:
+    """
+    Sends requests over HTTP/1.1 keep-alive, one connection per thread.
+    """
+
+    def __init__(self, url: str, timeout: float):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Unsupported target URL: {url}")
+        self.name = url
+        self.https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            connection = self._local.connection = cls(self.host, self.port, timeout=self.timeout)
+        return connection
+
+    def send(self, event: Event) -> int:
+        connection = self._connection()
+        try:
+            connection.request(
+                "POST",
+                self.prefix + event.endpoint,
+                body=event.body,
+                headers={"Content-Type": event.content_type},
+            )
+            response = connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            # Reconnect on the next request
+            connection.close()
+            self._local.connection = None
+            raise
+
+
+# ---------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """
+    Nearest-rank p50/p90/p95/p99 and max of samples given in seconds, in ms.
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def _rank(q: float) -> float:
+        index = max(int(-(-q * len(ordered) // 100)) - 1, 0)
+        return round(ordered[index] * 1000.0, 3)
+
+    return {
+        "p50_ms": _rank(50),
+        "p90_ms": _rank(90),
+        "p95_ms": _rank(95),
+        "p99_ms": _rank(99),
+        "max_ms": round(ordered[-1] * 1000.0, 3),
+    }
+
+
+def replay(
+    events: Iterator[Event],
+    target: Any,
+    speed: float = 1.0,
+    concurrency: int = 4,
+) -> Dict[str, Any]:
+    """
+    Send `events` to `target` on their recorded schedule and summarize.
+
+    The schedule is the capture timestamps relative to the first one,
+    divided by `speed`. With speed 0, or for events without a timestamp,
+    requests are sent as soon as a worker is free.
+    """
+    # Bounded: when every worker is busy the dispatcher waits, and the
+    # wait shows up as lag instead of an unbounded backlog
+    pending: "queue.Queue[Optional[Tuple[Event, float]]]" = queue.Queue(concurrency)
+    lock = threading.Lock()
+    latencies: Dict[str, List[float]] = {}
+    lags: List[float] = []
+    statuses: Dict[str, int] = {}
+    failures: Dict[str, int] = {}
+    clock = time.perf_counter
+
+    def _worker() -> None:
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            event, due = item
+            started = clock()
+            try:
+                outcome = str(target.send(event))
+            except Exception as exc:  # counted as an error, replay goes on
+                outcome = type(exc).__name__
+            elapsed = clock() - started
+            with lock:
+                latencies.setdefault(event.endpoint, []).append(elapsed)
+                lags.append(max(started - due, 0.0))
+                if outcome.isdigit():
+                    statuses[outcome] = statuses.get(outcome, 0) + 1
+                else:
+                    failures[outcome] = failures.get(outcome, 0) + 1
+
+    threads = [
+        threading.Thread(target=_worker, name=f"replay-{i}", daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+
+    first_captured: Optional[float] = None
+    started = clock()
+    for event in events:
+        due = clock()
+        if speed > 0 and event.captured_at is not None:
+            if first_captured is None:
+                first_captured = event.captured_at
+            due = started + max(event.captured_at - first_captured, 0.0) / speed
+            delay = due - clock()
+            if delay > 0:
+                time.sleep(delay)
+        pending.put((event, due))
+    for _ in threads:
+        pending.put(None)
+    for thread in threads:
+        thread.join()
+    duration = clock() - started
+
+    sent = sum(len(samples) for samples in latencies.values())
+    errors = sum(count for status, count in statuses.items() if int(status) >= 400)
+    errors += sum(failures.values())
+    every = [sample for samples in latencies.values() for sample in samples]
+    return {
+        "format_version": REPORT_FORMAT_VERSION,
+        "target": target.name,
+        "settings": {"speed": speed, "concurrency": concurrency},
+        "requests": sent,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(sent / duration, 2) if duration > 0 else 0.0,
+        "errors": errors,
+        "error_rate": round(errors / sent, 4) if sent else 0.0,
+        "statuses": dict(sorted(statuses.items())),
+        "failures": dict(sorted(failures.items())),
+        "latency": percentiles(every),
+        "latency_by_endpoint": {
+            endpoint: dict(percentiles(samples), requests=len(samples))
+            for endpoint, samples in sorted(latencies.items())
+        },
+        "lag": percentiles(lags),
+    }
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    latency = report["latency"]
+    lag = report["lag"]
+    print(
+        f"{report['requests']} requests in {report['duration_s']}s to {report['target']}: "
+        f"{report['throughput_rps']} req/s, {report['errors']} errors ({report['error_rate']:.2%})"
+    )
+    if latency:
+        print(
+            "latency ms: "
+            + " ".join(f"{key[:-3]}={value}" for key, value in latency.items())
+        )
+        print("lag ms:     " + " ".join(f"{key[:-3]}={value}" for key, value in lag.items()))
+    for endpoint, row in report["latency_by_endpoint"].items():
+        print(f"  {endpoint:<22} {row['requests']:>7} requests  p50={row['p50_ms']} p99={row['p99_ms']}")
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="replay_v10.py", description=__doc__.split("\n\n")[0])
+    parser.add_argument("capture", help="capture file (JSONL)")
+    parser.add_argument(
+        "--target",
+        default="test-client",
+        help="'test-client' (default: in process) or a base URL such as http://127.0.0.1:8000",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="divide the recorded inter-arrival times by this (0: no pauses)",
+    )
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight at most")
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first N requests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="HTTP timeout in seconds")
+    parser.add_argument("--out", default=None, help="also write the report as JSON")
+    opts = parser.parse_args(argv)
+
+    try:
+        target = (
+            TestClientTarget()
+            if opts.target == "test-client"
+            else HTTPTarget(opts.target, opts.timeout)
+        )
+        report = replay(
+            read_events(opts.capture, opts.limit),
+            target,
+            speed=max(opts.speed, 0.0),
+            concurrency=max(opts.concurrency, 1),
+        )
+    except (OSError, ValueError) as exc:
+        print(f"[ERROR] {exc}", file=sys.stderr)
+        return 1
+
+    _print_report(report)
+    if opts.out:
+        with open(opts.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"[INFO] report written to {opts.out}", file=sys.stderr)
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
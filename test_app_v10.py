@@ -0,0 +1,770 @@
+"""
+Fast checks for app_v10 that are too slow to run by hand on every change.
+
+    python -m pytest -q
+
+The full parity run stays a CLI (python app_v10.py check-engines); these
+tests run the same comparison with fewer profiles.
+"""
+
+import dataclasses
+import gc
+import json
+import os
+import re
+
+import pytest
+
+import app_v10
+import bench_v10
+
+CARD_ID_RE = re.compile(r'class="card program-card[^"]*"\s+data-program-id="([^"]+)"')
+
+requires_numpy = pytest.mark.skipif(app_v10.np is None, reason="numpy is not installed")
+
+
+@pytest.fixture(scope="module")
+def shipped_programs():
+    programs = app_v10.load_programs()
+    assert programs, "programs_v7.json did not load"
+    return programs
+
+
+@pytest.fixture(scope="module")
+def synthetic_programs(shipped_programs):
+    # The size at which the numpy engine starts to pay off
+    catalog = app_v10.build_synthetic_catalog(shipped_programs, 20000, seed=7)
+    return app_v10.normalize_programs(catalog)
+
+
+def test_program_index_filter_matches_the_scan(shipped_programs):
+    index = app_v10.ProgramIndex(shipped_programs)
+    degrees = [[], ["Bachelor's"], ["Certificate", "Associate"]]
+    interests = [[], ["Business"], ["Engineering", "Healthcare"]]
+    budgets = [None, 0.0, 12000.0, 40000.0]
+    locations = [("", ""), ("instate", "IL"), ("instate", ""), ("anywhere", "CA")]
+    profiles = [
+        {
+            "degree_levels": degree_levels,
+            "interest_areas": interest_areas,
+            "max_tuition": max_tuition,
+            "location_pref": location_pref,
+            "home_state": home_state,
+        }
+        for degree_levels in degrees
+        for interest_areas in interests
+        for max_tuition in budgets
+        for location_pref, home_state in locations
+    ]
+    for profile in profiles:
+        expected = app_v10.filter_programs_for_profile(profile, shipped_programs)
+        assert app_v10.filter_programs_for_profile(profile, shipped_programs, index) == expected
+
+
+@requires_numpy
+def test_engines_match_on_shipped_dataset(shipped_programs):
+    profiles = app_v10._sample_profiles(200, seed=1)
+    assert app_v10._compare_engines(shipped_programs, profiles) == 0
+
+
+@requires_numpy
+def test_engines_match_on_synthetic_catalog(synthetic_programs):
+    profiles = app_v10._sample_profiles(40, seed=2)
+    assert app_v10._compare_engines(synthetic_programs, profiles) == 0
+
+
+def test_load_more_pages_through_every_match(shipped_programs):
+    client = app_v10.app.test_client()
+    form = {"interest_areas": ["Business", "Engineering"], "home_state": "IL"}
+    first = CARD_ID_RE.findall(client.post("/", data=form).get_data(as_text=True))
+    page_size = app_v10.RECOMMENDATIONS_PAGE_SIZE
+    assert CARD_ID_RE.findall(client.get("/recommendations?offset=0").get_json()["html"]) == first
+    assert len(first) == page_size
+
+    seen, offset = list(first), page_size
+    while offset is not None:
+        page = client.get(f"/recommendations?offset={offset}").get_json()
+        cards = CARD_ID_RE.findall(page["html"])
+        assert 0 < len(cards) <= page_size
+        seen.extend(cards)
+        offset = page["next_offset"]
+    assert len(seen) == page["total"] > page_size
+    assert len(set(seen)) == len(seen)
+
+
+def test_recommendation_cache_evicts_least_recently_used():
+    cache = app_v10.RecommendationCache(2, ttl=60.0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_recommendation_cache_expires_entries():
+    cache = app_v10.RecommendationCache(8, ttl=0.0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_profile_fingerprint_ignores_order_and_irrelevant_fields():
+    profile = {
+        "degree_levels": ["Associate", "Bachelor's"],
+        "interest_areas": ["Arts", "Business"],
+        "home_state": "IL",
+        "location_pref": "instate",
+        "max_tuition": 20000,
+        "gpa": 3.5,
+    }
+    same = dict(
+        profile,
+        degree_levels=["Bachelor's", "Associate"],
+        interest_areas=["Business", "Arts", "Arts"],
+        location_pref="InState",
+        max_tuition=20000.0,
+        role="parent",
+    )
+    assert app_v10.profile_fingerprint(same) == app_v10.profile_fingerprint(profile)
+    assert app_v10.profile_fingerprint(dict(profile, max_tuition=0)) == app_v10.profile_fingerprint(
+        dict(profile, max_tuition=None)
+    )
+    assert app_v10.profile_fingerprint(dict(profile, home_state="WI")) != app_v10.profile_fingerprint(profile)
+
+
+def test_recommend_page_reuses_cached_page(shipped_programs):
+    snapshot = app_v10.get_snapshot()
+    app_v10.recommendation_cache.clear()
+    profile = {"interest_areas": ["Business", "Engineering"], "location_pref": ""}
+    first = app_v10.recommend_page(profile, snapshot)
+    hits = app_v10.recommendation_cache.hits
+    again = app_v10.recommend_page({"interest_areas": ["Engineering", "Business"]}, snapshot)
+    assert again is first
+    assert app_v10.recommendation_cache.hits == hits + 1
+
+
+def test_reload_serves_a_new_snapshot_and_drops_cached_pages(tmp_path, monkeypatch):
+    with open(app_v10.DATA_PATH, encoding="utf-8") as f:
+        raw = json.load(f)
+    path = tmp_path / "programs.json"
+    path.write_text(json.dumps(raw[:30]), encoding="utf-8")
+    monkeypatch.setattr(app_v10, "DATA_PATH", str(path))
+    monkeypatch.setattr(app_v10, "DATA_RELOAD_INTERVAL", 0.0)
+    monkeypatch.setattr(app_v10, "_snapshot", None)
+    monkeypatch.setattr(app_v10, "_checked_mtime", None)
+
+    profile = {"interest_areas": ["Business"]}
+    before = app_v10.get_snapshot()
+    page, total = app_v10.recommend_page(profile, before)
+    assert app_v10.recommend_page(profile, before)[0] is page
+
+    path.write_text(json.dumps(raw[:60]), encoding="utf-8")
+    os.utime(path, (before.source_mtime + 10, before.source_mtime + 10))
+    assert app_v10.reload_programs()
+    after = app_v10.get_snapshot()
+    assert after.version == before.version + 1
+    assert app_v10.recommendation_cache.stats()["entries"] == 0
+    assert app_v10.recommend_page(profile, after)[1] > total
+
+
+def test_program_records_round_trip_and_recommendations_share_them(shipped_programs):
+    raw = dict(shipped_programs[0].to_dict(), campus_notes="Open day in May")
+    raw.pop("city", None)
+    program = app_v10.Program(raw)
+    assert program.to_dict() == raw
+    assert program.interest_areas == tuple(raw["interest_areas"])
+    assert program.city is None and program.campus_notes == "Open day in May"
+    with pytest.raises(AttributeError):
+        program.program_name = "Renamed"
+
+    rec = app_v10.Recommendation(program, 50.0, 20.0, 10.0, 80.0, 100)
+    assert rec.program_name == program.program_name and rec["fit_score"] == 100
+    assert rec.to_dict() == dict(
+        raw,
+        interest_score_component=50.0,
+        degree_score_component=20.0,
+        location_score_component=10.0,
+        raw_total=80.0,
+        fit_score=100,
+    )
+
+    shared = {id(p) for p in shipped_programs}
+    ranked = app_v10.rank_programs({"interest_areas": ["Business"]}, shipped_programs, 10)
+    assert ranked and all(id(r.program) in shared for r in ranked)
+
+
+def test_lazy_explanations_equal_the_eager_texts(shipped_programs):
+    profile = {
+        "interest_areas": ["Business", "Engineering"],
+        "home_state": "IL",
+        "max_tuition": 15000.0,
+        "gpa": 3.2,
+    }
+    recs = app_v10.build_explanations(profile, app_v10.rank_programs(profile, shipped_programs))
+    assert recs and all(rec._why_interests is None for rec in recs)
+    for rec in recs:
+        p = rec.program
+        assert rec.why_interests == app_v10._build_interests_reason(
+            {"Business", "Engineering"}, set(p.interest_areas or ())
+        )
+        assert rec.why_academic == app_v10._build_academic_reason(3.2, p.selectivity_band)
+        assert rec.why_practical == app_v10._build_practical_reason(
+            "IL", p.state or None, 15000.0, p.annual_tuition
+        )
+
+
+def test_api_recommendations_etag_and_not_modified(shipped_programs):
+    client = app_v10.app.test_client()
+    body = {"interest_areas": ["Engineering"], "degree_levels": ["Bachelor's"], "limit": 5}
+
+    first = client.post("/api/recommendations", json=body)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    data = first.get_json()
+    assert len(data["recommendations"]) <= 5
+    assert data["total"] >= len(data["recommendations"])
+
+    cached = client.post("/api/recommendations", json=body, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert not cached.data
+
+    other = client.post("/api/recommendations", json=dict(body, limit=6), headers={"If-None-Match": etag})
+    assert other.status_code == 200
+    assert other.headers["ETag"] != etag
+
+
+def test_api_recommendations_rejects_non_object_body():
+    client = app_v10.app.test_client()
+    assert client.post("/api/recommendations", json=[1, 2]).status_code == 400
+
+
+def test_index_page_streams_the_header_before_the_cards(shipped_programs):
+    client = app_v10.app.test_client()
+    form = {"interest_areas": ["Business", "Engineering"], "home_state": "IL"}
+    response = client.post("/", data=form, buffered=False)
+    assert response.is_streamed
+    chunks = [chunk.decode("utf-8") for chunk in response.response]
+    response.close()
+    assert len(chunks) > 1
+    assert "<html" in chunks[0] and not CARD_ID_RE.search(chunks[0])
+    assert len(CARD_ID_RE.findall("".join(chunks))) == app_v10.RECOMMENDATIONS_PAGE_SIZE
+
+
+def test_batch_matches_the_api_line_for_line(tmp_path, shipped_programs):
+    profiles = app_v10._sample_profiles(12, seed=3)
+    lines = [json.dumps(p) for p in profiles[:5]] + ["not json", "", "[1]"]
+    lines += [json.dumps(p) for p in profiles[5:]]
+    in_path, out_path = tmp_path / "profiles.jsonl", tmp_path / "results.jsonl"
+    in_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    assert app_v10.run_batch(str(in_path), str(out_path), workers=2, chunk_size=3, limit=5) == 0
+    results = [json.loads(line) for line in out_path.read_text(encoding="utf-8").splitlines()]
+    assert len(results) == len(profiles) + 2
+    assert "error" in results[5] and "error" in results[6]
+
+    client = app_v10.app.test_client()
+    for profile, result in zip(profiles, results[:5] + results[7:]):
+        expected = client.post("/api/recommendations", json=dict(profile, limit=5)).get_json()
+        assert result == {"total": expected["total"], "recommendations": expected["recommendations"]}
+
+
+def test_benchmark_reports_every_stage_and_flags_regressions(tmp_path):
+    out = tmp_path / "bench.json"
+    args = ["--sizes", "300", "--profiles-per-shape", "2", "--load-runs", "1", "--out", str(out)]
+    assert bench_v10.main(args) == 0
+    results = json.loads(out.read_text(encoding="utf-8"))
+    size = results["sizes"]["300"]
+    assert size["programs"] == 300
+    assert set(size["shapes"]) == set(bench_v10.profile_matrix(1))
+    for stages in size["shapes"].values():
+        assert set(stages) == set(bench_v10.STAGES)
+
+    assert bench_v10.compare_results(results, results, 1.25) == []
+    slower = json.loads(json.dumps(results))
+    slower["sizes"]["300"]["load_programs"]["p50_ms"] = size["load_programs"]["p50_ms"] * 10 + 1
+    (regression,) = bench_v10.compare_results(results, slower, 1.25)
+    assert regression.startswith("300 load_programs p50_ms")
+
+
+def test_metrics_time_each_stage_and_export_histograms(shipped_programs, monkeypatch):
+    client = app_v10.app.test_client()
+    assert client.get("/metrics").status_code == 404
+
+    monkeypatch.setattr(app_v10, "METRICS_ENABLED", True)
+    monkeypatch.setattr(app_v10, "metrics", app_v10.Metrics())
+    app_v10.recommendation_cache.clear()
+    snapshot = app_v10.get_snapshot()
+    with app_v10.app.test_request_context("/"):
+        app_v10.recommend_page({"interest_areas": ["Business"]}, snapshot)
+        response = app_v10._add_server_timing(app_v10.app.response_class("ok"))
+    timing = response.headers["Server-Timing"]
+    for stage in ("filter", "rank", "explain"):
+        assert f"{stage};dur=" in timing
+
+    body = client.get("/metrics").get_data(as_text=True)
+    assert "# TYPE course_finder_stage_seconds histogram" in body
+    assert 'course_finder_stage_seconds_count{stage="rank"} 1' in body
+    assert 'course_finder_stage_seconds_bucket{stage="rank",le="+Inf"} 1' in body
+    assert f"course_finder_dataset_programs {len(snapshot.programs)}" in body
+
+
+def test_keyword_search_matches_scan_and_scores_against_the_catalog(shipped_programs):
+    snapshot = app_v10.get_snapshot()
+    profile = {"q": "nursing online"}
+    eligible = app_v10.filter_programs_for_profile(profile, snapshot.programs, snapshot.index)
+    assert eligible
+    assert eligible == app_v10.filter_programs_for_profile(profile, snapshot.programs)
+
+    ranked = app_v10.rank_programs(profile, eligible, text=snapshot.index.text)
+    assert max(r.search_score_component for r in ranked) == app_v10.SEARCH_WEIGHT
+    assert all(0 <= r.fit_score <= 100 for r in ranked)
+
+    # A subset keeps its catalog-relative scores; ranked alone it is its own catalog
+    weaker = [r.program for r in ranked if r.search_score_component < app_v10.SEARCH_WEIGHT]
+    expected = {id(r.program): r.search_score_component for r in ranked}
+    again = app_v10.rank_programs(profile, weaker, text=snapshot.index.text)
+    assert all(r.search_score_component == expected[id(r.program)] for r in again)
+    alone = app_v10.rank_programs(profile, weaker)
+    assert max(r.search_score_component for r in alone) == app_v10.SEARCH_WEIGHT
+
+    terms = app_v10.query_tokens(profile)
+    assert app_v10.search_scores(terms, weaker).keys() == {id(p) for p in weaker}
+    assert app_v10.search_scores(terms, []) == {}
+
+
+@requires_numpy
+def test_similar_programs_bounds_k_and_excludes_the_program(shipped_programs):
+    client = app_v10.app.test_client()
+    program_id = app_v10.get_snapshot().programs[0].program_id
+    url = f"/api/programs/{program_id}/similar"
+
+    def _similar(query=""):
+        response = client.get(url + query)
+        assert response.status_code == 200
+        return response.get_json()["similar"]
+
+    default = _similar()
+    assert len(default) == app_v10.SIMILAR_DEFAULT_K
+    assert program_id not in {row["program_id"] for row in default}
+    scores = [row["similarity"] for row in default]
+    assert scores == sorted(scores, reverse=True)
+
+    assert len(_similar("?k=1000")) == app_v10.SIMILAR_MAX_K
+    assert _similar("?k=3") == default[:3]
+    assert _similar("?k=0") == _similar("?k=-4") == []
+    assert len(_similar("?k=abc")) == app_v10.SIMILAR_DEFAULT_K
+
+    assert client.get("/api/programs/no-such-program/similar").status_code == 404
+
+
+@requires_numpy
+def test_similar_programs_on_a_tiny_catalog(shipped_programs):
+    similarity = app_v10.SimilarityIndex(shipped_programs[:3])
+    neighbors = similarity.neighbors(shipped_programs[0].program_id, app_v10.SIMILAR_MAX_K)
+    assert {p.program_id for p, _ in neighbors} == {p.program_id for p in shipped_programs[1:3]}
+    assert app_v10.SimilarityIndex(shipped_programs[:1]).neighbors(shipped_programs[0].program_id, 5) == []
+
+
+def test_similar_programs_unavailable_without_similarity_index(shipped_programs, monkeypatch):
+    snapshot = app_v10.get_snapshot()
+    monkeypatch.setattr(app_v10, "get_snapshot", lambda: dataclasses.replace(snapshot, similarity=None))
+    response = app_v10.app.test_client().get(f"/api/programs/{snapshot.programs[0].program_id}/similar")
+    assert response.status_code == 503
+
+
+def test_facet_counts_from_index_match_the_scan(shipped_programs):
+    index = app_v10.ProgramIndex(shipped_programs)
+    profiles = app_v10._sample_profiles(100, seed=3)
+    profiles += [dict(profile, q="business online") for profile in profiles[:20]]
+    for profile in profiles:
+        assert index.facets(profile) == app_v10.facet_counts(profile, shipped_programs)
+
+
+def test_facet_count_is_the_result_count_of_that_option(shipped_programs):
+    index = app_v10.ProgramIndex(shipped_programs)
+    profile = {"degree_levels": ["Associate"], "interest_areas": ["Business"], "max_tuition": 25000.0}
+    facets = app_v10.facet_counts(profile, shipped_programs, index)
+
+    for degree, count in facets["degree_level"].items():
+        assert count == len(index.filter(dict(profile, degree_levels=[degree])))
+    for area, count in facets["interest_areas"].items():
+        assert count == len(index.filter(dict(profile, interest_areas=[area])))
+    assert list(facets["tuition"]) == list(app_v10.TUITION_BUCKETS)
+    assert sum(facets["tuition"].values()) == len(index.filter(dict(profile, max_tuition=None)))
+
+
+def test_facets_reach_the_api_and_the_sidebar(shipped_programs):
+    client = app_v10.app.test_client()
+    body = {"interest_areas": ["Engineering"], "degree_levels": ["Bachelor's"]}
+    facets = client.post("/api/recommendations", json=body).get_json()["facets"]
+    assert set(facets) == set(app_v10.FACET_DIMENSIONS)
+
+    page = client.post("/", data={"interest_areas": "Engineering", "degree_levels": "Bachelor's"})
+    html = page.get_data(as_text=True)
+    for dimension in ("interest_areas", "state", "tuition"):
+        assert f'data-facet="{dimension}"' in html
+    count = facets["degree_level"]["Bachelor's"]
+    assert f'data-count="{count}"' in html
+
+
+def test_location_pref_is_normalized_when_the_profile_is_built():
+    def _built(location_pref):
+        return app_v10.build_profile_from_json({"home_state": "IL", "location_pref": location_pref})
+
+    assert _built("Nearby")["location_pref"] == "nearby"
+    assert _built(" InState ")["location_pref"] == "instate"
+    legacy = _built("out_of_state_ok")
+    assert legacy["location_pref"] == "anywhere"
+    assert app_v10.summarize_constraints(legacy) == app_v10.summarize_constraints(_built("anywhere"))
+
+
+def test_mixed_case_location_pref_still_explains_distance(shipped_programs):
+    program = next(p for p in shipped_programs if p.state and p.state != "IL")
+    profile = {"home_state": "IL", "location_pref": "Neighbors"}
+    assert app_v10.Explainer(profile).describe_distance
+    assert app_v10.Explainer(dict(profile, location_pref="neighbors")).practical(program) == (
+        app_v10.Explainer(profile).practical(program)
+    )
+
+
+def test_preload_dataset_loads_once_and_refreshes_on_reload(tmp_path, monkeypatch):
+    with open(app_v10.DATA_PATH, encoding="utf-8") as f:
+        raw = json.load(f)
+    path = tmp_path / "programs.json"
+    path.write_text(json.dumps(raw[:30]), encoding="utf-8")
+    monkeypatch.setattr(app_v10, "DATA_PATH", str(path))
+    monkeypatch.setattr(app_v10, "_snapshot", None)
+    monkeypatch.setattr(app_v10, "_checked_mtime", None)
+
+    try:
+        first = app_v10.preload_dataset()
+        assert gc.get_freeze_count() > 0
+        assert len(first.programs) == 30
+        assert app_v10.preload_dataset() is first
+
+        path.write_text(json.dumps(raw[:40]), encoding="utf-8")
+        os.utime(path, (first.source_mtime + 10, first.source_mtime + 10))
+        second = app_v10.preload_dataset()
+        assert (second.version, len(second.programs)) == (first.version + 1, 40)
+    finally:
+        gc.unfreeze()
+
+
+def test_static_serves_only_the_allow_listed_assets():
+    client = app_v10.app.test_client()
+    for path in ("/static/app_v10.py", "/static/programs_v7.json", "/static/../app_v10.py", "/static/nope.css"):
+        assert client.get(path).status_code == 404
+    plain = client.get("/static/main_v10.js")
+    assert plain.status_code == 200
+    assert plain.headers["Cache-Control"] == "no-cache"
+
+
+def test_fingerprinted_assets_are_immutable_and_precompressed():
+    client = app_v10.app.test_client()
+    html = client.get("/").get_data(as_text=True)
+    for name, asset in app_v10.static_assets().items():
+        url = f"/static/{asset.hashed_name}"
+        assert url in html
+
+        identity = client.get(url, headers={"Accept-Encoding": "identity"})
+        assert identity.headers["Cache-Control"] == app_v10.STATIC_CACHE_CONTROL
+        assert "Content-Encoding" not in identity.headers
+        with open(os.path.join(app_v10.BASE_DIR, name), "rb") as f:
+            assert identity.data == f.read()
+
+        gzipped = client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert gzipped.headers["Content-Encoding"] == "gzip"
+        assert gzipped.headers["Vary"] == "Accept-Encoding"
+        assert app_v10.gzip.decompress(gzipped.data) == identity.data
+
+        etag = gzipped.headers["ETag"]
+        again = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        assert again.status_code == 304
+
+
+def test_refine_matches_a_full_rerank(shipped_programs):
+    catalog = app_v10.build_synthetic_catalog(shipped_programs, 3000, seed=5)
+    snapshot = app_v10.ProgramSnapshot.build(app_v10.normalize_programs(catalog), 0)
+    rng = app_v10.random.Random(4)
+    profiles = app_v10._sample_profiles(15, seed=4)
+    profiles.append(dict(profiles[0], q="business online"))
+
+    incremental = 0
+    for profile in profiles:
+        state = app_v10.ResultState.compute(profile, snapshot)
+        for refined_profile in app_v10._refinements(profile, rng):
+            refined, was_incremental = app_v10.refine_results(state, refined_profile, snapshot)
+            incremental += was_incremental
+            recomputed = app_v10.ResultState.compute(refined_profile, snapshot)
+            assert list(refined.entries()) == list(recomputed.entries())
+
+            eligible = app_v10.filter_programs_for_profile(refined_profile, snapshot.programs, snapshot.index)
+            expected = app_v10.rank_programs(
+                refined_profile, eligible, limit=40, columns=snapshot.columns, text=snapshot.index.text
+            )
+            assert [r.to_dict() for r in refined.rank(snapshot, 40)] == [r.to_dict() for r in expected]
+    assert incremental
+
+
+def test_result_handles_stay_within_the_byte_budget():
+    def _state(size):
+        return app_v10.ResultState(0, {}, range(size), [0.0] * size, [0.0] * size, [0.0] * size)
+
+    nbytes = _state(100).nbytes
+    store = app_v10.ResultHandleStore(2 * nbytes, ttl=60.0)
+    first, second = store.put(_state(100)), store.put(_state(100))
+    assert store.used_bytes == 2 * nbytes
+    third = store.put(_state(100))
+    assert store.get(first) is None
+    assert store.get(second) is not None and store.get(third) is not None
+    assert store.used_bytes == 2 * nbytes
+
+    assert store.put(_state(300)) is None
+    assert store.used_bytes == 2 * nbytes
+
+    expiring = app_v10.ResultHandleStore(2 * nbytes, ttl=0.0)
+    assert expiring.get(expiring.put(_state(100))) is None
+    assert expiring.used_bytes == 0
+
+
+def test_api_refine_equals_a_fresh_request(shipped_programs):
+    client = app_v10.app.test_client()
+    body = {"interest_areas": ["Business"], "max_tuition": 15000, "limit": 10}
+    first = client.post("/api/recommendations", json=dict(body, handle=True)).get_json()
+    assert first["handle"]
+
+    refined = client.post(
+        f"/api/recommendations/{first['handle']}/refine",
+        json={"max_tuition": 30000, "interest_areas": ["Business", "Engineering"], "limit": 10},
+    ).get_json()
+    assert refined["refinement"] == "incremental"
+    fresh = client.post(
+        "/api/recommendations",
+        json=dict(body, max_tuition=30000, interest_areas=["Business", "Engineering"]),
+    ).get_json()
+    assert (refined["total"], refined["recommendations"]) == (fresh["total"], fresh["recommendations"])
+
+    assert client.post("/api/recommendations/nope/refine", json={}).status_code == 404
+
+
+EXPERIMENT = {
+    "name": "test-arms",
+    "arms": {
+        "control": {},
+        "interest_heavy": {"interest": 90, "degree": 5, "location": 5},
+        "never": {"location": 80, "share": 0},
+    },
+}
+
+
+@pytest.fixture
+def experiment(tmp_path, monkeypatch):
+    path = tmp_path / "experiment.json"
+    path.write_text(json.dumps(EXPERIMENT), encoding="utf-8")
+    monkeypatch.setattr(app_v10, "EXPERIMENT_PATH", str(path))
+    monkeypatch.setattr(app_v10, "_experiment", None)
+    monkeypatch.setattr(app_v10, "_experiment_mtime", None)
+    return app_v10.current_experiment()
+
+
+def test_experiment_file_is_validated_and_assigns_sessions_stably():
+    parsed = app_v10.Experiment.from_dict(EXPERIMENT)
+    assert parsed.arms["control"] == app_v10.DEFAULT_WEIGHTS
+    assigned = {parsed.assign(f"session-{i}") for i in range(200)}
+    assert assigned == {"control", "interest_heavy"}
+    assert parsed.assign("session-1") == parsed.assign("session-1")
+
+    for bad in ({"arms": {}}, {"arms": {"a": {"interest": -1}}}, {"arms": {"a": {"share": 0}}}):
+        with pytest.raises(ValueError):
+            app_v10.Experiment.from_dict(bad)
+
+
+def test_recommend_page_ranks_and_caches_every_arm(shipped_programs, experiment):
+    snapshot = app_v10.get_snapshot()
+    app_v10.recommendation_cache.clear()
+    profile = {"interest_areas": ["Business", "Engineering"], "degree_levels": ["Associate"]}
+    eligible = app_v10.filter_programs_for_profile(profile, snapshot.programs, snapshot.index)
+
+    page, total = app_v10.recommend_page(profile, snapshot, experiment=experiment, arm="interest_heavy")
+    assert total == len(eligible)
+    expected = app_v10.rank_programs(
+        profile, eligible, app_v10.RECOMMENDATIONS_PAGE_SIZE, 0, experiment.arms["interest_heavy"]
+    )
+    assert [r.to_dict() for r in page] == [r.to_dict() for r in expected]
+
+    hits = app_v10.recommendation_cache.hits
+    control, _ = app_v10.recommend_page(profile, snapshot, experiment=experiment, arm="control")
+    assert app_v10.recommendation_cache.hits == hits + 1
+    assert [r.to_dict() for r in control] == [r.to_dict() for r in app_v10.recommend_page(profile, snapshot)[0]]
+
+
+def test_result_handles_keep_the_experiment_arm(shipped_programs, experiment):
+    client = app_v10.app.test_client()
+    session_id = next(f"s{i}" for i in range(100) if experiment.assign(f"s{i}") == "interest_heavy")
+    body = {"interest_areas": ["Business"], "location_pref": "anywhere", "home_state": "IL", "session_id": session_id}
+
+    plain = client.post("/api/recommendations", json=body).get_json()
+    handled = client.post("/api/recommendations", json=dict(body, handle=True)).get_json()
+    tag = {"name": "test-arms", "arm": "interest_heavy"}
+    assert plain["experiment"] == handled["experiment"] == tag
+    assert handled["recommendations"] == plain["recommendations"]
+
+    refined = client.post(
+        f"/api/recommendations/{handled['handle']}/refine", json={"max_tuition": 20000}
+    ).get_json()
+    fresh = client.post("/api/recommendations", json=dict(body, max_tuition=20000)).get_json()
+    assert refined["experiment"] == tag
+    assert refined["recommendations"] == fresh["recommendations"]
+
+
+def test_evaluate_weights_reports_every_arm(tmp_path, capsys):
+    experiment_path = tmp_path / "experiment.json"
+    experiment_path.write_text(json.dumps(EXPERIMENT), encoding="utf-8")
+    profiles_path = tmp_path / "profiles.jsonl"
+    lines = [json.dumps(p) for p in app_v10._sample_profiles(20, seed=6)] + ["not json", ""]
+    profiles_path.write_text("\n".join(lines), encoding="utf-8")
+    out_path = tmp_path / "report.json"
+
+    assert app_v10.evaluate_weights(str(experiment_path), str(profiles_path), k=5, out_path=str(out_path)) == 0
+    report = json.loads(out_path.read_text(encoding="utf-8"))
+    assert report["baseline"] == "control" and report["skipped_lines"] == 1
+    assert set(report["arms"]) == set(EXPERIMENT["arms"])
+    assert report["arms"]["control"]["overlap_at_k"] in (None, 1.0)
+    assert report["arms"]["control"]["changed"] in (None, 0.0)
+
+
+def test_anonymize_profile_keeps_only_form_values(shipped_programs):
+    app_v10.get_snapshot()
+    record = app_v10.anonymize_profile(
+        {
+            "role": "student",
+            "current_status": "Jane Doe, 12 Main St",
+            "home_state": "ZZ",
+            "gpa": 3.47,
+            "degree_levels": ["Bachelor's", "<script>"],
+            "interest_areas": ["Business", "secret"],
+            "max_tuition": 18740.0,
+            "sat_score": 1450,
+            "location_pref": "Nearby",
+            "max_distance": 137.0,
+            "q": "business jane.doe@example.com",
+        }
+    )
+    assert (record["role"], record["current_status"], record["home_state"]) == ("student", "", "")
+    assert (record["gpa"], record["max_tuition"], record["max_distance"]) == (3.5, 18500.0, 140.0)
+    assert (record["degree_levels"], record["interest_areas"]) == (["Bachelor's"], ["Business"])
+    assert record["sat_score"] is None and record["location_pref"] == "nearby"
+    assert record["q"] == "business"
+
+
+def test_captured_traffic_replays(tmp_path, shipped_programs):
+    import replay_v10
+
+    path = tmp_path / "capture.jsonl"
+    writer = app_v10.CaptureWriter(str(path), flush_interval=0.01)
+    writer.submit("/", {"interest_areas": ["Business"], "degree_levels": ["Associate"]})
+    writer.submit("/api/recommendations", {"interest_areas": ["Engineering"]}, offset=0, limit=5)
+    writer.close()
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert [r["endpoint"] for r in records] == ["/", "/api/recommendations"]
+    assert (writer.written, writer.dropped) == (2, 0)
+
+    report = replay_v10.replay(replay_v10.read_events(str(path)), replay_v10.TestClientTarget(), speed=0)
+    assert (report["requests"], report["errors"]) == (2, 0)
+    assert set(report["latency_by_endpoint"]) == {"/", "/api/recommendations"}
+
+
+def test_program_details_match_the_card_and_revalidate(shipped_programs):
+    client = app_v10.app.test_client()
+    form = {"interest_areas": ["Business", "Engineering"], "degree_levels": "Bachelor's", "home_state": "IL"}
+    assert client.post("/", data=form).status_code == 200
+    with client.session_transaction() as session:
+        profile = session["v10_profile"]
+    fingerprint = app_v10.profile_fingerprint(profile)
+
+    snapshot = app_v10.get_snapshot()
+    eligible = app_v10.filter_programs_for_profile(profile, snapshot.programs, snapshot.index)
+    rec = app_v10.build_explanations(profile, app_v10.rank_programs(profile, eligible, 1))[0]
+    url = f"/api/programs/{rec.program_id}/details?profile={fingerprint}"
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"].startswith("private")
+    details = response.get_json()
+    assert details["program"] == rec.program.to_dict()
+    for field in ("interest_score_component", "degree_score_component", "why_interests", "why_practical"):
+        assert details[field] == getattr(rec, field)
+
+    cached = client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+    assert cached.status_code == 304
+    assert client.get(f"/api/programs/{rec.program_id}/details?profile=stale").status_code == 404
+    assert client.get(f"/api/programs/no-such-program/details?profile={fingerprint}").status_code == 404
+
+
+def test_request_profile_records_stages_and_is_served_with_the_token(tmp_path, monkeypatch):
+    with app_v10.app.test_request_context("/"):
+        current = app_v10.RequestProfile("cprofile")
+        current.mark("filter")
+        current.status = 200
+        current.finish(str(tmp_path))
+    (meta,) = app_v10.list_profiles(str(tmp_path))
+    assert meta["id"] == current.profile_id
+    assert [stage["stage"] for stage in meta["stages"]] == ["filter", "render"]
+    assert all(stage["peak_alloc_bytes"] >= 0 for stage in meta["stages"])
+
+    client = app_v10.app.test_client()
+    headers = {app_v10.PROFILE_HEADER: "secret"}
+    assert client.get("/debug/profiles", headers=headers).status_code == 404
+    monkeypatch.setattr(app_v10, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(app_v10, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(app_v10, "PROFILE_TOKEN", "secret")
+    assert client.get("/debug/profiles").status_code == 403
+    index = client.get("/debug/profiles", headers=headers).get_json()
+    assert [p["id"] for p in index["profiles"]] == [current.profile_id]
+    data = client.get(index["profiles"][0]["url"], headers=headers)
+    assert data.status_code == 200 and data.data
+    assert client.get("/debug/profiles/../app_v10", headers=headers).status_code == 404
+
+
+@pytest.fixture
+def dataset_copy(tmp_path):
+    with open(app_v10.DATA_PATH, encoding="utf-8") as f:
+        raw = json.load(f)
+    path = tmp_path / "programs.json"
+    path.write_text(json.dumps(raw), encoding="utf-8")
+    return path, raw
+
+
+def _records(programs):
+    return [p.to_dict() for p in programs]
+
+
+def test_compiled_dataset_round_trips(dataset_copy):
+    path, raw = dataset_copy
+    compiled = app_v10.compile_dataset(str(path))
+    assert compiled == app_v10.compiled_path_for(str(path))
+
+    expected = _records(app_v10.normalize_programs(raw))
+    assert _records(app_v10.read_compiled_dataset(compiled)) == expected
+    programs, _, _ = app_v10._read_dataset(str(path))
+    assert _records(programs) == expected
+
+
+def test_stale_or_corrupt_compiled_dataset_falls_back_to_json(dataset_copy):
+    path, raw = dataset_copy
+    compiled = app_v10.compile_dataset(str(path))
+
+    path.write_text(json.dumps(raw[:10]), encoding="utf-8")
+    digest = app_v10.hashlib.sha256(path.read_bytes()).hexdigest()
+    with pytest.raises(app_v10.DatasetError):
+        app_v10.read_compiled_dataset(compiled, expected_hash=digest)
+    programs, _, _ = app_v10._read_dataset(str(path))
+    assert _records(programs) == _records(app_v10.normalize_programs(raw[:10]))
+
+    with open(compiled, "wb") as f:
+        f.write(b"not a compiled dataset")
+    programs, _, _ = app_v10._read_dataset(str(path))
+    assert len(programs) == 10